@@ -0,0 +1,235 @@
+"""
+Export the logo and layout classifiers for CPU inference
+
+Converts the Keras models written by train_heads.py into:
+    onnx        - float ONNX (tf2onnx)
+    onnx-int8   - static int8 ONNX (QDQ, per-channel weights, onnxruntime)
+    tflite-int8 - full-integer TFLite with uint8 input and output
+The bundled images are split as train_heads.py splits them (split_by_file,
+same --validation-split and --seed). The int8 variants are calibrated on a
+set drawn from the training split (stratified across classes, with the
+training augmentations), saved next to the models as
+<model>.calibration.npy so exports are reproducible.
+
+Every variant is then run through the backend's loader
+(ai_backend/services/model_runtime.py) on the validation split, which
+neither training nor calibration has seen. The report covers accuracy,
+agreement with the Keras model, size and batch-1 latency. It is printed and
+saved to export_report.json.
+
+For the logo model the backbone alone (pooled features) is exported too, as
+<stem>.embedding.*, for the institution index (manage.py enroll-institution).
+
+    python export_models.py                                 # both models, all variants
+    python export_models.py layout --variants onnx-int8 --calibration-size 32
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from train_heads import HERE, MODELS, list_images, load_image, split_by_file
+
+sys.path.insert(0, os.path.join(HERE, '..', 'ai_backend'))
+from services.model_runtime import load_model, model_path, model_stem  # noqa: E402
+
+EXPORT_VARIANTS = ('onnx', 'onnx-int8', 'tflite-int8')
+# Models whose backbone is also served as an embedder
+EMBEDDING_MODELS = ('logo',)
+
+
+def to_uint8(array):
+    return np.round(array * 255.0).astype(np.uint8)
+
+
+def split_images(model, validation_split, seed):
+    """
+    The bundled images split by file as train_heads.py splits them
+    Returns: (training entries, validation entries, class names)
+    """
+    entries, classes = list_images(MODELS[model]['data_dir'])
+    rows = [{'file': path, 'class': name, 'copy': 0} for path, name in entries]
+    train, validation = split_by_file(rows, classes, validation_split, seed)
+    return [entries[i] for i in train], [entries[i] for i in validation], classes
+
+
+def calibration_set(model, entries, classes, size, seed):
+    """
+    size images drawn round-robin across classes from entries, each an
+    augmented copy when the model trains with augmentation
+    Returns: uint8 array (size, H, W, 3)
+    """
+    config = MODELS[model]
+    rng = np.random.default_rng(seed)
+    by_class = [rng.permutation([path for path, name in entries if name == class_name]).tolist()
+                for class_name in classes]
+
+    samples = []
+    round_index = 0
+    while len(samples) < size:
+        for files in by_class:
+            if files and len(samples) < size:
+                path = files[round_index % len(files)]
+                augment = config['augment'] if (config['augment'] and round_index >= len(files)) else None
+                samples.append(to_uint8(load_image(os.path.join(config['data_dir'], path), config['image_size'],
+                                                   augment, seed=seed + len(samples))))
+        round_index += 1
+    return np.stack(samples)
+
+
+def evaluation_set(model, entries, classes):
+    """The entries' images, unaugmented, with their class indices"""
+    config = MODELS[model]
+    images = np.stack([to_uint8(load_image(os.path.join(config['data_dir'], path), config['image_size']))
+                       for path, _ in entries])
+    return images, np.array([classes.index(name) for _, name in entries])
+
+
+def export_onnx(keras_model, float_path, int8_path, calibration):
+    import tensorflow as tf
+    import tf2onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    height, width = keras_model.input_shape[1:3]
+    spec = (tf.TensorSpec((None, height, width, 3), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=spec, opset=13, output_path=float_path)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.samples = iter(calibration)
+
+        def get_next(self):
+            sample = next(self.samples, None)
+            return None if sample is None else {'input': sample[None].astype(np.float32) / 255.0}
+
+    quantize_static(float_path, int8_path, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+
+
+def export_tflite_int8(keras_model, path, calibration):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = lambda: ([sample[None].astype(np.float32) / 255.0] for sample in calibration)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # Pixels arrive as uint8 and the model's input range is [0, 1], so the
+    # input quantization is exactly the training rescale of 1/255
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.uint8
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+
+def evaluate(classifier, images, labels, reference, runs):
+    """Accuracy, agreement with the reference probabilities and batch-1 latency"""
+    probabilities = np.concatenate([classifier.predict_batch(images[i:i + 1]) for i in range(len(images))])
+    if probabilities.shape[1] == 1:
+        # Single-class layout model: share of bundled (authentic) layouts accepted
+        accuracy = float(np.mean(probabilities[:, 0] >= 0.5))
+        agreement = float(np.mean((probabilities[:, 0] >= 0.5) == (reference[:, 0] >= 0.5)))
+    else:
+        accuracy = float(np.mean(probabilities.argmax(axis=1) == labels))
+        agreement = float(np.mean(probabilities.argmax(axis=1) == reference.argmax(axis=1)))
+
+    timings = []
+    for run in range(runs + 2):
+        sample = images[run % len(images)][None]
+        start = time.perf_counter()
+        classifier.predict_batch(sample)
+        if run >= 2:  # warm-up
+            timings.append(time.perf_counter() - start)
+
+    return {
+        'accuracy': round(accuracy, 4),
+        'agreement': round(agreement, 4),
+        'max_probability_diff': round(float(np.abs(probabilities - reference).max()), 4),
+        'latency_ms': round(float(np.median(timings)) * 1000, 2),
+        'size_mb': round(os.path.getsize(classifier.path) / 1e6, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export quantized logo/layout classifiers and report accuracy vs latency')
+    parser.add_argument('models', nargs='*', help='logo, layout (default: both)')
+    parser.add_argument('--variants', default=','.join(EXPORT_VARIANTS), help='Variants to export')
+    parser.add_argument('--model-dir', default=HERE, help='Folder with the .h5 models; exports are written here too')
+    parser.add_argument('--calibration-size', type=int, default=64)
+    parser.add_argument('--runs', type=int, default=30, help='Timed batch-1 runs per variant')
+    parser.add_argument('--threads', type=int, default=0, help='Intra-op threads (default: runtime choice)')
+    parser.add_argument('--validation-split', type=float, default=0.2,
+                        help='As passed to train_heads.py; accuracy is measured on this split')
+    parser.add_argument('--seed', type=int, default=0, help='As passed to train_heads.py')
+    args = parser.parse_args(argv)
+
+    models = args.models or list(MODELS)
+    unknown = set(models) - set(MODELS)
+    variants = args.variants.split(',')
+    if unknown or set(variants) - set(EXPORT_VARIANTS):
+        parser.error('unknown model or variant')
+
+    import tensorflow as tf
+
+    report_path = os.path.join(args.model_dir, 'export_report.json')
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+
+    for model in models:
+        keras_path = model_path(args.model_dir, model, 'keras')
+        if not os.path.exists(keras_path):
+            print(f'{model}: {keras_path} not found; run train_heads.py first')
+            continue
+        keras_model = tf.keras.models.load_model(keras_path, compile=False)
+
+        training, validation, classes = split_images(model, args.validation_split, args.seed)
+        if not validation:
+            print(f'{model}: no validation images at --validation-split {args.validation_split}; skipped')
+            continue
+        calibration = calibration_set(model, training, classes, args.calibration_size, args.seed)
+        np.save(os.path.join(args.model_dir, model_stem(model) + '.calibration.npy'), calibration)
+
+        start = time.perf_counter()
+        graphs = [(keras_model, False)]
+        if model in EMBEDDING_MODELS:
+            # Pooled backbone features: the input of the final (head) layer
+            graphs.append((tf.keras.Model(keras_model.input, keras_model.layers[-1].input), True))
+        for graph, embedding in graphs:
+            if 'onnx' in variants or 'onnx-int8' in variants:
+                export_onnx(graph, model_path(args.model_dir, model, 'onnx', embedding),
+                            model_path(args.model_dir, model, 'onnx-int8', embedding), calibration)
+            if 'tflite-int8' in variants:
+                export_tflite_int8(graph, model_path(args.model_dir, model, 'tflite-int8', embedding), calibration)
+        print(f'{model}: exported {", ".join(variants)} in {time.perf_counter() - start:.1f}s '
+              f'({len(calibration)} calibration images)')
+
+        images, labels = evaluation_set(model, validation, classes)
+        threads = args.threads or None
+        keras_classifier = load_model(model, 'keras', args.model_dir, threads)
+        reference = np.concatenate([keras_classifier.predict_batch(images[i:i + 1]) for i in range(len(images))])
+
+        rows = {}
+        for variant in ('keras', *variants):
+            classifier = keras_classifier if variant == 'keras' else load_model(model, variant, args.model_dir, threads)
+            rows[variant] = evaluate(classifier, images, labels, reference, args.runs)
+        for variant, row in rows.items():
+            row['speedup'] = round(rows['keras']['latency_ms'] / row['latency_ms'], 2)
+        report[model] = {'validation_images': len(images), 'calibration_images': len(calibration), 'variants': rows}
+
+        print(f"\n{model} ({len(images)} validation images)")
+        print(f"{'variant':<12} {'accuracy':>9} {'agreement':>10} {'max diff':>9} {'ms':>8} {'speedup':>8} {'MB':>7}")
+        for variant, row in rows.items():
+            print(f"{variant:<12} {row['accuracy']:>9.1%} {row['agreement']:>10.1%} {row['max_probability_diff']:>9.3f} "
+                  f"{row['latency_ms']:>8.1f} {row['speedup']:>7.1f}x {row['size_mb']:>7.1f}")
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nReport written to {report_path}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
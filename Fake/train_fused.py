@@ -0,0 +1,367 @@
+"""
+Train the fused logo / layout / signature model
+
+Serving logo_authenticity_model.h5 and layout_authenticity_model.h5 runs two
+backbones (MobileNetV2 at 224x224, VGG16 at 300x450) on two resized copies
+of every page. The fused model runs one MobileNetV2 pass over the page at
+224x336 and feeds three heads from its pooled features:
+    logo      - institution (the classes of images/logo_data)
+    layout    - probability the layout is authentic
+    signature - probability the page carries a handwritten signature
+
+Training pages are built from the existing folders (images/layout_data and
+images/logo_data), each labelled only for the heads it says something about:
+    page      - an authentic page as is: layout 1, signature and logo from
+                the backend's region detector and seal matcher (logo only
+                while the matcher passes its self-check)
+    logo      - a page with a reference logo pasted over its own (or in the
+                header): that logo's institution
+    tampered  - a page with bands swapped, a block pasted from another page,
+                a region erased or its width squeezed: layout 0
+    unsigned  - a signed page with its signature regions painted out:
+                signature 0
+As in train_heads.py the backbone is frozen: its features are computed once
+per sample, cached (feature_cache/fused) and only the heads are trained.
+
+    python train_fused.py run                       # extract (if needed) and train
+    python train_fused.py train --epochs 50
+    python train_fused.py export --variants onnx-int8,tflite-int8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+from PIL import Image
+import numpy as np
+
+from train_heads import HERE, MODELS, FeatureCache, build_backbone, list_images, split_by_file
+
+sys.path.insert(0, os.path.join(HERE, '..', 'ai_backend'))
+from services.seal_matcher import SealMatcher  # noqa: E402
+from services.signature_matcher import find_signature_candidates  # noqa: E402
+
+FUSED = {
+    'backbone': 'mobilenetv2',
+    'image_size': (224, 336),
+    'head_units': 256,
+    'output': 'fused_authenticity_model.h5',
+}
+HEADS = ('logo', 'layout', 'signature')
+KINDS = ('page', 'logo', 'tampered', 'unsigned')
+# Regions the detector rates at least this likely count as signatures
+SIGNATURE_LIKELIHOOD = 0.5
+
+
+def teacher_labels(layout_dir, pages, logo_classes):
+    """
+    Per layout page: its signature boxes and logo (institution index and
+    box) according to the backend's detectors. Logos stay unlabelled (-1)
+    unless every reference logo matches its own institution.
+    """
+    matcher = SealMatcher(MODELS['logo']['data_dir'])
+    if matcher.ready:
+        failures = matcher.self_check()
+        if failures:
+            print(f'⚠️  Seal matcher fails its self-check on {len(failures)} pastes (manage.py check-seals); '
+                  f'page logos left unlabelled')
+            matcher = None
+    labels = {}
+    for page in pages:
+        image = Image.open(os.path.join(layout_dir, page)).convert('RGB')
+        signatures = [c['bbox'] for c in find_signature_candidates(image)
+                      if c['likelihood'] >= SIGNATURE_LIKELIHOOD]
+        seal = matcher.match(image) if matcher is not None and matcher.ready else None
+        logo = -1
+        if seal and seal['institution'] in logo_classes:
+            logo = logo_classes.index(seal['institution'])
+        labels[page] = {'signatures': signatures, 'logo': logo, 'logo_bbox': seal['bbox'] if logo >= 0 else None}
+    return labels
+
+
+def list_samples(copies, seed):
+    """Sample rows (kind, file, base page, copy) with their head labels (-1: not labelled)"""
+    layout_dir = MODELS['layout']['data_dir']
+    pages = [path for path, _ in list_images(layout_dir)[0]]
+    logos, logo_classes = list_images(MODELS['logo']['data_dir'])
+    teachers = teacher_labels(layout_dir, pages, logo_classes)
+    rng = np.random.default_rng(seed)
+
+    rows = []
+
+    def add(kind, file, base, copy, logo=-1, layout=-1, signature=-1):
+        rows.append({'kind': kind, 'file': file, 'base': base, 'copy': copy,
+                     'labels': {'logo': logo, 'layout': layout, 'signature': signature}})
+
+    for page in pages:
+        teacher = teachers[page]
+        signed = int(bool(teacher['signatures']))
+        add('page', page, page, 0, logo=teacher['logo'], layout=1, signature=signed)
+        for copy in range(copies):
+            add('tampered', page, page, copy, layout=0)
+        if signed:
+            add('unsigned', page, page, 0, logo=teacher['logo'], signature=0)
+    for path, class_name in logos:
+        for copy in range(copies):
+            add('logo', path, pages[rng.integers(len(pages))], copy, logo=logo_classes.index(class_name))
+    return rows, logo_classes, teachers
+
+
+def _background(page):
+    """Paper colour: the median of the page border"""
+    a = np.asarray(page)
+    border = np.concatenate([a[:8].reshape(-1, 3), a[-8:].reshape(-1, 3)])
+    return tuple(int(v) for v in np.median(border, axis=0))
+
+
+def _tamper(page, rng, pages):
+    width, height = page.size
+    operation = rng.choice(('swap', 'paste', 'erase', 'squeeze'))
+    if operation == 'swap':
+        band = int(height * rng.uniform(0.1, 0.25))
+        top_a, top_b = sorted(rng.choice(max(1, height - band), 2, replace=False))
+        a = page.crop((0, top_a, width, top_a + band))
+        b = page.crop((0, top_b, width, top_b + band))
+        page.paste(b, (0, top_a))
+        page.paste(a, (0, top_b))
+    elif operation == 'paste':
+        other = Image.open(os.path.join(MODELS['layout']['data_dir'], pages[rng.integers(len(pages))])).convert('RGB')
+        other = other.resize(page.size)
+        w, h = int(width * rng.uniform(0.2, 0.4)), int(height * rng.uniform(0.2, 0.4))
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        page.paste(other.crop((x, y, x + w, y + h)), (int(rng.integers(0, width - w)), int(rng.integers(0, height - h))))
+    elif operation == 'erase':
+        w, h = int(width * rng.uniform(0.2, 0.4)), int(height * rng.uniform(0.15, 0.3))
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        page.paste(_background(page), (x, y, x + w, y + h))
+    else:
+        squeezed = page.resize((int(width * rng.uniform(0.6, 0.8)), height), Image.BILINEAR)
+        page = Image.new('RGB', page.size, _background(page))
+        page.paste(squeezed, ((width - squeezed.width) // 2, 0))
+    return page
+
+
+def _paste_logo(page, logo_path, rng, teacher):
+    """Paste a reference logo over the page's own logo, or into its header"""
+    logo = Image.open(logo_path).convert('RGBA')
+    width, height = page.size
+    if teacher['logo_bbox']:
+        x, y, w, h = teacher['logo_bbox']
+        page.paste(_background(page), (x, y, x + w, y + h))
+        scale = min(w / logo.width, h / logo.height)
+    else:
+        scale = width * rng.uniform(0.08, 0.18) / logo.width
+        x, y = int(rng.uniform(0.05, 0.8) * width), int(rng.uniform(0.02, 0.2) * height)
+    logo = logo.resize((max(1, round(logo.width * scale)), max(1, round(logo.height * scale))), Image.BILINEAR)
+    page.paste(logo, (int(x), int(y)), logo)
+    return page
+
+
+def render_sample(row, teachers, pages):
+    """The row's training page as an RGB image"""
+    layout_dir = MODELS['layout']['data_dir']
+    page = Image.open(os.path.join(layout_dir, row['base'])).convert('RGB')
+    rng = np.random.default_rng(zlib.crc32(f"{row['kind']}:{row['file']}:{row['base']}".encode()) * 100 + row['copy'])
+    if row['kind'] == 'tampered':
+        page = _tamper(page, rng, pages)
+    elif row['kind'] == 'unsigned':
+        for x, y, w, h in teachers[row['base']]['signatures']:
+            page.paste(_background(page), (x, y, x + w, y + h))
+    elif row['kind'] == 'logo':
+        page = _paste_logo(page, os.path.join(MODELS['logo']['data_dir'], row['file']), rng, teachers[row['base']])
+    return page
+
+
+def load_sample(row, teachers, pages):
+    """RGB array scaled to [0, 1] at the fused input size (nearest resize)"""
+    height, width = FUSED['image_size']
+    return np.asarray(render_sample(row, teachers, pages).resize((width, height), Image.NEAREST),
+                      dtype=np.float32) / 255.0
+
+
+def _source_key(row, teachers):
+    """
+    Cache key: the files a sample is built from, their modification and the
+    teacher boxes its rendering uses
+    """
+    files = [os.path.join(MODELS['layout']['data_dir'], row['base'])]
+    boxes = None
+    if row['kind'] == 'logo':
+        files.append(os.path.join(MODELS['logo']['data_dir'], row['file']))
+        boxes = teachers[row['base']]['logo_bbox']
+    elif row['kind'] == 'unsigned':
+        boxes = teachers[row['base']]['signatures']
+    stats = [(os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files]
+    return json.dumps([row['kind'], row['file'], row['base'], row['copy'], stats, boxes])
+
+
+def extract(args):
+    """Run the backbone over new or changed samples and refresh the cache"""
+    rows, logo_classes, teachers = list_samples(args.copies, args.seed)
+    pages = sorted({row['base'] for row in rows if row['kind'] == 'page'})
+    for row in rows:
+        row['key'] = _source_key(row, teachers)
+
+    settings = {'backbone': FUSED['backbone'], 'image_size': list(FUSED['image_size']), 'logo_classes': logo_classes}
+    cache = FeatureCache(args.cache_dir, 'fused')
+    cached = cache.load()
+    reuse = {}
+    if cached is not None and cached[0]['settings'] == settings:
+        old_manifest, old_features, _ = cached
+        reuse = {row['key']: old_features[i] for i, row in enumerate(old_manifest['rows'])}
+
+    missing = [i for i, row in enumerate(rows) if row['key'] not in reuse]
+    start = time.perf_counter()
+    new_features = {}
+    if missing:
+        backbone = build_backbone(FUSED['backbone'], FUSED['image_size'])
+        for batch_start in range(0, len(missing), args.batch_size):
+            batch = missing[batch_start:batch_start + args.batch_size]
+            images = np.stack([load_sample(rows[i], teachers, pages) for i in batch])
+            for i, vector in zip(batch, backbone.predict(images, verbose=0)):
+                new_features[i] = vector
+
+    dim = len(next(iter(new_features.values()))) if new_features else len(next(iter(reuse.values())))
+    features = np.empty((len(rows), dim), dtype=np.float32)
+    for i, row in enumerate(rows):
+        features[i] = new_features[i] if i in new_features else reuse[row['key']]
+    labels = np.array([[row['labels'][head] for head in HEADS] for row in rows], dtype=np.int32)
+
+    cache.save({'settings': settings, 'classes': logo_classes, 'rows': rows}, features, labels)
+    counts = {kind: sum(row['kind'] == kind for row in rows) for kind in KINDS}
+    print(f'fused: {len(rows)} samples {counts}, {len(missing)} extracted in '
+          f'{time.perf_counter() - start:.1f}s, {len(rows) - len(missing)} reused -> {cache.directory}')
+
+
+def split_by_page(rows, logo_classes, validation_split, seed):
+    """
+    Train/validation row indices. Every sample built on a validation page is
+    held out, and so is every sample with a validation logo pasted in (logo
+    files split per institution, as train_heads.py splits them).
+    """
+    rng = np.random.default_rng(seed)
+    pages = sorted({row['base'] for row in rows})
+    validation_pages = set(rng.permutation(pages)[:int(len(pages) * validation_split)].tolist())
+    logos = [{'file': row['file'], 'class': logo_classes[row['labels']['logo']], 'copy': 0}
+             for row in rows if row['kind'] == 'logo' and row['copy'] == 0]
+    _, held_out = split_by_file(logos, logo_classes, validation_split, seed)
+    validation_logos = {logos[i]['file'] for i in held_out}
+
+    def held(row):
+        return row['base'] in validation_pages or (row['kind'] == 'logo' and row['file'] in validation_logos)
+
+    train = [i for i, row in enumerate(rows) if not held(row)]
+    validation = [i for i, row in enumerate(rows) if held(row)]
+    return np.array(train), np.array(validation)
+
+
+def _targets(labels):
+    """Per-head targets and sample weights; unlabelled heads get weight 0"""
+    y = {head: np.maximum(labels[:, i], 0) for i, head in enumerate(HEADS)}
+    weights = {head: (labels[:, i] >= 0).astype(np.float32) for i, head in enumerate(HEADS)}
+    return y, weights
+
+
+def train(args):
+    """Fit the three heads on cached features and save heads and full model"""
+    import tensorflow as tf
+    from tensorflow.keras import layers, optimizers
+
+    cached = FeatureCache(args.cache_dir, 'fused').load()
+    if cached is None:
+        raise SystemExit('No cached features for the fused model; run "extract" first')
+    manifest, features, labels = cached
+    logo_classes, rows = manifest['classes'], manifest['rows']
+
+    train_rows, validation_rows = split_by_page(rows, logo_classes, args.validation_split, args.seed)
+    y_train, w_train = _targets(labels[train_rows])
+    validation = None
+    if len(validation_rows):
+        validation = (np.asarray(features[validation_rows]), *_targets(labels[validation_rows]))
+
+    tf.keras.utils.set_random_seed(args.seed)
+    inputs = layers.Input(shape=(features.shape[1],))
+    outputs = {}
+    for head, units in (('logo', len(logo_classes)), ('layout', 1), ('signature', 1)):
+        hidden = layers.Dense(FUSED['head_units'], activation='relu', name=f'{head}_hidden')(inputs)
+        outputs[head] = layers.Dense(units, activation='softmax' if units > 1 else 'sigmoid', name=head)(hidden)
+    heads = tf.keras.Model(inputs, outputs, name='fused_heads')
+    heads.compile(optimizer=optimizers.Adam(learning_rate=args.learning_rate),
+                  loss={'logo': 'sparse_categorical_crossentropy', 'layout': 'binary_crossentropy',
+                        'signature': 'binary_crossentropy'},
+                  weighted_metrics={head: ['accuracy'] for head in HEADS})
+
+    start = time.perf_counter()
+    history = heads.fit(np.asarray(features[train_rows]), y_train, sample_weight=w_train,
+                        epochs=args.epochs, batch_size=args.batch_size, validation_data=validation,
+                        shuffle=True, verbose=2 if args.verbose else 0)
+    final = {name: round(values[-1], 4) for name, values in history.history.items() if 'accuracy' in name}
+    print(f'fused: trained heads on {len(train_rows)} rows ({len(validation_rows)} validation) '
+          f'in {time.perf_counter() - start:.1f}s: {final}')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stem = os.path.splitext(FUSED['output'])[0]
+    heads.save(os.path.join(args.output_dir, stem + '_head.h5'))
+    with open(os.path.join(args.output_dir, stem + '_classes.json'), 'w', encoding='utf-8') as f:
+        json.dump({'logo': logo_classes, 'layout': ['AUTHENTIC'], 'signature': ['SIGNED']}, f)
+
+    backbone = build_backbone(FUSED['backbone'], FUSED['image_size'])
+    outputs = heads(backbone.output)
+    # Named outputs, so the exported ONNX/TFLite graphs keep the head names
+    full = tf.keras.Model(backbone.input, {head: layers.Identity(name=head)(outputs[head]) for head in HEADS})
+    full.save(os.path.join(args.output_dir, FUSED['output']))
+    print(f'fused: saved {FUSED["output"]} to {args.output_dir}')
+
+
+def export(args):
+    """ONNX / int8 ONNX / int8 TFLite copies, calibrated on the training samples"""
+    import tensorflow as tf
+    from export_models import export_onnx, export_tflite_int8
+    from services.model_runtime import model_path
+
+    rows, _, teachers = list_samples(args.copies, args.seed)
+    pages = sorted({row['base'] for row in rows if row['kind'] == 'page'})
+    picks = np.random.default_rng(args.seed).permutation(len(rows))[:args.calibration_size]
+    calibration = np.stack([np.round(load_sample(rows[i], teachers, pages) * 255).astype(np.uint8) for i in picks])
+
+    keras_model = tf.keras.models.load_model(os.path.join(args.output_dir, FUSED['output']), compile=False)
+    variants = args.variants.split(',')
+    start = time.perf_counter()
+    if 'onnx' in variants or 'onnx-int8' in variants:
+        export_onnx(keras_model, model_path(args.output_dir, 'fused', 'onnx'),
+                    model_path(args.output_dir, 'fused', 'onnx-int8'), calibration)
+    if 'tflite-int8' in variants:
+        export_tflite_int8(keras_model, model_path(args.output_dir, 'fused', 'tflite-int8'), calibration)
+    print(f'fused: exported {", ".join(variants)} in {time.perf_counter() - start:.1f}s '
+          f'({len(calibration)} calibration pages)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the fused logo/layout/signature model')
+    parser.add_argument('command', choices=('extract', 'train', 'run', 'export'),
+                        help='extract features, train the heads, both, or export CPU variants')
+    parser.add_argument('--cache-dir', default=os.path.join(HERE, 'feature_cache'))
+    parser.add_argument('--output-dir', default=HERE)
+    parser.add_argument('--copies', type=int, default=4, help='Tampered and pasted-logo copies per source image')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--validation-split', type=float, default=0.2)
+    parser.add_argument('--variants', default='onnx,onnx-int8,tflite-int8', help='Variants for export')
+    parser.add_argument('--calibration-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Print per-epoch metrics')
+    args = parser.parse_args(argv)
+
+    if args.command in ('extract', 'run'):
+        extract(args)
+    if args.command in ('train', 'run'):
+        train(args)
+    if args.command == 'export':
+        export(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
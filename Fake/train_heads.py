@@ -0,0 +1,300 @@
+"""
+Train the logo and layout classifiers on cached backbone features
+
+The MobileNetV2 (logo) and VGG16 (layout) bases are frozen, so their output
+for an image never changes between epochs. This runs each backbone once per
+image (plus a fixed number of augmented copies), caches the pooled features
+under --cache-dir, and trains only the dense head on them. New or changed
+images are the only ones sent through the backbone on the next run, so
+refitting after onboarding an institution takes seconds on CPU.
+
+The saved .h5 files are full models (backbone + head, same inputs and
+outputs as the notebook's), plus the head alone and the class order.
+
+    python train_heads.py run logo                    # extract (if needed) and train
+    python train_heads.py extract layout --augment-copies 0
+    python train_heads.py train logo --epochs 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+from PIL import Image
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+MODELS = {
+    'logo': {
+        'data_dir': os.path.join(HERE, 'images', 'logo_data'),
+        'backbone': 'mobilenetv2',
+        'image_size': (224, 224),
+        'head_units': 1024,
+        'augment': {'rotation': 15, 'zoom': 0.1},
+        'output': 'logo_authenticity_model.h5',
+    },
+    'layout': {
+        'data_dir': os.path.join(HERE, 'images', 'layout_data'),
+        'backbone': 'vgg16',
+        'image_size': (300, 450),
+        'head_units': 512,
+        'augment': None,
+        'output': 'layout_authenticity_model.h5',
+    },
+}
+
+
+def list_images(data_dir):
+    """
+    (relative path, class name) for every image, classes in sorted folder
+    order like flow_from_directory. A flat folder is one class, AUTHENTIC
+    (the layout model's single-class setup).
+    Returns: (entries, class names)
+    """
+    folders = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    if not folders:
+        files = sorted(f for f in os.listdir(data_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        return [(f, 'AUTHENTIC') for f in files], ['AUTHENTIC']
+
+    entries = []
+    for folder in folders:
+        for name in sorted(os.listdir(os.path.join(data_dir, folder))):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                entries.append((os.path.join(folder, name), folder))
+    return entries, folders
+
+
+def load_image(path, image_size, augment=None, seed=0):
+    """
+    RGB array scaled to [0, 1] at image_size (height, width), the notebook's
+    rescale=1./255 input. augment applies a seeded random rotation and zoom.
+    """
+    image = Image.open(path).convert('RGB')
+    if augment:
+        rng = np.random.default_rng(seed)
+        image = image.rotate(rng.uniform(-augment['rotation'], augment['rotation']),
+                             resample=Image.BILINEAR, fillcolor=(255, 255, 255))
+        zoom = rng.uniform(1 - augment['zoom'], 1 + augment['zoom'])
+        width, height = image.size
+        crop_w, crop_h = width / zoom, height / zoom
+        left, top = (width - crop_w) / 2, (height - crop_h) / 2
+        image = image.crop((round(left), round(top), round(left + crop_w), round(top + crop_h)))
+    image = image.resize((image_size[1], image_size[0]), Image.NEAREST)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def build_backbone(name, image_size):
+    """Frozen ImageNet base with global average pooling (the head's first layer)"""
+    from tensorflow.keras import applications
+
+    constructor = {'mobilenetv2': applications.MobileNetV2, 'vgg16': applications.VGG16}[name]
+    backbone = constructor(weights='imagenet', include_top=False, pooling='avg',
+                           input_shape=(image_size[0], image_size[1], 3))
+    backbone.trainable = False
+    return backbone
+
+
+class FeatureCache:
+    """
+    Pooled backbone features for one model: features.npy (float32, one row
+    per image and augmented copy), labels.npy and manifest.json describing
+    each row (file, size, mtime, copy) so unchanged rows are reused
+    """
+
+    def __init__(self, cache_dir, model):
+        self.cache_dir = cache_dir
+        self.directory = os.path.join(cache_dir, model)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.features_path = os.path.join(self.directory, 'features.npy')
+        self.labels_path = os.path.join(self.directory, 'labels.npy')
+
+    def load(self):
+        """(manifest, features memmap, labels) or None before the first extraction"""
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        return manifest, np.load(self.features_path, mmap_mode='r'), np.load(self.labels_path)
+
+    def save(self, manifest, features, labels):
+        os.makedirs(self.directory, exist_ok=True)
+        ignore = os.path.join(self.cache_dir, '.gitignore')
+        if not os.path.exists(ignore):
+            with open(ignore, 'w', encoding='utf-8') as f:
+                f.write('*\n')
+        np.save(self.labels_path, labels)
+        out = np.lib.format.open_memmap(self.features_path + '.tmp', mode='w+',
+                                        dtype=np.float32, shape=features.shape)
+        out[:] = features
+        out.flush()
+        del out
+        os.replace(self.features_path + '.tmp', self.features_path)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+
+def extract(model, args):
+    """Run the backbone over new or changed images and refresh the cache"""
+    config = MODELS[model]
+    data_dir = args.data_dir or config['data_dir']
+    copies = args.augment_copies if config['augment'] else 0
+    entries, classes = list_images(data_dir)
+    if not entries:
+        raise SystemExit(f'No images found in {data_dir}')
+
+    # One row per image and copy; copy 0 is the unaugmented image
+    rows = []
+    for path, class_name in entries:
+        stat = os.stat(os.path.join(data_dir, path))
+        for copy in range(copies + 1):
+            rows.append({'file': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                         'copy': copy, 'class': class_name})
+
+    settings = {'backbone': config['backbone'], 'image_size': list(config['image_size']),
+                'augment': config['augment']}
+    cache = FeatureCache(args.cache_dir, model)
+    cached = cache.load()
+    reuse = {}
+    if cached is not None and cached[0]['settings'] == settings:
+        old_manifest, old_features, _ = cached
+        for index, row in enumerate(old_manifest['rows']):
+            reuse[(row['file'], row['size'], row['mtime_ns'], row['copy'])] = old_features[index]
+
+    missing = [i for i, row in enumerate(rows)
+               if (row['file'], row['size'], row['mtime_ns'], row['copy']) not in reuse]
+    start = time.perf_counter()
+    new_features = {}
+    if missing:
+        backbone = build_backbone(config['backbone'], config['image_size'])
+        for batch_start in range(0, len(missing), args.batch_size):
+            batch = missing[batch_start:batch_start + args.batch_size]
+            images = np.stack([
+                load_image(os.path.join(data_dir, rows[i]['file']), config['image_size'],
+                           config['augment'] if rows[i]['copy'] else None,
+                           seed=zlib.crc32(rows[i]['file'].encode()) * 100 + rows[i]['copy'])
+                for i in batch
+            ])
+            for i, vector in zip(batch, backbone.predict(images, verbose=0)):
+                new_features[i] = vector
+
+    dim = len(next(iter(new_features.values()))) if new_features else len(next(iter(reuse.values())))
+    features = np.empty((len(rows), dim), dtype=np.float32)
+    for i, row in enumerate(rows):
+        key = (row['file'], row['size'], row['mtime_ns'], row['copy'])
+        features[i] = new_features[i] if i in new_features else reuse[key]
+    labels = np.array([classes.index(row['class']) for row in rows], dtype=np.int32)
+
+    cache.save({'settings': settings, 'classes': classes, 'rows': rows}, features, labels)
+    print(f'{model}: {len(rows)} rows ({len(entries)} images x {copies + 1}), '
+          f'{len(missing)} extracted in {time.perf_counter() - start:.1f}s, '
+          f'{len(rows) - len(missing)} reused -> {cache.directory}')
+
+
+def split_by_file(rows, classes, validation_split, seed):
+    """
+    Train/validation row indices, split per class by source file so no
+    augmented copy of a validation image is trained on; validation uses
+    unaugmented rows only
+    """
+    rng = np.random.default_rng(seed)
+    validation_files = set()
+    for class_name in classes:
+        files = sorted({row['file'] for row in rows if row['class'] == class_name})
+        count = int(len(files) * validation_split)
+        validation_files.update(rng.permutation(files)[:count].tolist())
+
+    train = [i for i, row in enumerate(rows) if row['file'] not in validation_files]
+    validation = [i for i, row in enumerate(rows) if row['file'] in validation_files and row['copy'] == 0]
+    return np.array(train), np.array(validation)
+
+
+def train(model, args):
+    """Fit the dense head on cached features and save head and full model"""
+    import tensorflow as tf
+    from tensorflow.keras import layers, optimizers
+
+    config = MODELS[model]
+    cached = FeatureCache(args.cache_dir, model).load()
+    if cached is None:
+        raise SystemExit(f'No cached features for {model}; run "extract {model}" first')
+    manifest, features, labels = cached
+    classes, rows = manifest['classes'], manifest['rows']
+    binary = len(classes) == 1
+
+    train_rows, validation_rows = split_by_file(rows, classes, args.validation_split, args.seed)
+    x_train = np.asarray(features[train_rows])
+    y_train = labels[train_rows] if not binary else np.ones(len(train_rows), dtype=np.float32)
+    validation = None
+    if len(validation_rows):
+        y_validation = labels[validation_rows] if not binary else np.ones(len(validation_rows), dtype=np.float32)
+        validation = (np.asarray(features[validation_rows]), y_validation)
+
+    tf.keras.utils.set_random_seed(args.seed)
+    head = tf.keras.Sequential([
+        layers.Input(shape=(features.shape[1],)),
+        layers.Dense(config['head_units'], activation='relu'),
+        layers.Dense(1, activation='sigmoid') if binary else layers.Dense(len(classes), activation='softmax'),
+    ])
+    head.compile(optimizer=optimizers.Adam(learning_rate=args.learning_rate),
+                 loss='binary_crossentropy' if binary else 'sparse_categorical_crossentropy',
+                 metrics=['accuracy'])
+
+    start = time.perf_counter()
+    history = head.fit(x_train, y_train, epochs=args.epochs, batch_size=args.batch_size,
+                       validation_data=validation, shuffle=True, verbose=2 if args.verbose else 0)
+    elapsed = time.perf_counter() - start
+    final = {name: round(values[-1], 4) for name, values in history.history.items()}
+    print(f'{model}: trained head on {len(train_rows)} rows ({len(validation_rows)} validation) '
+          f'in {elapsed:.1f}s: {final}')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stem = os.path.splitext(config['output'])[0]
+    head.save(os.path.join(args.output_dir, stem + '_head.h5'))
+    with open(os.path.join(args.output_dir, stem + '_classes.json'), 'w', encoding='utf-8') as f:
+        json.dump(classes, f)
+
+    # Full model for the existing load_model() callers: backbone + trained head
+    backbone = build_backbone(config['backbone'], config['image_size'])
+    full = tf.keras.Model(backbone.input, head(backbone.output))
+    full.save(os.path.join(args.output_dir, config['output']))
+    print(f'{model}: saved {config["output"]} to {args.output_dir}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train logo/layout heads on cached backbone features')
+    parser.add_argument('command', choices=('extract', 'train', 'run'),
+                        help='extract features, train the head, or both')
+    parser.add_argument('models', nargs='*', help='logo, layout (default: both)')
+    parser.add_argument('--data-dir', help='Override the image folder (single model only)')
+    parser.add_argument('--cache-dir', default=os.path.join(HERE, 'feature_cache'))
+    parser.add_argument('--output-dir', default=HERE)
+    parser.add_argument('--augment-copies', type=int, default=4,
+                        help='Augmented copies per image for models that augment (cached once)')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--validation-split', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Print per-epoch metrics')
+    args = parser.parse_args(argv)
+
+    args.models = args.models or list(MODELS)
+    unknown = set(args.models) - set(MODELS)
+    if unknown:
+        parser.error(f'unknown model(s): {", ".join(sorted(unknown))}')
+    if args.data_dir and len(args.models) != 1:
+        parser.error('--data-dir needs exactly one model')
+
+    for model in args.models:
+        if args.command in ('extract', 'run'):
+            extract(model, args)
+        if args.command in ('train', 'run'):
+            train(model, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
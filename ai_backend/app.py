@@ -3,46 +3,116 @@ Flask API Server for AI Certificate Analysis
 """
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
+import hmac
 import os
+import json
+import uuid
 from dotenv import load_dotenv
 
 # Import services
-from services.ocr_service import OCRService
-from services.image_analyzer import ImageAnalyzer
-from services.signature_checker import SignatureChecker
-from services.layout_analyzer import LayoutAnalyzer
-from services.scoring_engine import ScoringEngine
+from services.analysis_pipeline import AnalysisPipeline, PipelinePolicy
+from services.result_cache import ResultCache
+from services.merkle_verifier import MerkleVerifier
+from services.feature_store import FeatureStore
+from services.field_index import FieldIndex
+from services.upload_stream import HashingRequest, upload_digest
+from services.upload_sessions import UploadSessions, UploadError
+from services.page_checkpoints import PageCheckpoints
+from services.admission_control import AdmissionController, AdmissionRejected
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+# Hash uploads while they stream in so the digest is ready when the body ends
+app.request_class = HashingRequest
 CORS(app, origins=[os.getenv('CORS_ORIGINS', 'http://localhost:3000')])
+# Behind TRUSTED_PROXY_HOPS reverse proxies, remote_addr is the address the
+# outermost of them saw; X-Forwarded-For is ignored otherwise
+proxy_hops = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+if proxy_hops:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
 
 # Configuration
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max
 ALLOWED_EXTENSIONS = {'pdf'}
+# Bearer token for /api/fields/search (student records); unset disables it
+FIELD_SEARCH_TOKEN = os.getenv('FIELD_SEARCH_TOKEN', '')
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize services
-ocr_service = OCRService()
-image_analyzer = ImageAnalyzer()
-signature_checker = SignatureChecker()
-layout_analyzer = LayoutAnalyzer()
-scoring_engine = ScoringEngine()
+merkle_verifier = MerkleVerifier.from_env()
+pipeline = AnalysisPipeline(
+    policy=PipelinePolicy.from_env(),
+    registry=merkle_verifier,
+    result_cache=ResultCache(int(os.getenv('RESULT_CACHE_SIZE', 1024))),
+    feature_store=FeatureStore.from_env(),
+    field_index=FieldIndex.from_env(),
+    checkpoints=PageCheckpoints.from_env()
+)
+upload_sessions = UploadSessions.from_env()
+
+admission = AdmissionController(
+    max_concurrent=int(os.getenv('MAX_CONCURRENT_ANALYSES', 0)) or None,
+    max_queue=int(os.getenv('ADMISSION_QUEUE_SIZE', 32)),
+    max_queue_per_client=int(os.getenv('ADMISSION_QUEUE_PER_CLIENT', 4)),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 30))
+)
+
+try:
+    merkle_verifier.refresh_from_registry()
+except Exception as e:
+    print(f"⚠️  Could not load Merkle roots from registry: {e}")
+# Batches anchored after startup
+merkle_verifier.start_background_refresh()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def investigator_authorized():
+    """Whether the request carries FIELD_SEARCH_TOKEN as its bearer token"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return (bool(FIELD_SEARCH_TOKEN) and scheme.lower() == 'bearer'
+            and hmac.compare_digest(token.strip().encode(), FIELD_SEARCH_TOKEN.encode()))
+
+def client_id():
+    """
+    Identify the caller for fair queuing and upload caps: the peer address,
+    or the one a trusted proxy forwarded (TRUSTED_PROXY_HOPS)
+    """
+    return request.remote_addr or 'unknown'
+
+def rejected_response(rejection):
+    response = jsonify({'success': False, 'error': rejection.reason})
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response, 429
+
+def upload_error_response(error):
+    body = {'success': False, 'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'message': 'AI Backend is running'}), 200
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Admission queue depth and rejection counters"""
+    return jsonify({
+        'admission': admission.stats(),
+        'result_cache': pipeline.result_cache.stats(),
+        'feature_store': pipeline.feature_store.stats() if pipeline.feature_store is not None else None,
+        'ocr_page_cache': pipeline.ocr_service.page_cache.stats()
+    }), 200
+
 @app.route('/api/analyze-certificate', methods=['POST'])
 def analyze_certificate():
     """
@@ -50,6 +120,9 @@ def analyze_certificate():
     Accepts PDF file and returns comprehensive AI analysis
     """
     try:
+        # Shed load before reading the body when the queue is already full
+        admission.check_capacity()
+        
         # Check if file is present
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -64,35 +137,29 @@ def analyze_certificate():
         if not allowed_file(file.filename):
             return jsonify({'error': 'Only PDF files are allowed'}), 400
         
-        # Save file
+        # SHA-256 was computed while the upload was received
+        document_hash = upload_digest(file)
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        
+        # Registry and cache hits are answered before saving or parsing anything
+        analysis = pipeline.decide_by_hash(document_hash)
+        if analysis is not None:
+            return jsonify({
+                'success': True,
+                'filename': filename,
+                'document_hash': document_hash,
+                'analysis': analysis
+            }), 200
+        
+        # Save file (unique name so concurrent uploads never collide)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
         file.save(filepath)
         
         # Perform AI analysis
         try:
-            # OCR Analysis
-            ocr_results = ocr_service.extract_text_from_pdf(filepath)
-            
-            # Image Analysis
-            image_results = image_analyzer.analyze_certificate_image(filepath)
-            
-            # Signature Analysis
-            signature_results = signature_checker.check_signature_authenticity(filepath)
-            
-            # Layout Analysis
-            layout_results = layout_analyzer.analyze_layout(filepath)
-            
-            # Combine all results
-            analysis_results = {
-                'ocr': ocr_results,
-                'image': image_results,
-                'signature': signature_results,
-                'layout': layout_results
-            }
-            
-            # Calculate final authenticity score
-            final_score = scoring_engine.calculate_authenticity_score(analysis_results)
+            # Wait for an analysis slot (bounded, fair across clients)
+            with admission.slot(client_id()):
+                analysis = pipeline.analyze(filepath, document_hash, skip_hash_tiers=True)
             
             # Clean up uploaded file
             os.remove(filepath)
@@ -101,37 +168,16 @@ def analyze_certificate():
             return jsonify({
                 'success': True,
                 'filename': filename,
-                'analysis': {
-                    'authenticity_score': final_score['final_score'],
-                    'fraud_likelihood': final_score['fraud_likelihood'],
-                    'authenticity_level': final_score['authenticity_level'],
-                    'confidence': final_score['confidence'],
-                    'score_breakdown': final_score['score_breakdown'],
-                    'ocr_data': {
-                        'extracted_text': ocr_results.get('text', '')[:500],  # First 500 chars
-                        'word_count': ocr_results.get('word_count', 0),
-                        'extracted_fields': ocr_results.get('extracted_data', {})
-                    },
-                    'visual_analysis': {
-                        'seal_match_percentage': image_results.get('seal_match_percentage', 0),
-                        'layout_similarity': layout_results.get('layout_similarity', 0),
-                        'formatting_score': image_results.get('formatting_score', 0),
-                        'image_quality': image_results.get('image_quality', 0)
-                    },
-                    'signature_analysis': {
-                        'signature_detected': signature_results.get('signature_detected', False),
-                        'authenticity_score': signature_results.get('authenticity_score', 0),
-                        'signature_quality': signature_results.get('signature_quality', 'Unknown')
-                    },
-                    'layout_details': {
-                        'structure_score': layout_results.get('structure_score', 0),
-                        'alignment_score': layout_results.get('alignment_score', 0),
-                        'anomalies_detected': layout_results.get('anomalies_detected', 0),
-                        'anomalies': layout_results.get('anomalies', [])
-                    }
-                }
+                'document_hash': document_hash,
+                'analysis': analysis
             }), 200
             
+        except AdmissionRejected as rejection:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            
+            return rejected_response(rejection)
+            
         except Exception as analysis_error:
             # Clean up file on error
             if os.path.exists(filepath):
@@ -142,12 +188,170 @@ def analyze_certificate():
                 'error': f'Analysis failed: {str(analysis_error)}'
             }), 500
     
+    except AdmissionRejected as rejection:
+        return rejected_response(rejection)
+    
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    Open a resumable upload (for documents over MAX_CONTENT_LENGTH)
+    JSON body: filename, size (bytes), optional sha256
+    """
+    body = request.get_json(silent=True) or {}
+    filename = secure_filename(str(body.get('filename', '')))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Only PDF files are allowed'}), 400
+
+    try:
+        session = upload_sessions.create(filename, body.get('size'), body.get('sha256'), client_id())
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'success': True, 'max_chunk_size': app.config['MAX_CONTENT_LENGTH'], **session}), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Bytes received so far (the offset to resume from)"""
+    try:
+        return jsonify({'success': True, **upload_sessions.status(upload_id)}), 200
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """Append the request body at the Upload-Offset header"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header required'}), 400
+
+    try:
+        upload_sessions.append(upload_id, offset, iter(lambda: request.stream.read(64 * 1024), b''))
+        return jsonify({'success': True, **upload_sessions.status(upload_id)}), 200
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>/analyze', methods=['POST'])
+def analyze_upload(upload_id):
+    """
+    Analyze a completed upload. The upload is kept until the analysis
+    succeeds, so a failed or interrupted one can be retried; pages finished
+    by an earlier attempt are not analyzed again (see PAGE_CHECKPOINT_DIR).
+    """
+    try:
+        admission.check_capacity()
+        # One analysis per upload at a time
+        with upload_sessions.analyzing(upload_id):
+            filepath, document_hash = upload_sessions.complete(upload_id)
+            filename = upload_sessions.meta(upload_id)['filename']
+
+            analysis = pipeline.decide_by_hash(document_hash)
+            if analysis is None:
+                # Wait for an analysis slot (bounded, fair across clients)
+                with admission.slot(client_id()):
+                    analysis = pipeline.analyze(filepath, document_hash, skip_hash_tiers=True)
+
+            upload_sessions.discard(upload_id)
+        return jsonify({
+            'success': True,
+            'filename': filename,
+            'document_hash': document_hash,
+            'analysis': analysis
+        }), 200
+
+    except UploadError as e:
+        return upload_error_response(e)
+
+    except AdmissionRejected as rejection:
+        return rejected_response(rejection)
+
+    except Exception as analysis_error:
+        return jsonify({
+            'success': False,
+            'error': f'Analysis failed: {str(analysis_error)}'
+        }), 500
+
+@app.route('/api/verify-proof', methods=['POST'])
+def verify_proof():
+    """
+    Merkle-proof verification mode
+    Accepts a PDF plus a JSON list of sibling hashes ("proof") and checks
+    inclusion against cached registry roots without any RPC call
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        file = request.files['file']
+
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        if not allowed_file(file.filename):
+            return jsonify({'error': 'Only PDF files are allowed'}), 400
+
+        try:
+            proof = json.loads(request.form.get('proof', '[]'))
+        except ValueError:
+            return jsonify({'error': 'Proof must be a JSON list of hashes'}), 400
+
+        if not isinstance(proof, list):
+            return jsonify({'error': 'Proof must be a JSON list of hashes'}), 400
+
+        document_hash = upload_digest(file)
+        result = merkle_verifier.verify_proof(document_hash, proof, request.form.get('root'))
+
+        if not result['success']:
+            return jsonify({'success': False, 'error': result['error']}), 400
+
+        return jsonify({
+            'success': True,
+            'document_hash': document_hash,
+            'valid': result['valid'],
+            'root': result.get('root'),
+            'reason': result.get('reason')
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/fields/search', methods=['GET'])
+def search_fields():
+    """
+    Look up earlier documents by extracted fields
+    Query: student_name, degree, institution, date (exact, case-insensitive),
+    q (tokens in any field), limit
+    Requires Authorization: Bearer <FIELD_SEARCH_TOKEN>
+    """
+    if not FIELD_SEARCH_TOKEN:
+        return jsonify({'success': False, 'error': 'Field search is disabled (FIELD_SEARCH_TOKEN is not set)'}), 403
+    if not investigator_authorized():
+        return jsonify({'success': False, 'error': 'Investigator token required'}), 401, {'WWW-Authenticate': 'Bearer'}
+    if pipeline.field_index is None:
+        return jsonify({'success': False, 'error': 'Field index is disabled'}), 503
+
+    try:
+        result = pipeline.field_index.search(
+            student_name=request.args.get('student_name'),
+            degree=request.args.get('degree'),
+            institution=request.args.get('institution'),
+            date=request.args.get('date'),
+            text=request.args.get('q'),
+            limit=max(1, min(int(request.args.get('limit', 50)), 500))
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return jsonify({'success': True, **result}), 200
+
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
     """Test endpoint to verify API is working"""
@@ -155,7 +359,10 @@ def test_endpoint():
         'message': 'AI Backend API is working!',
         'endpoints': {
             'health': '/api/health',
-            'analyze': '/api/analyze-certificate (POST with PDF file)'
+            'analyze': '/api/analyze-certificate (POST with PDF file)',
+            'verify_proof': '/api/verify-proof (POST with PDF file and Merkle proof)',
+            'uploads': '/api/uploads (POST, then PATCH chunks and POST /api/uploads/<id>/analyze)',
+            'search_fields': '/api/fields/search (GET with student_name, degree, institution, date or q; bearer token)'
         }
     }), 200
 
@@ -0,0 +1,460 @@
+"""
+Async (ASGI) API Server for AI Certificate Analysis
+Uploads are received on the event loop and the CPU-heavy pipeline runs in a
+bounded process pool, so slow clients never hold a worker.
+
+Run with:
+    gunicorn -c gunicorn.conf.py asgi:app
+"""
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from werkzeug.utils import secure_filename
+
+from services.analysis_pipeline import AnalysisPipeline, PipelinePolicy
+from services.result_cache import ResultCache
+from services.merkle_verifier import MerkleVerifier
+from services.feature_store import FeatureStore
+from services.field_index import FieldIndex
+from services.admission_control import AdmissionController, AdmissionRejected
+from services.upload_sessions import UploadSessions, UploadError
+from services.page_checkpoints import PageCheckpoints
+
+# Load environment variables
+load_dotenv()
+
+# Configuration
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max
+# Every gunicorn worker (WEB_CONCURRENCY) has its own pool: split the cores
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS') or 0) or max(
+    1, (os.cpu_count() or 2) // max(1, int(os.getenv('WEB_CONCURRENCY', 2))))
+ALLOWED_EXTENSIONS = {'pdf'}
+CHUNK_SIZE = 64 * 1024
+# Bearer token for /api/fields/search (student records); unset disables it
+FIELD_SEARCH_TOKEN = os.getenv('FIELD_SEARCH_TOKEN', '')
+
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+merkle_verifier = MerkleVerifier.from_env()
+# Hash tiers (registry, cache) run here on the event loop; the rest in the
+# pool, so no models or analyzers are loaded here
+front_pipeline = AnalysisPipeline(
+    policy=PipelinePolicy.from_env(),
+    registry=merkle_verifier,
+    result_cache=ResultCache(int(os.getenv('RESULT_CACHE_SIZE', 1024))),
+    feature_store=FeatureStore.from_env(),
+    field_index=FieldIndex.from_env(),
+    analyzers=False
+)
+upload_sessions = UploadSessions.from_env()
+
+# Admission slots match the analysis pool so queued work waits here, bounded
+admission = AdmissionController(
+    max_concurrent=ANALYSIS_WORKERS,
+    max_queue=int(os.getenv('ADMISSION_QUEUE_SIZE', 32)),
+    max_queue_per_client=int(os.getenv('ADMISSION_QUEUE_PER_CLIENT', 4)),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 30))
+)
+
+# Each pool process builds its own pipeline once
+_worker_pipeline = None
+process_pool = None
+
+
+def _start_pool():
+    return ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, initializer=_init_worker)
+
+
+def _init_worker():
+    global _worker_pipeline
+    # The pool already spreads documents over the cores; page processes
+    # under every analysis worker would only oversubscribe them
+    if int(os.getenv('PAGE_PROCESSES', 0)):
+        print("⚠️  PAGE_PROCESSES is ignored in asgi analysis workers (see ANALYSIS_WORKERS)")
+    # Page checkpoints let a retry skip the pages a crashed worker finished
+    _worker_pipeline = AnalysisPipeline(policy=PipelinePolicy.from_env(), checkpoints=PageCheckpoints.from_env(),
+                                        page_processes=0)
+
+
+def _run_analysis(filepath, document_hash=None):
+    return _worker_pipeline.analyze(filepath, document_hash, skip_hash_tiers=True)
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def investigator_authorized(request):
+    """Whether the request carries FIELD_SEARCH_TOKEN as its bearer token"""
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    return (bool(FIELD_SEARCH_TOKEN) and scheme.lower() == 'bearer'
+            and hmac.compare_digest(token.strip().encode(), FIELD_SEARCH_TOKEN.encode()))
+
+
+def client_id(request):
+    """
+    Identify the caller for fair queuing and upload caps: the peer address.
+    uvicorn replaces it with the forwarded one only for proxies listed in
+    FORWARDED_ALLOW_IPS (gunicorn.conf.py) or --forwarded-allow-ips
+    """
+    return request.client.host if request.client else 'unknown'
+
+
+def rejected_response(rejection):
+    return JSONResponse({'success': False, 'error': rejection.reason}, status_code=429,
+                        headers={'Retry-After': str(rejection.retry_after)})
+
+
+def upload_error_response(error):
+    body = {'success': False, 'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return JSONResponse(body, status_code=error.status)
+
+
+async def _analyze_in_pool(request, filepath, document_hash):
+    """Hash tiers here, then the rest of the pipeline in the process pool"""
+    # Registry and cache hits are answered without touching the pool
+    analysis = front_pipeline.decide_by_hash(document_hash)
+
+    if analysis is None:
+        # Wait for an analysis slot (bounded, fair across clients)
+        await admission.wait_async(admission.submit(client_id(request)))
+        start = time.monotonic()
+        pool = process_pool
+        try:
+            loop = asyncio.get_running_loop()
+            analysis = await loop.run_in_executor(pool, _run_analysis, filepath, document_hash)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory): replace the pool so the
+            # retry runs, resuming from the pages that worker checkpointed
+            _restart_pool(pool)
+            raise
+        finally:
+            admission.release(time.monotonic() - start)
+        front_pipeline.remember(document_hash, analysis)
+    return analysis
+
+
+def _restart_pool(broken):
+    """Replace a broken pool once, however many requests saw it break"""
+    global process_pool
+    if process_pool is broken:
+        process_pool = _start_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _too_large(request):
+    try:
+        return int(request.headers.get('content-length', 0)) > MAX_CONTENT_LENGTH
+    except ValueError:
+        return False
+
+
+async def _read_body(request):
+    """
+    The request body, or None past MAX_CONTENT_LENGTH: counted as it
+    arrives, so chunked requests without Content-Length are capped too
+    """
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_CONTENT_LENGTH:
+            return None
+    return bytes(body)
+
+
+def _save_upload(source, filepath):
+    """Copy an uploaded file to disk, hashing it in the same pass (runs off the event loop)"""
+    digest = hashlib.sha256()
+    source.seek(0)
+    with open(filepath, 'wb') as out:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return '0x' + digest.hexdigest()
+
+
+async def _receive_upload(request):
+    """
+    Read the body (at most MAX_CONTENT_LENGTH), parse the multipart form and
+    copy the PDF to disk in a thread, hashing it in the same pass.
+    Returns: (form, file, filename, filepath, document_hash) or a JSONResponse on error
+    """
+    if _too_large(request):
+        return JSONResponse({'error': 'File too large'}, status_code=413)
+    body = await _read_body(request)
+    if body is None:
+        return JSONResponse({'error': 'File too large'}, status_code=413)
+
+    async def replay():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    form = await Request(request.scope, replay).form()
+    file = form.get('file')
+
+    if file is None or isinstance(file, str):
+        return JSONResponse({'error': 'No file provided'}, status_code=400)
+
+    if file.filename == '':
+        return JSONResponse({'error': 'No file selected'}, status_code=400)
+
+    if not allowed_file(file.filename):
+        return JSONResponse({'error': 'Only PDF files are allowed'}, status_code=400)
+
+    filename = secure_filename(file.filename)
+    filepath = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
+    document_hash = await asyncio.get_running_loop().run_in_executor(None, _save_upload, file.file, filepath)
+    return form, file, filename, filepath, document_hash
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({'status': 'healthy', 'message': 'AI Backend is running'})
+
+
+async def analyze_certificate(request):
+    """
+    Main endpoint for certificate analysis
+    Accepts PDF file and returns comprehensive AI analysis
+    """
+    try:
+        # Shed load before reading the body when the queue is already full
+        admission.check_capacity()
+
+        received = await _receive_upload(request)
+        if isinstance(received, JSONResponse):
+            return received
+        form, file, filename, filepath, document_hash = received
+
+        try:
+            analysis = await _analyze_in_pool(request, filepath, document_hash)
+
+            return JSONResponse({
+                'success': True,
+                'filename': filename,
+                'document_hash': document_hash,
+                'analysis': analysis
+            })
+        except AdmissionRejected as rejection:
+            return rejected_response(rejection)
+        except Exception as analysis_error:
+            return JSONResponse({
+                'success': False,
+                'error': f'Analysis failed: {str(analysis_error)}'
+            }, status_code=500)
+        finally:
+            # Clean up uploaded file
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    except AdmissionRejected as rejection:
+        return rejected_response(rejection)
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+async def create_upload(request):
+    """Open a resumable upload (see app.py)"""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        body = {}
+    filename = secure_filename(str(body.get('filename', '')))
+    if not filename or not allowed_file(filename):
+        return JSONResponse({'error': 'Only PDF files are allowed'}, status_code=400)
+
+    try:
+        session = upload_sessions.create(filename, body.get('size'), body.get('sha256'), client_id(request))
+    except UploadError as e:
+        return upload_error_response(e)
+    return JSONResponse({'success': True, 'max_chunk_size': MAX_CONTENT_LENGTH, **session}, status_code=201)
+
+
+async def upload_status(request):
+    """Bytes received so far (the offset to resume from)"""
+    try:
+        return JSONResponse({'success': True, **upload_sessions.status(request.path_params['upload_id'])})
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+async def upload_chunk(request):
+    """Append the request body (at most MAX_CONTENT_LENGTH) at the Upload-Offset header"""
+    try:
+        offset = int(request.headers.get('upload-offset', ''))
+    except ValueError:
+        return JSONResponse({'error': 'Upload-Offset header required'}, status_code=400)
+    if _too_large(request):
+        return JSONResponse({'error': 'Chunk too large'}, status_code=413)
+
+    body = await _read_body(request)
+    if body is None:
+        return JSONResponse({'error': 'Chunk too large'}, status_code=413)
+
+    upload_id = request.path_params['upload_id']
+    try:
+        # File writes stay off the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, upload_sessions.append, upload_id, offset, [body])
+        return JSONResponse({'success': True, **upload_sessions.status(upload_id)})
+    except UploadError as e:
+        return upload_error_response(e)
+
+
+async def analyze_upload(request):
+    """
+    Analyze a completed upload; kept until the analysis succeeds, so a
+    failed one can be retried from its checkpointed pages (see app.py)
+    """
+    upload_id = request.path_params['upload_id']
+    try:
+        admission.check_capacity()
+        loop = asyncio.get_running_loop()
+        # One analysis per upload at a time (taking the lock does not block)
+        with upload_sessions.analyzing(upload_id):
+            filepath, document_hash = await loop.run_in_executor(None, upload_sessions.complete, upload_id)
+            filename = upload_sessions.meta(upload_id)['filename']
+
+            analysis = await _analyze_in_pool(request, filepath, document_hash)
+            upload_sessions.discard(upload_id)
+        return JSONResponse({
+            'success': True,
+            'filename': filename,
+            'document_hash': document_hash,
+            'analysis': analysis
+        })
+    except UploadError as e:
+        return upload_error_response(e)
+    except AdmissionRejected as rejection:
+        return rejected_response(rejection)
+    except Exception as analysis_error:
+        return JSONResponse({
+            'success': False,
+            'error': f'Analysis failed: {str(analysis_error)}'
+        }, status_code=500)
+
+
+async def metrics(request):
+    """Admission queue depth and rejection counters"""
+    return JSONResponse({
+        'admission': admission.stats(),
+        'result_cache': front_pipeline.result_cache.stats(),
+        'feature_store': front_pipeline.feature_store.stats() if front_pipeline.feature_store is not None else None
+    })
+
+
+async def verify_proof(request):
+    """Merkle-proof verification mode (see app.py)"""
+    try:
+        received = await _receive_upload(request)
+        if isinstance(received, JSONResponse):
+            return received
+        form, file, filename, filepath, document_hash = received
+        os.remove(filepath)
+
+        try:
+            proof = json.loads(form.get('proof', '[]'))
+        except ValueError:
+            proof = None
+
+        if not isinstance(proof, list):
+            return JSONResponse({'error': 'Proof must be a JSON list of hashes'}, status_code=400)
+
+        # A miss may pull new registry events: off the event loop
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, merkle_verifier.verify_proof, document_hash, proof, form.get('root'))
+
+        if not result['success']:
+            return JSONResponse({'success': False, 'error': result['error']}, status_code=400)
+
+        return JSONResponse({
+            'success': True,
+            'document_hash': document_hash,
+            'valid': result['valid'],
+            'root': result.get('root'),
+            'reason': result.get('reason')
+        })
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+
+async def search_fields(request):
+    """Look up earlier documents by extracted fields (see app.py)"""
+    if not FIELD_SEARCH_TOKEN:
+        return JSONResponse({'success': False, 'error': 'Field search is disabled (FIELD_SEARCH_TOKEN is not set)'},
+                            status_code=403)
+    if not investigator_authorized(request):
+        return JSONResponse({'success': False, 'error': 'Investigator token required'}, status_code=401,
+                            headers={'WWW-Authenticate': 'Bearer'})
+    if front_pipeline.field_index is None:
+        return JSONResponse({'success': False, 'error': 'Field index is disabled'}, status_code=503)
+
+    params = request.query_params
+    try:
+        result = front_pipeline.field_index.search(
+            student_name=params.get('student_name'),
+            degree=params.get('degree'),
+            institution=params.get('institution'),
+            date=params.get('date'),
+            text=params.get('q'),
+            limit=max(1, min(int(params.get('limit', 50)), 500))
+        )
+    except ValueError as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+
+    return JSONResponse({'success': True, **result})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global process_pool
+    process_pool = _start_pool()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, merkle_verifier.refresh_from_registry)
+    except Exception as e:
+        print(f"⚠️  Could not load Merkle roots from registry: {e}")
+    # Batches anchored after startup
+    merkle_verifier.start_background_refresh()
+
+    yield
+
+    process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/metrics', metrics, methods=['GET']),
+        Route('/api/analyze-certificate', analyze_certificate, methods=['POST']),
+        Route('/api/uploads', create_upload, methods=['POST']),
+        Route('/api/uploads/{upload_id}', upload_status, methods=['GET']),
+        Route('/api/uploads/{upload_id}', upload_chunk, methods=['PATCH']),
+        Route('/api/uploads/{upload_id}/analyze', analyze_upload, methods=['POST']),
+        Route('/api/verify-proof', verify_proof, methods=['POST']),
+        Route('/api/fields/search', search_fields, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=[os.getenv('CORS_ORIGINS', 'http://localhost:3000')],
+                   allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,107 @@
+"""
+Adaptive depth: quick-pass accuracy, escalation rate and cost against the full tier
+
+For each document, runs the quick pass (text layer, page 1 at QUICK_DPI, no
+CNN models, no tiles) and the full analysis. Reports how far each quick
+component lands from its full value, which documents the quick tier would
+decide with the configured margins and review band, whether it agrees with
+the full verdict, and the time of the adaptive path (quick, then full when
+escalated) against running the full tier for every document. The largest
+component differences are what QUICK_MARGINS should cover.
+
+    python benchmarks/adaptive_depth.py                      # layout samples, as one-page PDFs
+    python benchmarks/adaptive_depth.py uploads/*.pdf
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.analysis_pipeline import AnalysisPipeline, PipelinePolicy  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+COMPONENTS = ('seal_match', 'layout_similarity', 'ocr_quality')
+ACCEPTED = ('Highly Authentic', 'Likely Authentic')
+REJECTED = ('Questionable', 'Likely Fraudulent')
+
+
+def as_pdf(path, directory):
+    if path.lower().endswith('.pdf'):
+        return path
+    target = os.path.join(directory, os.path.splitext(os.path.basename(path))[0] + '.pdf')
+    Image.open(path).convert('RGB').save(target, resolution=150)
+    return target
+
+
+def outcome(level):
+    return 'accept' if level in ACCEPTED else 'reject' if level in REJECTED else 'review'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='Certificate PDFs or images (default: layout samples)')
+    args = parser.parse_args()
+
+    pipeline = AnalysisPipeline(policy=PipelinePolicy.from_env())
+    reject, accept = pipeline._review_band()
+    margins = pipeline.policy.quick_margins
+    print(f"review band {reject:g}-{accept:g}, margins "
+          + ', '.join(f'{name} {margins[name]:.2f}' for name in COMPONENTS))
+    print(f"{'document':<16} {'quick ms':>9} {'full ms':>8} {'quick':>6} {'interval':>12} {'full':>6} "
+          f"{'d seal':>7} {'d layout':>9} {'d ocr':>6}  decision")
+
+    deltas, quick_total, full_total, adaptive_total, decided, agreed = [], 0.0, 0.0, 0.0, 0, 0
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [as_pdf(path, directory) for path in (args.files or sorted(glob.glob(DEFAULT_SAMPLES)))]
+        for path in paths:
+            start = time.perf_counter()
+            quick = pipeline.quick_pass(path)
+            quick_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            full = pipeline._full_analysis(path)
+            full_ms = (time.perf_counter() - start) * 1000
+            if quick is None:
+                print(f'{os.path.basename(path)[:16]:<16} quick pass could not render page 1')
+                continue
+
+            results, quick_score, _, _ = quick
+            fields = results['ocr'].get('extracted_data', {})
+            # As in the quick tier: a complete text layer is what the full tier reads too
+            exact_ocr = all(fields.get(field) for field in pipeline.ocr_service.required_fields)
+            low, high = pipeline.scoring_engine.score_interval(
+                results, dict(margins, ocr_quality=0.0) if exact_ocr else margins)
+            delta = [abs(quick_score['score_breakdown'][name] - full['score_breakdown'][name]) / 100
+                     for name in COMPONENTS]
+            deltas.append(delta)
+            kept = low >= accept or high < reject
+            quick_total += quick_ms
+            full_total += full_ms
+            adaptive_total += quick_ms + (0 if kept else full_ms)
+            if kept:
+                decided += 1
+                agreed += outcome(quick_score['authenticity_level']) == outcome(full['authenticity_level'])
+            decision = (f"quick {outcome(quick_score['authenticity_level'])}, full "
+                        f"{outcome(full['authenticity_level'])}" if kept else 'escalated')
+            print(f'{os.path.basename(path)[:16]:<16} {quick_ms:>9.0f} {full_ms:>8.0f} '
+                  f"{quick_score['final_score']:>6.1f} {low:>5.1f}-{high:<6.1f} {full['authenticity_score']:>6.1f} "
+                  f'{delta[0]:>7.2f} {delta[1]:>9.2f} {delta[2]:>6.2f}  {decision}')
+
+    if not deltas:
+        return
+    deltas = np.array(deltas)
+    print(f"\n{len(deltas)} documents; component difference max "
+          + ', '.join(f'{name} {deltas[:, i].max():.2f}' for i, name in enumerate(COMPONENTS))
+          + '; p90 ' + ', '.join(f'{np.percentile(deltas[:, i], 90):.2f}' for i in range(len(COMPONENTS))))
+    print(f"quick pass {quick_total / full_total:.0%} of the full cost; decided at quick {decided}/{len(deltas)}"
+          f" (agreeing with full {agreed}/{decided}); adaptive path {adaptive_total / 1000:.1f}s "
+          f"vs always-full {full_total / 1000:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Per-page model latency: separate logo and layout models vs the fused model
+
+For each page, times the work the analyzers do with ML_FUSED off (logo
+classifier at 224x224 plus layout classifier at 300x450, each with its own
+resize, and the signature region search) against one fused pass at 224x336
+that yields all three heads. Times include the resizes and are best of
+--repeat runs, per model variant.
+
+    python benchmarks/fused_model.py                          # Fake/images/layout_data
+    python benchmarks/fused_model.py scans/*.pdf --variants onnx-int8,tflite-int8
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.model_runtime import DEFAULT_MODEL_DIR, VARIANTS, load_model, model_path  # noqa: E402
+from services.rasterizer import render_images  # noqa: E402
+from services.signature_matcher import find_signature_candidates  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+
+
+def best_time(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def load_page(path):
+    if path.lower().endswith('.pdf'):
+        return render_images(path, [1], dpi=300)[0]
+    return Image.open(path).convert('RGB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='Certificate images or PDFs (default: layout samples)')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help='Model variants to compare')
+    parser.add_argument('--model-dir', default=os.getenv('ML_MODEL_DIR', DEFAULT_MODEL_DIR))
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per page (best time is kept)')
+    args = parser.parse_args()
+
+    pages = [load_page(path) for path in (args.files or sorted(glob.glob(DEFAULT_SAMPLES)))]
+    signature_ms = sum(best_time(lambda: find_signature_candidates(page), args.repeat)[0]
+                       for page in pages) / len(pages) * 1000
+
+    print(f"{len(pages)} pages; signature region search {signature_ms:.1f} ms/page")
+    print(f"{'variant':<12} {'logo ms':>8} {'layout ms':>10} {'separate':>9} {'+signature':>11} "
+          f"{'fused ms':>9} {'speedup':>8}")
+    for variant in args.variants.split(','):
+        missing = [name for name in ('logo', 'layout', 'fused')
+                   if not os.path.exists(model_path(args.model_dir, name, variant))]
+        if missing:
+            print(f'{variant:<12} not found: {", ".join(missing)}')
+            continue
+        try:
+            logo, layout, fused = (load_model(name, variant, args.model_dir) for name in ('logo', 'layout', 'fused'))
+        except ImportError as e:
+            print(f'{variant:<12} runtime not installed: {e}')
+            continue
+
+        totals = {'logo': 0.0, 'layout': 0.0, 'fused': 0.0}
+        for page in pages:
+            totals['logo'] += best_time(lambda: logo.classify(page), args.repeat)[0]
+            totals['layout'] += best_time(lambda: layout.classify(page), args.repeat)[0]
+            # predict_outputs bypasses the per-page memo so every run is a real pass
+            totals['fused'] += best_time(lambda: fused.predict_outputs(fused.preprocess(page)[None]), args.repeat)[0]
+        logo_ms, layout_ms, fused_ms = (totals[key] / len(pages) * 1000 for key in ('logo', 'layout', 'fused'))
+        separate = logo_ms + layout_ms
+        print(f'{variant:<12} {logo_ms:>8.1f} {layout_ms:>10.1f} {separate:>9.1f} {separate + signature_ms:>11.1f} '
+              f'{fused_ms:>9.1f} {(separate + signature_ms) / fused_ms:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
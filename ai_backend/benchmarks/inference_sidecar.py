@@ -0,0 +1,126 @@
+"""
+Throughput and memory: models loaded per process vs the shared inference sidecar
+
+Starts --processes worker processes, like gunicorn workers or the analysis
+pool, each classifying the pages with the logo and layout models from
+--threads page threads. With --mode local every process loads its own
+models; with --mode sidecar one `manage.py serve-inference` process holds
+them and batches the requests of all workers. Reports pages/s, the summed
+resident memory of all processes once the models are loaded and, for the
+sidecar, the mean batch size.
+
+    python benchmarks/inference_sidecar.py --variant onnx-int8
+    python benchmarks/inference_sidecar.py --processes 8 --threads 4 --mode sidecar
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.model_runtime import DEFAULT_MODEL_DIR, load_env_models, remote_models  # noqa: E402
+from services.inference_server import InferenceClient  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+SOCKET = '/tmp/certificate-inference-benchmark.sock'
+
+
+def rss_mb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def worker(mode, paths, threads, rounds, ready, start, results):
+    from concurrent.futures import ThreadPoolExecutor
+
+    models = remote_models(SOCKET) if mode == 'sidecar' else load_env_models()
+    # Before the pages are decoded, which every mode holds alike
+    memory = rss_mb(os.getpid())
+    pages = [Image.open(path).convert('RGB') for path in paths]
+
+    def analyze(page):
+        return models['logo'].classify(page), models['layout'].classify(page)
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(analyze, pages))  # warm up
+        ready.wait()
+        start.wait()
+        began = time.perf_counter()
+        for _ in range(rounds):
+            list(pool.map(analyze, pages))
+        elapsed = time.perf_counter() - began
+    results.put((len(pages) * rounds, elapsed, memory))
+
+
+def run(mode, args, paths):
+    sidecar = None
+    if mode == 'sidecar':
+        sidecar = subprocess.Popen([sys.executable, 'manage.py', 'serve-inference', '--socket', SOCKET],
+                                   cwd=os.path.join(os.path.dirname(__file__), '..'),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        InferenceClient(SOCKET).wait_ready(timeout=120)
+
+    ready = multiprocessing.Barrier(args.processes + 1)
+    start = multiprocessing.Barrier(args.processes + 1)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(mode, paths, args.threads, args.rounds,
+                                                              ready, start, results))
+                 for _ in range(args.processes)]
+    try:
+        for process in processes:
+            process.start()
+        ready.wait()
+        start.wait()
+        measured = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        pages = sum(count for count, _, _ in measured)
+        elapsed = max(seconds for _, seconds, _ in measured)
+        memory = sum(rss for _, _, rss in measured)
+        batch = ''
+        if sidecar is not None:
+            memory += rss_mb(sidecar.pid)
+            stats = InferenceClient(SOCKET).stats()
+            batch = '  '.join(f"{name} {stats[name]['mean_batch']:.1f}" for name in ('logo', 'layout'))
+        print(f'{mode:<8} {pages / elapsed:>8.1f} {memory:>9.0f}  {batch}')
+    finally:
+        if sidecar is not None:
+            sidecar.terminate()
+            sidecar.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='Certificate images (default: layout samples)')
+    parser.add_argument('--variant', default=os.getenv('ML_MODEL_VARIANT', 'onnx-int8'))
+    parser.add_argument('--model-dir', default=os.getenv('ML_MODEL_DIR', DEFAULT_MODEL_DIR))
+    parser.add_argument('--mode', choices=('local', 'sidecar', 'both'), default='both')
+    parser.add_argument('--processes', type=int, default=4, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='Page threads per process')
+    parser.add_argument('--rounds', type=int, default=3, help='Passes over the pages per process')
+    parser.add_argument('--max-batch', default=os.getenv('INFERENCE_MAX_BATCH', '4'), help='Sidecar batch limit')
+    args = parser.parse_args()
+
+    # Read by load_env_models() here, in the workers and in the sidecar
+    os.environ.update({'ML_MODEL_VARIANT': args.variant, 'ML_MODEL_DIR': os.path.abspath(args.model_dir),
+                       'ML_FUSED': 'False', 'INFERENCE_MAX_BATCH': str(args.max_batch)})
+    paths = args.files or sorted(glob.glob(DEFAULT_SAMPLES))
+
+    print(f'{len(paths)} pages x {args.rounds} rounds, {args.processes} processes x {args.threads} threads, '
+          f'{args.variant}, sidecar batches up to {args.max_batch}')
+    print(f"{'mode':<8} {'pages/s':>8} {'RSS MB':>9}  mean batch")
+    for mode in (('local', 'sidecar') if args.mode == 'both' else (args.mode,)):
+        run(mode, args, paths)
+
+
+if __name__ == '__main__':
+    main()
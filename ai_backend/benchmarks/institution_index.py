@@ -0,0 +1,58 @@
+"""
+Institution index enrollment and lookup time as the number of issuers grows
+
+Enrolls synthetic institutions (random embeddings, --images per institution,
+reduced to the index's prototypes) into a temporary index, then times
+single lookups at each size. No model is needed; embedding time is a
+separate per-image cost (see Fake/export_models.py).
+
+    python benchmarks/institution_index.py
+    python benchmarks/institution_index.py --sizes 100,1000,10000 --dim 1280
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.institution_index import InstitutionIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,5000', help='Institution counts to measure')
+    parser.add_argument('--dim', type=int, default=1280, help='Embedding size (MobileNetV2 pooled features: 1280)')
+    parser.add_argument('--images', type=int, default=6, help='Reference images per institution')
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'institutions':>12} {'prototypes':>11} {'enroll ms':>10} {'lookup ms':>10} {'top-1':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        index = InstitutionIndex(directory)
+        centres = []
+        for size in (int(s) for s in args.sizes.split(',')):
+            enroll_times = []
+            while len(centres) < size:
+                centre = rng.standard_normal(args.dim).astype(np.float32)
+                centres.append(centre)
+                images = centre + 0.5 * rng.standard_normal((args.images, args.dim)).astype(np.float32)
+                start = time.perf_counter()
+                index.enroll(f'institution {len(centres)}', images)
+                enroll_times.append(time.perf_counter() - start)
+
+            targets = rng.integers(0, size, args.queries)
+            queries = np.stack(centres)[targets] + 0.5 * rng.standard_normal((args.queries, args.dim))
+            start = time.perf_counter()
+            found = [index.classify(query)['label'] for query in queries]
+            lookup = (time.perf_counter() - start) / args.queries
+            correct = np.mean([label == f'institution {t + 1}' for label, t in zip(found, targets)])
+            enroll = np.median(enroll_times) * 1000 if enroll_times else float('nan')
+            print(f'{size:>12} {len(index):>11} {enroll:>10.2f} {lookup * 1000:>10.3f} {correct:>7.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Concurrent load test for the analysis API
+
+Sends a PDF from many concurrent clients and reports throughput and
+latency percentiles. Every request carries a different trailing PDF comment,
+so each has its own hash and the registry and result cache tiers cannot
+answer it; --same-body sends identical bytes to measure cache hits instead.
+Compare serving modes by running it against each:
+
+    gunicorn app:app                          # default sync workers
+    gunicorn -c gunicorn.conf.py asgi:app     # async + process pool
+
+    python benchmarks/loadtest.py certificate.pdf --concurrency 16 --requests 64
+"""
+import argparse
+import os
+import time
+import uuid
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_multipart(pdf_bytes, filename):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        'Content-Type: application/pdf\r\n\r\n'
+    ).encode() + pdf_bytes + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def unique_pdf(pdf_bytes):
+    """The PDF with a random comment appended: same content, a hash of its own"""
+    return pdf_bytes + f'\n% loadtest {uuid.uuid4().hex}\n'.encode()
+
+
+def send(url, body, content_type, timeout):
+    start = time.perf_counter()
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pdf', help='PDF certificate to upload')
+    parser.add_argument('--url', default='http://localhost:5000/api/analyze-certificate')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=32)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--same-body', action='store_true', help='Send identical bytes (measures cache hits)')
+    args = parser.parse_args()
+
+    with open(args.pdf, 'rb') as f:
+        pdf_bytes = f.read()
+    filename = os.path.basename(args.pdf)
+    bodies = [build_multipart(pdf_bytes if args.same_body else unique_pdf(pdf_bytes), filename)
+              for _ in range(args.requests)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda body: send(args.url, *body, args.timeout), bodies))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for status, latency in results if status == 200]
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"Requests:    {args.requests} at concurrency {args.concurrency}")
+    print(f"Status:      {statuses}")
+    print(f"Wall time:   {elapsed:.2f}s")
+    print(f"Throughput:  {len(latencies) / elapsed:.2f} req/s")
+    print(f"Latency p50: {percentile(latencies, 50):.2f}s")
+    print(f"Latency p95: {percentile(latencies, 95):.2f}s")
+    print(f"Latency p99: {percentile(latencies, 99):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
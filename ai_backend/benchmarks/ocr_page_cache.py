@@ -0,0 +1,83 @@
+"""
+Per-page OCR cache: Tesseract calls and time with and without the cache
+
+Builds --documents multi-page PDFs that share every page but the first (as
+transcripts from one university share their terms and back pages), runs
+OCRService's Tesseract path over all of them with and without the page
+cache, and reports Tesseract calls, total time and the cost of hashing a
+rendered page (services/ocr_service.py page_digest). Without Tesseract
+installed the calls still count, but the times only cover rendering and
+preprocessing.
+
+    python benchmarks/ocr_page_cache.py                      # layout samples
+    python benchmarks/ocr_page_cache.py --documents 20 --shared 4
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.multipage import render_pages  # noqa: E402
+from services.ocr_preprocess import OCRPreprocessor  # noqa: E402
+from services.ocr_service import OCR_DPI, OCRService, page_digest, xxhash  # noqa: E402
+from services.result_cache import ResultCache  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+
+
+def build_documents(samples, documents, shared, directory):
+    images = [Image.open(path).convert('RGB') for path in samples]
+    shared_pages = images[1:shared + 1]
+    paths = []
+    for index in range(documents):
+        first = images[0].copy()
+        ImageDraw.Draw(first).text((40, 40), f'Student {index:04d}', fill='black')
+        path = os.path.join(directory, f'transcript-{index:03d}.pdf')
+        first.save(path, save_all=True, append_images=shared_pages, resolution=150)
+        paths.append(path)
+    return paths
+
+
+def run(service, paths):
+    start = time.perf_counter()
+    for path in paths:
+        service._extract_with_ocr(path)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10)
+    parser.add_argument('--shared', type=int, default=3, help='Pages after the first, identical in every document')
+    parser.add_argument('--cache-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = build_documents(sorted(glob.glob(DEFAULT_SAMPLES)), args.documents, args.shared, directory)
+        pages = args.documents * (args.shared + 1)
+
+        uncached = run(OCRService(preprocessor=OCRPreprocessor.from_env()), paths)
+        cache = ResultCache(args.cache_size)
+        cached = run(OCRService(preprocessor=OCRPreprocessor.from_env(), page_cache=cache), paths)
+
+        (_, page), = render_pages(paths[0], [1], dpi=OCR_DPI)
+        start = time.perf_counter()
+        for _ in range(10):
+            page_digest(page)
+        digest_ms = (time.perf_counter() - start) * 100
+
+    stats = cache.stats()
+    print(f'{args.documents} documents, {pages} pages ({args.shared} shared per document)')
+    print(f'no cache:   {pages} Tesseract calls, {uncached:.1f}s')
+    print(f"page cache: {stats['misses']} Tesseract calls ({stats['hits']} pages from cache), {cached:.1f}s")
+    print(f"page hash: {digest_ms:.1f} ms for a {page.width}x{page.height} page "
+          f"({'xxh3-128' if xxhash is not None else 'BLAKE2b'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+OCR time and word accuracy with and without preprocessing
+
+Runs Tesseract on each sample certificate as-is and after OCRPreprocessor,
+and reports time per page plus word accuracy. Accuracy is word recall
+against a ground-truth transcript (<name>.txt in --truth-dir); without
+transcripts it falls back to the share of clean dictionary-like words, a
+rough proxy for garbage output.
+
+    python benchmarks/ocr_preprocess.py                               # Fake/images/layout_data
+    python benchmarks/ocr_preprocess.py scans/*.pdf --truth-dir scans/truth
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from PIL import Image
+import pytesseract
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.ocr_preprocess import OCRPreprocessor, STEPS  # noqa: E402
+from services.rasterizer import render_images  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+PAGE_LONG_SIDE = 3508  # A4 at 300 dpi, what the service renders
+
+
+def load_page(path):
+    if path.lower().endswith('.pdf'):
+        return render_images(path, [1], dpi=300)[0]
+    image = Image.open(path).convert('RGB')
+    # Bring photos and screenshots to the resolution the service works at
+    scale = PAGE_LONG_SIDE / max(image.size)
+    return image.resize((round(image.width * scale), round(image.height * scale)), Image.BICUBIC)
+
+
+def words(text):
+    return [w.lower() for w in re.findall(r'[A-Za-z0-9]+', text)]
+
+
+def accuracy(text, truth):
+    """Word recall against the transcript, or the clean-word share without one"""
+    found = words(text)
+    if truth is not None:
+        expected = Counter(words(truth))
+        hits = sum((Counter(found) & expected).values())
+        return hits / max(sum(expected.values()), 1)
+    clean = [w for w in found if (w.isdigit() or (len(w) > 1 and re.search(r'[aeiouy]', w)))]
+    return len(clean) / max(len(found), 1)
+
+
+def timed_ocr(image, repeat):
+    best, text = float('inf'), ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        text = pytesseract.image_to_string(image)
+        best = min(best, time.perf_counter() - start)
+    return text, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='Certificate images or PDFs (default: layout samples)')
+    parser.add_argument('--truth-dir', help='Directory with <name>.txt ground-truth transcripts')
+    parser.add_argument('--steps', default=','.join(STEPS), help='Preprocessing steps to apply')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per page (best time is kept)')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(DEFAULT_SAMPLES))
+    preprocessor = OCRPreprocessor(steps=args.steps.split(','))
+    metric = 'recall' if args.truth_dir else 'clean'
+
+    print(f"{'file':<16} {'raw s':>7} {'prep s':>7} {'ocr s':>7} {'raw ' + metric:>11} {'prep ' + metric:>11}")
+    totals = Counter()
+    for path in files:
+        name = os.path.splitext(os.path.basename(path))[0]
+        truth = None
+        if args.truth_dir:
+            truth_path = os.path.join(args.truth_dir, name + '.txt')
+            if not os.path.exists(truth_path):
+                continue
+            with open(truth_path, encoding='utf-8') as f:
+                truth = f.read()
+
+        page = load_page(path)
+        raw_text, raw_time = timed_ocr(page, args.repeat)
+
+        start = time.perf_counter()
+        cleaned = preprocessor.process(page)
+        prep_time = time.perf_counter() - start
+        prep_text, ocr_time = timed_ocr(cleaned, args.repeat)
+
+        raw_acc, prep_acc = accuracy(raw_text, truth), accuracy(prep_text, truth)
+        totals.update(raw=raw_time, prep=prep_time, ocr=ocr_time, raw_acc=raw_acc, prep_acc=prep_acc, n=1)
+        print(f'{name:<16} {raw_time:>7.2f} {prep_time:>7.2f} {ocr_time:>7.2f} {raw_acc:>11.1%} {prep_acc:>11.1%}')
+
+    n = totals['n']
+    if not n:
+        print('No pages to benchmark')
+        return
+    print(f"{'mean':<16} {totals['raw'] / n:>7.2f} {totals['prep'] / n:>7.2f} {totals['ocr'] / n:>7.2f} "
+          f"{totals['raw_acc'] / n:>11.1%} {totals['prep_acc'] / n:>11.1%}")
+    speedup = totals['raw'] / max(totals['prep'] + totals['ocr'], 1e-9)
+    print(f'End-to-end OCR speedup with preprocessing: {speedup:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Cost of handing rendered pages to a page process: pickled vs shared memory
+
+Renders the first page of each PDF (or loads each image), then times a round
+trip to a worker process that reads the page and returns a small result,
+once with the PIL image pickled through the pool and once as a SharedPage
+descriptor (services/page_buffers.py). Also reports the bytes each sends.
+Times are best of --repeat runs.
+
+    python benchmarks/page_buffers.py                      # Fake/images/layout_data
+    python benchmarks/page_buffers.py scans/*.pdf --dpi 300
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.page_buffers import SharedPages, load_pages  # noqa: E402
+from services.rasterizer import render_images  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+
+
+def best_time(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def load_page(path, dpi):
+    if path.lower().endswith('.pdf'):
+        return render_images(path, [1], dpi=dpi)[0]
+    return Image.open(path).convert('RGB')
+
+
+def page_size_pickled(pages):
+    return pages[0][1].size
+
+
+def page_size_shared(shared):
+    return load_pages(shared)[0][1].size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', help='Certificate images or PDFs (default: layout samples)')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per page (best time is kept)')
+    args = parser.parse_args()
+
+    pages = [(1, load_page(path, args.dpi)) for path in (args.files or sorted(glob.glob(DEFAULT_SAMPLES)))]
+    # Same start method as the pipeline's page pool
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pool.submit(int).result()  # start the worker outside the timings
+        print(f"{'page':>11} {'MB':>6} {'pickled ms':>11} {'sent MB':>8} {'shared ms':>10} {'sent KB':>8}")
+        for page in pages:
+            image = page[1]
+            megabytes = image.width * image.height * len(image.mode) / 1e6
+            pickled, _ = best_time(lambda: pool.submit(page_size_pickled, [page]).result(), args.repeat)
+
+            def shared_round_trip():
+                with SharedPages([page]) as shared:
+                    return pool.submit(page_size_shared, shared).result()
+
+            shared_time, _ = best_time(shared_round_trip, args.repeat)
+            with SharedPages([page]) as shared:
+                descriptor = len(pickle.dumps(shared))
+            print(f'{image.width:>5}x{image.height:<5} {megabytes:>6.1f} {pickled * 1000:>11.1f} '
+                  f'{len(pickle.dumps([page])) / 1e6:>8.1f} {shared_time * 1000:>10.1f} {descriptor / 1e3:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
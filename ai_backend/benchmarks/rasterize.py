@@ -0,0 +1,80 @@
+"""
+PDF rasterizer backends side by side
+
+For each installed backend (pdfium, mupdf, pdf2image) renders every page of
+the given PDFs the ways the service does: full pages at 300 dpi, 24 dpi
+grayscale thumbnails for page selection, and the content crop (thumbnail
+plus region render, see services/multipage.py). It also renders from
+in-memory bytes and from a thread pool. Times are per page, best of
+--repeat runs.
+
+    python benchmarks/rasterize.py certificates/*.pdf
+    python benchmarks/rasterize.py scan.pdf --backends pdfium,pdf2image --threads 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.multipage import render_pages  # noqa: E402
+from services.rasterizer import BACKENDS, get_rasterizer  # noqa: E402
+
+
+def best_time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='+', help='PDF files to render')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Backends to compare')
+    parser.add_argument('--dpi', type=int, default=300, help='Full-page resolution')
+    parser.add_argument('--threads', type=int, default=4, help='Pool size for the threaded run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best time is kept)')
+    args = parser.parse_args()
+
+    documents = []
+    for path in args.files:
+        with open(path, 'rb') as f:
+            documents.append((path, f.read()))
+
+    columns = ('full', 'bytes', 'thumb', 'crop', 'threaded')
+    print(f"{'backend':<10} {'pages':>5} " + ' '.join(f'{c + " ms":>11}' for c in columns))
+    for name in args.backends.split(','):
+        try:
+            rasterizer = get_rasterizer(name)
+        except ImportError:
+            print(f'{name:<10} not installed')
+            continue
+
+        totals = dict.fromkeys(columns, 0.0)
+        pages = 0
+        for path, data in documents:
+            count = rasterizer.page_count(path)
+            numbers = list(range(1, count + 1))
+            pages += count
+            totals['full'] += best_time(lambda: rasterizer.render(path, numbers, dpi=args.dpi), args.repeat)
+            totals['bytes'] += best_time(lambda: rasterizer.render(data, numbers, dpi=args.dpi), args.repeat)
+            totals['thumb'] += best_time(lambda: rasterizer.render(path, numbers, dpi=24, grayscale=True),
+                                         args.repeat)
+            totals['crop'] += best_time(lambda: render_pages(path, numbers, dpi=args.dpi, crop=True,
+                                                             rasterizer=rasterizer), args.repeat)
+
+            def threaded():
+                with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                    list(pool.map(lambda n: rasterizer.render(path, [n], dpi=args.dpi), numbers * args.threads))
+            # Wall time per page rendered, pages * threads renders in total
+            totals['threaded'] += best_time(threaded, args.repeat) / args.threads
+
+        print(f'{name:<10} {pages:>5} ' + ' '.join(f'{totals[c] / pages * 1000:>11.1f}' for c in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Resumed analysis after a worker dies mid-document: work redone vs a cold run
+
+Builds a multi-page PDF from the layout samples (or takes one), analyzes it
+with the full tier in a fresh process, then starts again in another process
+that is killed part way through (--kill-at, a fraction of the cold time),
+and times a third process that resumes from the page checkpoints the killed
+one left (services/page_checkpoints.py). Every page is analyzed
+(MULTI_PAGE_MODE=all). Times exclude model loading.
+
+    python benchmarks/resumable_analysis.py                    # layout samples as one PDF
+    python benchmarks/resumable_analysis.py bundle.pdf --kill-at 0.8
+"""
+import argparse
+import glob
+import hashlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.analysis_pipeline import AnalysisPipeline, PipelinePolicy  # noqa: E402
+from services.page_checkpoints import PageCheckpoints  # noqa: E402
+
+DEFAULT_SAMPLES = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'layout_data', '*')
+
+
+def build_pdf(paths, target):
+    images = [Image.open(path).convert('RGB') for path in paths]
+    images[0].save(target, save_all=True, append_images=images[1:], resolution=150)
+    return target
+
+
+def analyze(path, document_hash, checkpoint_dir, started, results):
+    pipeline = AnalysisPipeline(policy=PipelinePolicy(tiers=['full']), checkpoints=PageCheckpoints(checkpoint_dir))
+    started.set()
+    start = time.perf_counter()
+    analysis = pipeline.analyze(path, document_hash)
+    results.put((time.perf_counter() - start, analysis))
+
+
+def run(path, document_hash, checkpoint_dir, kill_after=None):
+    """Analyze in a fresh process; returns (seconds, analysis), or None when killed"""
+    context = multiprocessing.get_context('spawn')
+    started, results = context.Event(), context.Queue()
+    process = context.Process(target=analyze, args=(path, document_hash, checkpoint_dir, started, results))
+    process.start()
+    started.wait()
+    if kill_after is not None:
+        time.sleep(kill_after)
+        process.kill()
+        process.join()
+        return None
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file', nargs='?', help='Multi-page PDF (default: the layout samples as one PDF)')
+    parser.add_argument('--kill-at', type=float, default=0.5, help='When to kill, as a fraction of the cold time')
+    args = parser.parse_args()
+    os.environ['MULTI_PAGE_MODE'] = 'all'
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.file or build_pdf(sorted(glob.glob(DEFAULT_SAMPLES)), os.path.join(directory, 'bundle.pdf'))
+        with open(path, 'rb') as f:
+            document_hash = '0x' + hashlib.sha256(f.read()).hexdigest()
+        checkpoint_dir = os.path.join(directory, 'checkpoints')
+
+        cold, analysis = run(path, document_hash, checkpoint_dir)
+        pages = len(analysis.get('pages_analyzed', []))
+        print(f'cold run: {cold:.1f}s for {pages} pages (timings ms {analysis["timings_ms"]})')
+
+        run(path, document_hash, checkpoint_dir, kill_after=cold * args.kill_at)
+        done = PageCheckpoints(checkpoint_dir).for_document(document_hash).pages()
+        print(f'killed after {cold * args.kill_at:.1f}s; checkpointed pages per stage: '
+              + ', '.join(f'{stage} {len(numbers)}' for stage, numbers in sorted(done.items())))
+
+        resumed, again = run(path, document_hash, checkpoint_dir)
+        print(f'resumed run: {resumed:.1f}s ({resumed / cold:.0%} of cold), '
+              f'{len(again.get("pages_resumed", []))} of {pages} pages read back')
+        print(f'cold vs resumed score breakdown: {analysis["score_breakdown"]} vs {again["score_breakdown"]}')
+        print(f'checkpoint files left after the verdict: {len(os.listdir(checkpoint_dir))}')
+
+
+if __name__ == '__main__':
+    main()
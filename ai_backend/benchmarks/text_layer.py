@@ -0,0 +1,80 @@
+"""
+Text-layer extraction time per backend
+
+For each PDF reads the embedded text with the previous approach (PyPDF2,
+text += page.extract_text() over every page) and with each installed
+text-layer backend (services/text_layer.py): all pages with and without
+word boxes, and with the early stop OCRService uses once the required
+certificate fields are found. Times are best of --repeat runs.
+
+    python benchmarks/text_layer.py transcripts/*.pdf
+    python benchmarks/text_layer.py big.pdf --backends pdfium,pypdf --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.ocr_service import OCRService  # noqa: E402
+from services.text_layer import BACKENDS, get_text_layer  # noqa: E402
+
+
+def best_time(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def legacy_pypdf2(path):
+    import PyPDF2
+    with open(path, 'rb') as file:
+        text = ''
+        for page in PyPDF2.PdfReader(file).pages:
+            text += page.extract_text()
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='+', help='PDF files to read')
+    parser.add_argument('--backends', default=','.join(BACKENDS), help='Backends to compare')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best time is kept)')
+    args = parser.parse_args()
+
+    print(f"{'file':<24} {'method':<16} {'pages':>6} {'words':>8} {'seconds':>9}")
+    for path in args.files:
+        name = os.path.basename(path)[:24]
+        try:
+            seconds, text = best_time(lambda: legacy_pypdf2(path), args.repeat)
+            print(f"{name:<24} {'PyPDF2 legacy':<16} {'all':>6} {len(text.split()):>8} {seconds:>9.3f}")
+        except ImportError:
+            print(f"{name:<24} {'PyPDF2 legacy':<16} not installed")
+
+        for backend in args.backends.split(','):
+            try:
+                text_layer = get_text_layer(backend)
+            except ImportError:
+                print(f'{name:<24} {backend:<16} not installed')
+                continue
+
+            seconds, pages = best_time(lambda: list(text_layer.iter_pages(path)), args.repeat)
+            words = sum(len(page['words']) or len(page['text'].split()) for page in pages)
+            print(f'{name:<24} {backend + " boxes":<16} {len(pages):>6} {words:>8} {seconds:>9.3f}')
+
+            seconds, pages = best_time(lambda: list(text_layer.iter_pages(path, words=False)), args.repeat)
+            words = sum(len(page['text'].split()) for page in pages)
+            print(f'{name:<24} {backend + " text":<16} {len(pages):>6} {words:>8} {seconds:>9.3f}')
+
+            service = OCRService(text_layer=text_layer)
+            seconds, (text, fields, read) = best_time(lambda: service._extract_text_layer(path), args.repeat)
+            found = all(fields.get(field) for field in service.required_fields)
+            label = backend + (' early stop' if found else ' no fields')
+            print(f'{name:<24} {label:<16} {read:>6} {len(text.split()):>8} {seconds:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
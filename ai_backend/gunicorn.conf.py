@@ -0,0 +1,59 @@
+"""
+Gunicorn configuration for production serving
+
+Async mode (recommended):
+    gunicorn -c gunicorn.conf.py asgi:app
+Sync Flask mode:
+    GUNICORN_WORKER_CLASS=gthread gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Event-loop workers only receive uploads and wait on the analysis pool,
+# so a couple of them saturate the CPU-bound pool (ANALYSIS_WORKERS per worker)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+
+# Reverse proxies whose X-Forwarded-For is trusted for the client address
+# (uvicorn workers; app:app uses TRUSTED_PROXY_HOPS). Any other peer's
+# header is ignored, so clients cannot pick their own identity
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# Only used by the gthread worker class (sync Flask mode)
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# OCR on a multi-page upload can take tens of seconds
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth from PDF rendering
+max_requests = 500
+max_requests_jitter = 50
+
+# Analysis process pools must be created after the fork, not in the master
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+# With INFERENCE_SOCKET set, the master starts one model sidecar
+# (services/inference_server.py) before forking, and every worker and
+# analysis process sends its inference there instead of loading the models
+_sidecar = None
+
+
+def on_starting(server):
+    global _sidecar
+    if os.getenv('INFERENCE_SOCKET') and os.getenv('ML_MODEL_VARIANT', 'none') != 'none':
+        _sidecar = subprocess.Popen([sys.executable, 'manage.py', 'serve-inference'],
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def on_exit(server):
+    if _sidecar is not None:
+        _sidecar.terminate()
+        _sidecar.wait(timeout=10)
@@ -0,0 +1,182 @@
+"""
+Management commands for the AI backend
+
+    python manage.py enroll-signature --issuer "Anna University" --signer "Registrar" sig1.png sig2.png
+    python manage.py enroll-institution                  # every folder in LOGO_DATA_DIR
+    python manage.py enroll-institution "SRM" --variant onnx-int8
+    python manage.py serve-inference                     # model sidecar on INFERENCE_SOCKET
+    python manage.py check-seals                         # every reference logo matches its own folder
+    python manage.py fit-scoring labels.csv              # learn score weights and thresholds
+"""
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from PIL import Image
+
+# Load environment variables
+load_dotenv()
+
+
+def enroll_signature(args):
+    """Compute and store specimen descriptors for an issuer's signer"""
+    from services.signature_matcher import SpecimenStore
+
+    store = SpecimenStore(args.specimen_dir)
+    images = [Image.open(path) for path in args.images]
+    count = store.enroll(args.issuer, args.signer, images)
+    print(f"✅ Enrolled {count} specimen(s) for {args.signer} ({args.issuer})")
+
+
+def enroll_institution(args):
+    """Embed each institution's reference logos and store its prototypes"""
+    from services.institution_index import InstitutionIndex
+    from services.model_runtime import load_embedder
+    from services.seal_matcher import IMAGE_EXTENSIONS
+
+    embedder = load_embedder('logo', args.variant, args.model_dir)
+    index = InstitutionIndex(args.index_dir, max_prototypes=args.prototypes)
+    names = args.institutions or sorted(name for name in os.listdir(args.logo_dir)
+                                        if os.path.isdir(os.path.join(args.logo_dir, name)))
+    for name in names:
+        folder = os.path.join(args.logo_dir, name)
+        paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        if not paths:
+            print(f"⚠️  No images in {folder}")
+            continue
+        start = time.perf_counter()
+        embeddings = [embedder.embed(Image.open(path)) for path in paths]
+        embedded = time.perf_counter()
+        count = index.enroll(name, embeddings)
+        print(f"✅ Enrolled {name}: {count} prototype(s) from {len(paths)} image(s) "
+              f"(embedding {embedded - start:.2f}s, indexing {(time.perf_counter() - embedded) * 1000:.1f} ms)")
+    print(f"{len(index.institutions())} institution(s) in {args.index_dir}")
+
+
+def serve_inference(args):
+    """Run the model sidecar shared by all server and analysis processes"""
+    from services.inference_server import InferenceServer
+
+    os.environ['INFERENCE_SOCKET'] = args.socket
+    InferenceServer.from_env().serve_forever()
+
+
+def check_seals(args):
+    """Match each reference logo, pasted on a blank page, against all of them"""
+    from services.seal_matcher import SealMatcher
+
+    matcher = SealMatcher(args.logo_dir)
+    if not matcher.ready:
+        sys.exit(f"❌ No reference logos in {args.logo_dir}")
+    failures = matcher.self_check(tuple(args.widths))
+    for path, width, institution, class_scores in failures:
+        runners = sorted(class_scores.items(), key=lambda item: item[1], reverse=True)[:2] if class_scores else []
+        scores = ', '.join(f'{name} {score:.2f}' for name, score in runners)
+        print(f"⚠️  {os.path.relpath(path, args.logo_dir)} at {width}px: {institution or 'no match'} ({scores})")
+    pastes = len(matcher.reference_paths) * len(args.widths)
+    if failures:
+        sys.exit(f"❌ {len(failures)} of {pastes} pastes not matched to their own institution")
+    print(f"✅ All {pastes} pastes matched their own institution")
+
+
+def fit_scoring(args):
+    """Fit scoring weights and level thresholds on labeled documents in the feature store"""
+    import numpy as np
+
+    from services.feature_store import FeatureStore, SCORE_FIELDS
+    from services.scoring_model import (DEFAULT_LEVELS, FEATURES, MAX_FALSE_ACCEPT, ScoringModel,
+                                        ScoringModelStore, evaluate, read_labels)
+
+    labels = read_labels(args.labels)
+    store = FeatureStore(args.feature_store)
+    matrix, hashes = store.score_matrix(), store.document_hashes()
+    rows = [i for i, document_hash in enumerate(hashes) if document_hash in labels]
+    y = np.array([labels[hashes[i]] for i in rows], dtype=np.int64)
+    columns = [SCORE_FIELDS.index(name) for name in FEATURES]
+    scores = matrix[rows]
+    # Early-exit tiers record no component scores
+    complete = ~np.isnan(scores[:, columns]).any(axis=1)
+    features, builtin, y = scores[complete][:, columns] / 100, scores[complete][:, 0], y[complete]
+    print(f"{len(labels)} labels, {len(rows)} in the feature store, {len(y)} with component scores "
+          f"({int(y.sum())} authentic, {int(len(y) - y.sum())} fraudulent)")
+    if len(y) < args.min_documents or y.min() == y.max():
+        sys.exit(f"❌ Need at least {args.min_documents} scored documents of both classes")
+
+    # Held-out documents compare the fit with the built-in weights
+    order = np.random.default_rng(0).permutation(len(y))
+    held_out, train = order[:int(len(y) * args.holdout)], order[int(len(y) * args.holdout):]
+    if y[held_out].min(initial=1) == 1:
+        sys.exit("❌ No fraudulent documents held out to compare false accepts; raise --holdout")
+    max_false_accept = MAX_FALSE_ACCEPT if args.max_false_accept is None else args.max_false_accept
+    model = ScoringModel.fit(features[train], y[train], l2=args.l2, folds=args.folds,
+                             max_false_accept=max_false_accept)
+    report = {'builtin': evaluate(builtin[held_out], y[held_out], DEFAULT_LEVELS),
+              'fitted': evaluate(model.scores(features[held_out]), y[held_out], model.levels)}
+    print(f"{'held out':<10} {'log loss':>9} {'accuracy':>9} {'uncertain':>10} {'false acc':>10} {'false rej':>10}")
+    for name, metrics in report.items():
+        print(f"{name:<10} {metrics['log_loss']:>9.4f} {metrics['accuracy']:>9.2%} "
+              f"{metrics['uncertain_rate']:>10.2%} {metrics['false_accept_rate'] or 0:>10.2%} "
+              f"{metrics['false_reject_rate'] or 0:>10.2%}")
+    if report['fitted']['false_accept_rate'] > report['builtin']['false_accept_rate']:
+        sys.exit("❌ The fit accepts more fraudulent documents than the built-in weights; nothing written")
+
+    model = ScoringModel.fit(features, y, l2=args.l2, folds=args.folds, max_false_accept=max_false_accept)
+    version = ScoringModelStore(args.model_dir).save(model, {'training': {
+        'documents': int(len(y)), 'authentic': int(y.sum()), 'holdout': report}})
+    weights = ', '.join(f'{name} {c:+.2f}' for name, c in zip(model.features, model.coefficients))
+    print(f"✅ Scoring v{version} written to {args.model_dir}: {weights}, intercept {model.intercept:+.2f}")
+    print(f"   levels: {', '.join(f'{label} >= {t:g}' for t, label in model.levels[:-1])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AI backend management commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enroll = commands.add_parser('enroll-signature', help='Enroll signature specimens for an issuer')
+    enroll.add_argument('--issuer', required=True, help='Institution name')
+    enroll.add_argument('--signer', required=True, help='Signer name or role')
+    enroll.add_argument('--specimen-dir', default=os.getenv('SIGNATURE_SPECIMEN_DIR', 'specimens/signatures'))
+    enroll.add_argument('images', nargs='+', help='Cropped signature images')
+    enroll.set_defaults(func=enroll_signature)
+
+    institution = commands.add_parser('enroll-institution',
+                                      help='Enroll institutions for embedding-based logo recognition')
+    institution.add_argument('institutions', nargs='*', help='Folder names under --logo-dir (default: all)')
+    institution.add_argument('--logo-dir', default=os.getenv('LOGO_DATA_DIR', '../Fake/images/logo_data'))
+    institution.add_argument('--index-dir', default=os.getenv('INSTITUTION_INDEX_DIR', 'data/institutions'))
+    institution.add_argument('--variant', default=os.getenv('ML_MODEL_VARIANT', 'keras').replace('none', 'keras'),
+                             help='Logo model variant whose backbone embeds the logos')
+    institution.add_argument('--model-dir', default=os.getenv('ML_MODEL_DIR'))
+    institution.add_argument('--prototypes', type=int, default=4, help='Prototypes kept per institution')
+    institution.set_defaults(func=enroll_institution)
+
+    sidecar = commands.add_parser('serve-inference', help='Serve the ML models to every worker over a Unix socket')
+    sidecar.add_argument('--socket', default=os.getenv('INFERENCE_SOCKET', '/tmp/certificate-inference.sock'))
+    sidecar.set_defaults(func=serve_inference)
+
+    seals = commands.add_parser('check-seals', help='Check that every reference logo matches its own institution')
+    seals.add_argument('--logo-dir', default=os.getenv('LOGO_DATA_DIR', '../Fake/images/logo_data'))
+    seals.add_argument('--widths', type=int, nargs='+', default=[250, 400], help='Logo widths pasted on the page')
+    seals.set_defaults(func=check_seals)
+
+    scoring = commands.add_parser('fit-scoring', help='Learn scoring weights and thresholds from labeled documents')
+    scoring.add_argument('labels', help='CSV with document_hash and label (authentic/fraudulent or 1/0) columns')
+    scoring.add_argument('--feature-store', default=os.getenv('FEATURE_STORE_PATH', 'data/features.bin'))
+    scoring.add_argument('--model-dir', default=os.getenv('SCORING_MODEL_DIR', 'data/scoring'))
+    scoring.add_argument('--holdout', type=float, default=0.25,
+                         help='Fraction held out to compare with the built-in weights')
+    scoring.add_argument('--folds', type=int, default=5, help='Cross-validation folds for the level thresholds')
+    scoring.add_argument('--max-false-accept', type=float,
+                         help='Share of fraudulent documents the authentic levels may pass (default: 0.02)')
+    scoring.add_argument('--l2', type=float, default=1.0, help='L2 regularization strength')
+    scoring.add_argument('--min-documents', type=int, default=20)
+    scoring.set_defaults(func=fit_scoring)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
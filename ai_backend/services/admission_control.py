@@ -0,0 +1,173 @@
+"""
+Admission Control for the analysis endpoint
+Bounds concurrent pipeline runs, queues the overflow fairly per client and
+sheds load with 429 / Retry-After once the queue is full
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+def available_cores():
+    """CPU cores this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; maps to HTTP 429"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent=None, max_queue=32, max_queue_per_client=4, queue_timeout=30.0):
+        self.max_concurrent = max_concurrent or available_cores()
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._active = 0
+        # client id -> deque of waiting futures, served round-robin
+        self._queues = OrderedDict()
+        self._queued = 0
+        # Moving average of how long an admitted request holds its slot
+        self._avg_service_time = 5.0
+
+        self._admitted_total = 0
+        self._rejected_total = 0
+        self._timed_out_total = 0
+
+    def check_capacity(self):
+        """
+        Cheap check to shed load before reading the request body.
+        Raises AdmissionRejected when every slot is busy and the queue is full.
+        """
+        with self._lock:
+            if self._active >= self.max_concurrent and self._queued >= self.max_queue:
+                self._rejected_total += 1
+                raise AdmissionRejected('Server is at capacity', self._retry_after())
+
+    def submit(self, client_id):
+        """
+        Ask for a slot. Returns a Future that resolves once the slot is granted.
+        Raises AdmissionRejected when the wait queue (global or per client) is full.
+        """
+        future = Future()
+        with self._lock:
+            if self._active < self.max_concurrent and self._queued == 0:
+                self._active += 1
+                self._admitted_total += 1
+                future.set_result(True)
+                return future
+
+            queue = self._queues.get(client_id)
+            if self._queued >= self.max_queue:
+                self._rejected_total += 1
+                raise AdmissionRejected('Server is at capacity', self._retry_after())
+            if queue is not None and len(queue) >= self.max_queue_per_client:
+                self._rejected_total += 1
+                raise AdmissionRejected('Too many queued requests for this client', self._retry_after())
+
+            if queue is None:
+                queue = self._queues[client_id] = deque()
+            queue.append(future)
+            self._queued += 1
+        return future
+
+    def cancel(self, future):
+        """Give up on a queued request (timeout or disconnect)"""
+        with self._lock:
+            for client_id, queue in self._queues.items():
+                if future in queue:
+                    queue.remove(future)
+                    self._queued -= 1
+                    if not queue:
+                        del self._queues[client_id]
+                    self._timed_out_total += 1
+                    future.cancel()
+                    return
+        # Already granted in the meantime: hand the slot back
+        if future.done() and not future.cancelled():
+            self.release()
+
+    def release(self, service_time=None):
+        """Return a slot and grant it to the next client in round-robin order"""
+        with self._lock:
+            if service_time is not None:
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+
+            self._active -= 1
+            while self._queues and self._active < self.max_concurrent:
+                client_id, queue = self._queues.popitem(last=False)
+                future = queue.popleft()
+                self._queued -= 1
+                if queue:
+                    # Client still has work waiting: move it to the back of the ring
+                    self._queues[client_id] = queue
+                if future.set_running_or_notify_cancel():
+                    self._active += 1
+                    self._admitted_total += 1
+                    future.set_result(True)
+
+    def wait(self, future):
+        """Block until the slot is granted or the queue timeout expires"""
+        try:
+            future.result(timeout=self.queue_timeout)
+        except Exception:
+            self.cancel(future)
+            with self._lock:
+                retry_after = self._retry_after()
+            raise AdmissionRejected('Timed out waiting for an analysis slot', retry_after)
+
+    async def wait_async(self, future):
+        """Event-loop version of wait() for the ASGI server"""
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self.cancel(future)
+            with self._lock:
+                retry_after = self._retry_after()
+            raise AdmissionRejected('Timed out waiting for an analysis slot', retry_after)
+
+    @contextmanager
+    def slot(self, client_id):
+        """Hold an analysis slot for the duration of the block (sync callers)"""
+        self.wait(self.submit(client_id))
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def _retry_after(self):
+        """Seconds until the current backlog should have drained (lock held)"""
+        backlog = self._queued + 1
+        estimate = self._avg_service_time * backlog / self.max_concurrent
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    def stats(self):
+        """Queue depth and admission counters for the metrics endpoint"""
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'active': self._active,
+                'queue_depth': self._queued,
+                'queued_clients': len(self._queues),
+                'max_queue': self.max_queue,
+                'admitted_total': self._admitted_total,
+                'rejected_total': self._rejected_total,
+                'timed_out_total': self._timed_out_total,
+                'avg_service_seconds': round(self._avg_service_time, 3)
+            }
@@ -0,0 +1,556 @@
+"""
+Analysis Pipeline
+Runs the analysis services on a saved PDF as a tiered pipeline and shapes
+the API response. Shared by the Flask app (app.py) and the async server (asgi.py).
+
+Tiers run in cost order and any tier may return a confident verdict that
+skips the rest:
+    registry  - hash is issued (or revoked) in CertificateRegistry
+    cache     - identical document was analyzed before
+    precheck  - thumbnail shows layout anomalies (aspect ratio, blur)
+    quick     - first-pass score from the text layer and page 1 at a reduced
+                dpi without the CNN models, kept when its whole uncertainty
+                interval is clear of the review band
+    full      - OCR, multi-page image, signature and layout analysis with
+                the models, and tile heatmaps
+
+Every verdict lists the tiers it went through in 'escalation_path'.
+
+With PAGE_PROCESSES > 0 the page stages of the full tier (image, signature,
+layout, localized) run in parallel in a pool of that many processes; the
+rendered pages reach them through shared memory (services/page_buffers.py).
+
+With a checkpoint store (services/page_checkpoints.py) the full tier records
+every page's OCR text and stage results as it goes, so a retry of the same
+document only renders and analyzes the pages that are still missing.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from services.ocr_service import OCRService
+from services.ocr_preprocess import OCRPreprocessor
+from services.image_analyzer import ImageAnalyzer
+from services.institution_index import InstitutionIndex
+from services.signature_checker import SignatureChecker
+from services.layout_analyzer import LayoutAnalyzer
+from services.scoring_engine import ScoringEngine
+from services.scoring_model import ScoringModelStore
+from services.result_cache import ResultCache
+from services.multipage import PageSelector, render_pages
+from services.rasterizer import render_images
+from services.tile_analyzer import TileAnalyzer
+from services.signature_matcher import SpecimenStore
+from services.seal_matcher import SealMatcher, DEFAULT_LOGO_DIR
+from services.feature_store import dhash
+from services.model_runtime import load_models_from_env
+from services.page_buffers import SharedPages, load_pages, room_for, sweep_orphans
+
+TIERS = ('registry', 'cache', 'precheck', 'quick', 'full')
+# Tiers that only need the document hash, not the file
+HASH_TIERS = ('registry', 'cache')
+# How far (0-1) each quick-tier component may be from its full-analysis value
+# (benchmarks/adaptive_depth.py measures it); the signature score's range
+# follows from these
+QUICK_MARGINS = {'seal_match': 0.15, 'layout_similarity': 0.10, 'ocr_quality': 0.20}
+
+
+class PipelinePolicy:
+    """Per-deployment early-exit policy"""
+
+    def __init__(self, tiers=TIERS, precheck_min_anomalies=2, precheck_dpi=72, precheck_score=20.0,
+                 quick_dpi=150, quick_margins=None, quick_accept_score=None, quick_reject_score=None):
+        tiers = [t for t in tiers if t in TIERS]
+        if 'full' not in tiers:
+            tiers.append('full')
+        # Keep cost order whatever order the config lists them in
+        self.tiers = [t for t in TIERS if t in tiers]
+        self.precheck_min_anomalies = precheck_min_anomalies
+        self.precheck_dpi = precheck_dpi
+        self.precheck_score = precheck_score
+        self.quick_dpi = quick_dpi
+        self.quick_margins = dict(QUICK_MARGINS, **(quick_margins or {}))
+        # The quick tier decides when its score interval lies at or above
+        # quick_accept_score or below quick_reject_score; None follows the
+        # active level thresholds (Likely Authentic and Uncertain)
+        self.quick_accept_score = quick_accept_score
+        self.quick_reject_score = quick_reject_score
+
+    @classmethod
+    def from_env(cls):
+        tiers = os.getenv('PIPELINE_TIERS', ','.join(TIERS))
+        margins = {}
+        for item in os.getenv('QUICK_MARGINS', '').split(','):
+            if '=' in item:
+                name, value = item.split('=', 1)
+                margins[name.strip()] = float(value)
+        accept, reject = os.getenv('QUICK_ACCEPT_SCORE', ''), os.getenv('QUICK_REJECT_SCORE', '')
+        return cls(
+            tiers=[t.strip() for t in tiers.split(',') if t.strip()],
+            precheck_min_anomalies=int(os.getenv('PRECHECK_MIN_ANOMALIES', 2)),
+            precheck_dpi=int(os.getenv('PRECHECK_DPI', 72)),
+            precheck_score=float(os.getenv('PRECHECK_SCORE', 20.0)),
+            quick_dpi=int(os.getenv('QUICK_DPI', 150)),
+            quick_margins=margins,
+            quick_accept_score=float(accept) if accept else None,
+            quick_reject_score=float(reject) if reject else None
+        )
+
+
+class AnalysisPipeline:
+    def __init__(self, policy=None, registry=None, result_cache=None, page_selector=None, feature_store=None,
+                 field_index=None, page_processes=None, checkpoints=None, analyzers=True):
+        """
+        analyzers: False builds only what the hash tiers and remember() need
+        (no models, seal templates or OCR), for a front end that hands file
+        tiers to other processes
+        """
+        self.policy = policy or PipelinePolicy()
+        self.registry = registry
+        self.feature_store = feature_store
+        self.field_index = field_index
+        self.checkpoints = checkpoints
+        self.page_selector = page_selector or PageSelector.from_env()
+        self.result_cache = result_cache if result_cache is not None else ResultCache()
+        self.scoring_engine = ScoringEngine(model_store=ScoringModelStore.from_env())
+        self.analyzers = analyzers
+        self.page_processes = 0
+        self._page_pool = None
+        if not analyzers:
+            return
+
+        self.ocr_service = OCRService(preprocessor=OCRPreprocessor.from_env(),
+                                      page_cache=ResultCache(int(os.getenv('OCR_PAGE_CACHE_SIZE', 1024))))
+        models = load_models_from_env()
+        # QUICK_MARGINS were measured against the model-free analyzers; with
+        # models the full tier can land further from the quick pass, so the
+        # quick tier only rejects until margins are measured per variant
+        self.quick_accepts = not models
+        seal_matcher = SealMatcher(os.getenv('LOGO_DATA_DIR', DEFAULT_LOGO_DIR))
+        specimen_store = SpecimenStore(
+            os.getenv('SIGNATURE_SPECIMEN_DIR', 'specimens/signatures'),
+            cross_issuer=os.getenv('SIGNATURE_CROSS_ISSUER', 'False') == 'True'
+        )
+        self.image_analyzer = ImageAnalyzer(
+            seal_matcher=seal_matcher,
+            logo_model=models.get('logo'),
+            logo_embedder=models.get('logo_embedding'),
+            institution_index=InstitutionIndex.from_env() if 'logo_embedding' in models else None
+        )
+        self.signature_checker = SignatureChecker(
+            specimen_store=specimen_store,
+            signature_model=models.get('signature')
+        )
+        self.layout_analyzer = LayoutAnalyzer(layout_model=models.get('layout'))
+        # The quick tier runs the same analyzers without the CNN models
+        self.quick_image_analyzer = ImageAnalyzer(seal_matcher=seal_matcher)
+        self.quick_signature_checker = SignatureChecker(specimen_store=specimen_store)
+        self.quick_layout_analyzer = LayoutAnalyzer()
+        self.tile_analyzer = TileAnalyzer(tile_size=int(os.getenv('TILE_SIZE', 64)))
+        self.localized_analysis = os.getenv('LOCALIZED_ANALYSIS', 'True') == 'True'
+        if page_processes is None:
+            page_processes = int(os.getenv('PAGE_PROCESSES', 0))
+        self.page_processes = page_processes
+
+    def analyze(self, filepath, document_hash=None, skip_hash_tiers=False):
+        """
+        Run the tiers in cost order until one returns a verdict
+        Returns: dict with the 'analysis' section of the API response,
+        including 'decided_by' (the tier that produced it) and
+        'escalation_path' (every tier run, with its time and, for the quick
+        tier, the score interval that kept or escalated it)
+        """
+        if not self.analyzers:
+            raise RuntimeError('Pipeline was built for the hash tiers only')
+        start = time.perf_counter()
+        context, path = {}, []
+        for tier in self.policy.tiers:
+            if skip_hash_tiers and tier in HASH_TIERS:
+                continue
+
+            verdict = self._traced_tier(tier, filepath, document_hash, context, path)
+            if verdict is not None:
+                verdict['decided_by'] = tier
+                verdict['escalation_path'] = path
+                verdict.setdefault('timings_ms', {})['total'] = _elapsed_ms(start)
+                if tier != 'cache':
+                    self.remember(document_hash, verdict)
+                if self.checkpoints is not None and document_hash:
+                    self.checkpoints.clear(document_hash)
+                return verdict
+
+    def decide_by_hash(self, document_hash):
+        """Run only the hash tiers (no file access); None when they cannot decide"""
+        context, path = {}, []
+        for tier in self.policy.tiers:
+            if tier not in HASH_TIERS:
+                continue
+
+            verdict = self._traced_tier(tier, None, document_hash, context, path)
+            if verdict is not None:
+                verdict['decided_by'] = tier
+                verdict['escalation_path'] = path
+                return verdict
+        return None
+
+    def _traced_tier(self, tier, filepath, document_hash, context, path):
+        """Run one tier and add its step (time, outcome, details) to the path"""
+        start = time.perf_counter()
+        context['step'] = step = {'tier': tier}
+        verdict = self._run_tier(tier, filepath, document_hash, context)
+        step['decided'] = verdict is not None
+        step['ms'] = _elapsed_ms(start)
+        path.append(step)
+        return verdict
+
+    def remember(self, document_hash, analysis):
+        """
+        Store a verdict for the cache tier, record its features and index its
+        extracted fields. Adds the closest earlier documents by perceptual
+        hash as 'near_duplicates'.
+        """
+        if self.feature_store is not None and document_hash:
+            if analysis.get('perceptual_hash'):
+                analysis['near_duplicates'] = self.feature_store.near_duplicates(
+                    analysis['perceptual_hash'], exclude=document_hash)
+            self.feature_store.append(document_hash, analysis)
+        if self.field_index is not None and document_hash:
+            self.field_index.insert(document_hash, analysis.get('ocr_data', {}).get('extracted_fields', {}))
+        if 'cache' in self.policy.tiers:
+            self.result_cache.put(document_hash, analysis)
+
+    def _run_tier(self, tier, filepath, document_hash, context):
+        if tier == 'registry':
+            return self._registry_tier(document_hash)
+        if tier == 'cache':
+            return self.result_cache.get(document_hash)
+        if tier == 'precheck':
+            return self._precheck_tier(filepath)
+        if tier == 'quick':
+            return self._quick_tier(filepath, context)
+        return self._full_analysis(filepath, context.get('ocr'), document_hash)
+
+    def _registry_tier(self, document_hash):
+        """Issued or revoked on-chain hashes decide without any parsing"""
+        if self.registry is None or document_hash is None:
+            return None
+
+        status = self.registry.registry_status(document_hash)
+        if status == 'registered':
+            return self._verdict(100.0, 'Document hash is registered in CertificateRegistry')
+        if status == 'revoked':
+            return self._verdict(0.0, 'Certificate has been revoked in CertificateRegistry')
+        return None
+
+    def _precheck_tier(self, filepath):
+        """Layout anomalies on a low-resolution first page"""
+        try:
+            thumbnails = render_images(filepath, [1], dpi=self.policy.precheck_dpi)
+        except Exception:
+            return None
+        if not thumbnails:
+            return None
+
+        anomalies = self.layout_analyzer._detect_anomalies_simple(thumbnails[0])
+        if len(anomalies) < self.policy.precheck_min_anomalies:
+            return None
+
+        layout_results = {'anomalies_detected': len(anomalies), 'anomalies': anomalies}
+        return self._verdict(self.policy.precheck_score, 'Layout anomalies detected on the first page',
+                             {'layout': layout_results})
+
+    def _quick_tier(self, filepath, context):
+        """
+        Keep the quick pass's verdict when its score stays on one side of the
+        review band however far each component is off (policy.quick_margins);
+        otherwise the document goes on to the full tier
+        """
+        step = context['step']
+        quick = self.quick_pass(filepath)
+        if quick is None:
+            step['reason'] = 'Page 1 could not be rendered'
+            return None
+        analysis_results, final_score, pages, timings = quick
+        margins = dict(self.policy.quick_margins)
+        extracted = analysis_results['ocr'].get('extracted_data', {})
+        if all(extracted.get(field) for field in self.ocr_service.required_fields):
+            # The full tier would read the same text layer, so OCR is exact
+            context['ocr'] = analysis_results['ocr']
+            margins['ocr_quality'] = 0.0
+
+        low, high = self.scoring_engine.score_interval(analysis_results, margins)
+        reject, accept = self._review_band()
+        step.update({'score': final_score['final_score'], 'score_interval': [round(low, 2), round(high, 2)],
+                     'review_band': [reject, accept]})
+        if low >= accept and not self.quick_accepts:
+            step['reason'] = f'Quick score is at least {low:.1f}, but quick accepts are off while models are loaded'
+            return None
+        if low >= accept:
+            reason = f'Quick score is at least {low:.1f} (accepted from {accept:g})'
+        elif high < reject:
+            reason = f'Quick score is at most {high:.1f} (rejected below {reject:g})'
+        else:
+            step['reason'] = f'Score interval {low:.1f}-{high:.1f} reaches the review band {reject:g}-{accept:g}'
+            return None
+
+        analysis = format_analysis(analysis_results, final_score)
+        analysis['decision_reason'] = step['reason'] = reason
+        analysis['score_interval'] = step['score_interval']
+        analysis['pages_analyzed'] = [number for number, _ in pages]
+        analysis['perceptual_hash'] = f'{dhash(pages[0][1]):016x}'
+        analysis['timings_ms'] = timings
+        return analysis
+
+    def quick_pass(self, filepath):
+        """
+        First pass without the expensive stages: text layer only (no
+        Tesseract), page 1 at quick_dpi, no CNN models, no tile heatmap
+        Returns: (analysis_results, final_score, pages, timings), or None
+        when page 1 cannot be rendered
+        """
+        timings = {}
+        timed = _timer(timings)
+
+        ocr_results = timed('ocr', self.ocr_service.extract_text_from_pdf, filepath, False)
+        try:
+            pages = timed('render', render_pages, filepath, [1], self.policy.quick_dpi)
+        except Exception:
+            pages = None
+        if not pages:
+            return None
+
+        issuer = ocr_results.get('extracted_data', {}).get('institution')
+        analysis_results = {
+            'ocr': ocr_results,
+            'image': timed('image', self.quick_image_analyzer.analyze_certificate_image, filepath, pages),
+            'signature': timed('signature', self.quick_signature_checker.check_signature_authenticity,
+                               filepath, pages, issuer),
+            'layout': timed('layout', self.quick_layout_analyzer.analyze_layout, filepath, pages)
+        }
+        return analysis_results, self.scoring_engine.calculate_authenticity_score(analysis_results), pages, timings
+
+    def _review_band(self):
+        """(reject below, accept from) scores for the quick tier"""
+        levels = {label: minimum for minimum, label in self.scoring_engine.levels()}
+        accept = self.policy.quick_accept_score
+        reject = self.policy.quick_reject_score
+        return (levels['Uncertain'] if reject is None else reject,
+                levels['Likely Authentic'] if accept is None else accept)
+
+    def _verdict(self, score, reason, analysis_results=None):
+        """Build a response for a tier that decided early"""
+        final_score = {
+            'final_score': score,
+            'fraud_likelihood': self.scoring_engine._calculate_fraud_likelihood(score),
+            'authenticity_level': self.scoring_engine._get_authenticity_level(score),
+            'confidence': 'High',
+            'score_breakdown': {}
+        }
+        analysis = format_analysis(analysis_results or {}, final_score)
+        analysis['decision_reason'] = reason
+        return analysis
+
+    def _full_analysis(self, filepath, ocr_results=None, document_hash=None):
+        """
+        Run every analysis stage (ocr_results: the quick tier's, when
+        complete). With a checkpoint store and the document hash, pages
+        finished by an earlier attempt are read back, not recomputed.
+        """
+        timings = {}
+        checkpoint = None
+        if self.checkpoints is not None and document_hash:
+            checkpoint = self.checkpoints.for_document(document_hash)
+        timed = _timer(timings)
+
+        # OCR Analysis
+        if ocr_results is None:
+            ocr_results = timed('ocr', self.ocr_service.extract_text_from_pdf, filepath, True,
+                                checkpoint.stage('ocr') if checkpoint is not None else None)
+
+        stages = ['image', 'signature', 'layout']
+        if self.localized_analysis:
+            stages.append('localized')
+
+        # Render the selected pages once for the visual analyzers
+        resumed = []
+        try:
+            numbers = self.page_selector.select(filepath)
+            if checkpoint is not None:
+                resumed = [n for n in numbers if checkpoint.has(stages, n)]
+            # Finished pages stay unrendered, except the first (perceptual hash)
+            rendered = dict(timed('render', render_pages, filepath,
+                                  [n for n in numbers if n not in resumed or n == numbers[0]]))
+            pages = [(n, rendered.get(n)) for n in numbers if n in rendered or n in resumed]
+        except Exception:
+            # Let each analyzer render (and report) on its own
+            pages = None
+
+        issuer = ocr_results.get('extracted_data', {}).get('institution')
+        if not pages and 'localized' in stages:
+            stages.remove('localized')
+
+        stage_results = None
+        if pages and self.page_processes:
+            stage_results = self._run_page_stages_in_pool(stages, filepath, pages, issuer, timings, checkpoint)
+        if stage_results is None:
+            stage_results = {stage: timed(stage, self._run_page_stage, stage, filepath, pages, issuer, checkpoint)
+                             for stage in stages}
+
+        analysis_results = {'ocr': ocr_results, **stage_results}
+
+        # Calculate final authenticity score
+        final_score = self.scoring_engine.calculate_authenticity_score(analysis_results)
+
+        analysis = format_analysis(analysis_results, final_score)
+        if pages:
+            analysis['pages_analyzed'] = [number for number, _ in pages]
+            if pages[0][1] is not None:
+                analysis['perceptual_hash'] = f'{dhash(pages[0][1]):016x}'
+        if resumed:
+            analysis['pages_resumed'] = resumed
+        analysis['timings_ms'] = timings
+        return analysis
+
+    def _run_page_stage(self, stage, filepath, pages, issuer=None, checkpoint=None):
+        if checkpoint is not None:
+            checkpoint = checkpoint.stage(stage)
+        if stage == 'image':
+            return self.image_analyzer.analyze_certificate_image(filepath, pages, checkpoint)
+        if stage == 'signature':
+            return self.signature_checker.check_signature_authenticity(filepath, pages, issuer, checkpoint)
+        if stage == 'layout':
+            return self.layout_analyzer.analyze_layout(filepath, pages, checkpoint)
+        # Localized (tile) analysis for pasted-in or swapped regions
+        return self.tile_analyzer.analyze_pages(pages, checkpoint)
+
+    def _run_page_stages_in_pool(self, stages, filepath, pages, issuer, timings, checkpoint=None):
+        """
+        Run the stages in parallel in the page processes, the pages shared
+        rather than pickled. None when shared memory is short or the pool
+        broke (a worker crashed), so the caller runs the stages here; a
+        broken pool is rebuilt on next use.
+        """
+        if not room_for(pages):
+            print("⚠️  Not enough shared memory for the pages; running page stages in-process")
+            return None
+        if self._page_pool is None:
+            sweep_orphans()
+            # spawn: this process may already run model and page threads
+            self._page_pool = ProcessPoolExecutor(max_workers=self.page_processes,
+                                                  mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=_init_page_worker)
+        try:
+            with SharedPages(pages) as shared:
+                futures = {stage: self._page_pool.submit(_run_page_stage, stage, filepath, shared, issuer,
+                                                         checkpoint)
+                           for stage in stages}
+                results = {}
+                for stage, future in futures.items():
+                    results[stage], timings[stage] = future.result()
+                return results
+        except BrokenProcessPool:
+            print("⚠️  Page process pool broke; running page stages in-process")
+            self._page_pool.shutdown(wait=False, cancel_futures=True)
+            self._page_pool = None
+            return None
+
+    def close(self):
+        if self._page_pool is not None:
+            self._page_pool.shutdown()
+            self._page_pool = None
+
+
+# Each page process builds its own analyzers once
+_page_pipeline = None
+
+
+def _init_page_worker():
+    global _page_pipeline
+    _page_pipeline = AnalysisPipeline(page_processes=0)
+
+
+def _run_page_stage(stage, filepath, shared, issuer=None, checkpoint=None):
+    """One page stage in a page process. Returns: (result, elapsed ms)"""
+    start = time.perf_counter()
+    if stage == 'localized':
+        # Tiles read the shared blocks in place; the other analyzers work on PIL copies
+        stage_checkpoint = checkpoint.stage(stage) if checkpoint is not None else None
+        result = _page_pipeline.tile_analyzer.analyze_shared_pages(shared, stage_checkpoint)
+    else:
+        result = _page_pipeline._run_page_stage(stage, filepath, load_pages(shared), issuer, checkpoint)
+    return result, _elapsed_ms(start)
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def _timer(timings):
+    """timed(stage, fn, *args): fn(*args), its time in ms recorded as timings[stage]"""
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[stage] = _elapsed_ms(start)
+    return timed
+
+
+def format_analysis(analysis_results, final_score):
+    """Shape component results and the final score into the API response"""
+    ocr_results = analysis_results.get('ocr', {})
+    image_results = analysis_results.get('image', {})
+    signature_results = analysis_results.get('signature', {})
+    layout_results = analysis_results.get('layout', {})
+    localized_results = analysis_results.get('localized', {})
+
+    analysis = {
+        'authenticity_score': final_score['final_score'],
+        'fraud_likelihood': final_score['fraud_likelihood'],
+        'authenticity_level': final_score['authenticity_level'],
+        'confidence': final_score['confidence'],
+        'score_breakdown': final_score['score_breakdown'],
+        'scoring_version': final_score.get('scoring_version'),
+        'ocr_data': {
+            'extracted_text': ocr_results.get('text', '')[:500],  # First 500 chars
+            'word_count': ocr_results.get('word_count', 0),
+            'extracted_fields': ocr_results.get('extracted_data', {})
+        },
+        'visual_analysis': {
+            'seal_match_percentage': image_results.get('seal_match_percentage', 0),
+            'seal': image_results.get('seal'),
+            'logo_classification': image_results.get('logo_classification'),
+            'layout_similarity': layout_results.get('layout_similarity', 0),
+            'layout_model': layout_results.get('layout_model'),
+            'formatting_score': image_results.get('formatting_score', 0),
+            'image_quality': image_results.get('image_quality', 0)
+        },
+        'signature_analysis': {
+            'signature_detected': signature_results.get('signature_detected', False),
+            'authenticity_score': signature_results.get('authenticity_score', 0),
+            'signature_quality': signature_results.get('signature_quality', 'Unknown'),
+            'signature_presence': signature_results.get('signature_presence'),
+            'regions': signature_results.get('regions', []),
+            'specimen_match': signature_results.get('specimen_match')
+        },
+        'layout_details': {
+            'structure_score': layout_results.get('structure_score', 0),
+            'alignment_score': layout_results.get('alignment_score', 0),
+            'anomalies_detected': layout_results.get('anomalies_detected', 0),
+            'anomalies': layout_results.get('anomalies', [])
+        }
+    }
+
+    if localized_results.get('success'):
+        analysis['localized_analysis'] = {
+            'page': localized_results.get('page'),
+            'tile_size': localized_results['tile_size'],
+            'grid': localized_results['grid'],
+            'heatmap': localized_results['heatmap'],
+            'suspicious_regions': localized_results['suspicious_regions']
+        }
+
+    return analysis
+
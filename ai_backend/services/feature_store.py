@@ -0,0 +1,219 @@
+"""
+Append-only feature store for analyzed documents
+One fixed-width record per analysis (hashes, component scores, extracted
+fields, stage timings) in a flat binary file that is read back through a
+NumPy memmap, so lookups, near-duplicate search and analytics are vectorized
+column scans instead of Python objects.
+"""
+import os
+import threading
+import time
+
+from PIL import Image
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are serialized per process only
+    fcntl = None
+
+# Append only: records store the index
+DECIDED_BY = ('registry', 'cache', 'precheck', 'full', 'quick')
+SCORE_FIELDS = ('authenticity_score', 'ocr_quality', 'layout_similarity', 'seal_match', 'signature_authenticity')
+TEXT_FIELDS = {'student_name': 64, 'institution': 64, 'degree': 64, 'date': 32}
+TIMING_STAGES = ('total', 'ocr', 'render', 'image', 'signature', 'layout', 'localized')
+
+RECORD_DTYPE = np.dtype(
+    [('sha256', 'V32'), ('phash', '<u8'), ('created', '<f8'), ('decided_by', 'u1'), ('pages', 'u1')]
+    + [(name, '<f4') for name in SCORE_FIELDS]
+    + [(name, f'S{width}') for name, width in TEXT_FIELDS.items()]
+    + [('timings_ms', '<f4', (len(TIMING_STAGES),))]
+)
+
+# Popcount of every byte value, for Hamming distances between hashes
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: brightness gradients of a 9x8 thumbnail"""
+    thumb = np.asarray(image.convert('L').resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def _digest(document_hash):
+    """'0x'-prefixed hex digest as the raw 32-byte column value"""
+    return np.void(bytes.fromhex(document_hash[2:] if document_hash.startswith('0x') else document_hash))
+
+
+def _text(value, width):
+    """UTF-8 encode and cut on a character boundary to fit the column"""
+    encoded = (value or '').encode('utf-8')[:width]
+    return encoded.decode('utf-8', 'ignore').encode('utf-8')
+
+
+class FeatureStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = None
+        self._mapped = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Drop a torn trailing record left by a crash mid-append
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD_DTYPE.itemsize:
+                os.truncate(path, size - size % RECORD_DTYPE.itemsize)
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv('FEATURE_STORE_PATH', 'data/features.bin')
+        return cls(path) if path else None
+
+    @staticmethod
+    def to_record(document_hash, analysis):
+        """Compact record from the 'analysis' section of an API response"""
+        record = np.zeros((), dtype=RECORD_DTYPE)
+        record['sha256'] = _digest(document_hash)
+        record['phash'] = int(analysis.get('perceptual_hash') or '0', 16)
+        record['created'] = time.time()
+        decided_by = analysis.get('decided_by', 'full')
+        record['decided_by'] = DECIDED_BY.index(decided_by) if decided_by in DECIDED_BY else len(DECIDED_BY)
+        record['pages'] = min(len(analysis.get('pages_analyzed', [])), 255)
+
+        breakdown = analysis.get('score_breakdown', {})
+        record['authenticity_score'] = analysis.get('authenticity_score', 0)
+        for name in SCORE_FIELDS[1:]:
+            record[name] = breakdown.get(name, np.nan)
+
+        fields = analysis.get('ocr_data', {}).get('extracted_fields', {})
+        dates = fields.get('dates') or ['']
+        values = dict(fields, date=dates[0])
+        for name, width in TEXT_FIELDS.items():
+            record[name] = _text(values.get(name), width)
+
+        timings = analysis.get('timings_ms', {})
+        record['timings_ms'] = [timings.get(stage, np.nan) for stage in TIMING_STAGES]
+        return record
+
+    def append(self, document_hash, analysis):
+        """Append one record; a single write so concurrent appenders never interleave"""
+        if not document_hash:
+            return
+        data = self.to_record(document_hash, analysis).tobytes()
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(data)
+                    f.flush()
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def records(self):
+        """All records as a read-only structured memmap (re-mapped when the file grew)"""
+        with self._lock:
+            count = os.path.getsize(self.path) // RECORD_DTYPE.itemsize if os.path.exists(self.path) else 0
+            if count == 0:
+                return np.zeros(0, dtype=RECORD_DTYPE)
+            if count != self._mapped:
+                self._records = np.memmap(self.path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+                self._mapped = count
+            return self._records
+
+    def __len__(self):
+        return len(self.records())
+
+    def lookup(self, document_hash):
+        """Latest record for a document, as a dict, or None"""
+        records = self.records()
+        matches = np.flatnonzero(records['sha256'] == _digest(document_hash))
+        if len(matches) == 0:
+            return None
+        return self.to_dict(records[matches[-1]])
+
+    def near_duplicates(self, phash, max_distance=6, exclude=None, limit=5):
+        """
+        Other documents whose perceptual hash is within max_distance bits
+        Returns: list of dicts with document_hash and distance, closest first
+        """
+        records = self.records()
+        if not phash or len(records) == 0:
+            return []
+        phash = int(phash, 16) if isinstance(phash, str) else int(phash)
+        xor = np.bitwise_xor(records['phash'], np.uint64(phash))
+        distance = _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+        candidates = (distance <= max_distance) & (records['phash'] != 0)
+        if exclude:
+            candidates &= records['sha256'] != _digest(exclude)
+        indices = np.flatnonzero(candidates)
+
+        # One entry per document (its closest record)
+        seen, results = set(), []
+        for index in indices[np.argsort(distance[indices], kind='stable')]:
+            digest = bytes(records['sha256'][index])
+            if digest in seen:
+                continue
+            seen.add(digest)
+            results.append({'document_hash': '0x' + digest.hex(), 'distance': int(distance[index])})
+            if len(results) == limit:
+                break
+        return results
+
+    def _selected(self, latest_only):
+        records = self.records()
+        if latest_only and len(records):
+            # Last occurrence of every document
+            _, first_in_reversed = np.unique(records['sha256'][::-1], return_index=True)
+            records = records[np.sort(len(records) - 1 - first_in_reversed)]
+        return records
+
+    def score_matrix(self, latest_only=True):
+        """
+        Component scores as a (documents x components) array for re-scoring,
+        columns in SCORE_FIELDS order
+        """
+        records = self._selected(latest_only)
+        if len(records) == 0:
+            return np.zeros((0, len(SCORE_FIELDS)), dtype=np.float32)
+        return np.stack([records[name] for name in SCORE_FIELDS], axis=1)
+
+    def document_hashes(self, latest_only=True):
+        """'0x'-prefixed document hashes, one per score_matrix() row"""
+        return ['0x' + bytes(digest).hex() for digest in self._selected(latest_only)['sha256']]
+
+    def stats(self):
+        records = self.records()
+        if len(records) == 0:
+            return {'records': 0, 'documents': 0}
+        decided = np.bincount(records['decided_by'], minlength=len(DECIDED_BY))
+        full = records['decided_by'] == DECIDED_BY.index('full')
+        return {
+            'records': int(len(records)),
+            'documents': int(len(np.unique(records['sha256']))),
+            'decided_by': {name: int(decided[i]) for i, name in enumerate(DECIDED_BY)},
+            'mean_authenticity_score': round(float(records['authenticity_score'].mean()), 2),
+            'full_analysis_p50_ms': round(float(np.median(records['timings_ms'][full, 0])), 1) if full.any() else None
+        }
+
+    @staticmethod
+    def to_dict(record):
+        result = {
+            'document_hash': '0x' + bytes(record['sha256']).hex(),
+            'perceptual_hash': f"{int(record['phash']):016x}",
+            'created': float(record['created']),
+            'decided_by': DECIDED_BY[record['decided_by']] if record['decided_by'] < len(DECIDED_BY) else None,
+            'pages': int(record['pages'])
+        }
+        for name in SCORE_FIELDS:
+            result[name] = None if np.isnan(record[name]) else round(float(record[name]), 2)
+        for name in TEXT_FIELDS:
+            result[name] = bytes(record[name]).decode('utf-8', 'ignore')
+        result['timings_ms'] = {stage: round(float(v), 1) for stage, v in zip(TIMING_STAGES, record['timings_ms'])
+                                if not np.isnan(v)}
+        return result
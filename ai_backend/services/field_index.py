@@ -0,0 +1,143 @@
+"""
+Indexed history of extracted certificate fields
+SQLite table of student name, degree, institution and dates per document,
+with B-tree indexes on normalized values for exact lookups ("how many
+documents claim this name at this institution") and an FTS5 table for
+token search across all fields.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+FIELDS = ('student_name', 'degree', 'institution')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    document_hash TEXT NOT NULL UNIQUE,
+    student_name TEXT,
+    degree TEXT,
+    institution TEXT,
+    dates TEXT,
+    student_name_key TEXT,
+    degree_key TEXT,
+    institution_key TEXT,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS idx_name_institution ON documents (student_name_key, institution_key);
+CREATE INDEX IF NOT EXISTS idx_institution ON documents (institution_key);
+CREATE INDEX IF NOT EXISTS idx_degree ON documents (degree_key);
+CREATE TABLE IF NOT EXISTS document_dates (
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    date_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_date ON document_dates (date_key, document_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS fields_fts USING fts5 (
+    student_name, degree, institution, dates,
+    content='documents', content_rowid='id'
+);
+'''
+
+
+def normalize(value):
+    """Case- and whitespace-insensitive key for exact matching"""
+    return re.sub(r'\s+', ' ', (value or '').strip()).lower() or None
+
+
+def _fts_query(text):
+    """Quote every token so user input is never parsed as FTS5 syntax"""
+    tokens = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{token}"' for token in tokens)
+
+
+class FieldIndex:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        # WAL lets readers in other server processes run alongside the writer
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv('FIELD_INDEX_PATH', 'data/fields.db')
+        return cls(path) if path else None
+
+    def insert(self, document_hash, fields):
+        """Index a document's extracted fields (first analysis of a hash wins)"""
+        if not document_hash or not any(fields.get(name) for name in FIELDS + ('dates',)):
+            return False
+
+        dates = list(dict.fromkeys(d for d in (normalize(d) for d in fields.get('dates') or []) if d))
+        values = [fields.get(name) for name in FIELDS]
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO documents (document_hash, student_name, degree, institution, dates, '
+                'student_name_key, degree_key, institution_key, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (document_hash) DO NOTHING',
+                [document_hash, *values, ', '.join(dates)] + [normalize(v) for v in values] + [time.time()]
+            )
+            if cursor.rowcount == 0:
+                return False
+            row_id = cursor.lastrowid
+            self._conn.executemany('INSERT INTO document_dates (document_id, date_key) VALUES (?, ?)',
+                                   [(row_id, d) for d in dates])
+            self._conn.execute(
+                'INSERT INTO fields_fts (rowid, student_name, degree, institution, dates) VALUES (?, ?, ?, ?, ?)',
+                [row_id, *values, ' '.join(dates)]
+            )
+        return True
+
+    def search(self, student_name=None, degree=None, institution=None, date=None, text=None, limit=50):
+        """
+        Documents matching every given field exactly (case and spacing
+        insensitive) and, with text, containing all of its tokens in any field
+        Returns: dict with the total count and up to limit documents, newest first
+        """
+        clauses, params = [], []
+        for name, value in (('student_name', student_name), ('degree', degree), ('institution', institution)):
+            if value:
+                clauses.append(f'd.{name}_key = ?')
+                params.append(normalize(value))
+        if date:
+            clauses.append('d.id IN (SELECT document_id FROM document_dates WHERE date_key = ?)')
+            params.append(normalize(date))
+        if text:
+            query = _fts_query(text)
+            if not query:
+                return {'count': 0, 'documents': []}
+            clauses.append('d.id IN (SELECT rowid FROM fields_fts WHERE fields_fts MATCH ?)')
+            params.append(query)
+        if not clauses:
+            raise ValueError('At least one search field is required')
+
+        where = ' AND '.join(clauses)
+        with self._lock:
+            count = self._conn.execute(f'SELECT COUNT(*) FROM documents d WHERE {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                'SELECT document_hash, student_name, degree, institution, dates, created '
+                f'FROM documents d WHERE {where} ORDER BY d.id DESC LIMIT ?', params + [int(limit)]
+            ).fetchall()
+
+        documents = []
+        for row in rows:
+            document = dict(row)
+            document['dates'] = document['dates'].split(', ') if document['dates'] else []
+            documents.append(document)
+        return {'count': count, 'documents': documents}
+
+    def stats(self):
+        with self._lock:
+            return {'documents': self._conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
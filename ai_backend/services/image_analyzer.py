@@ -2,41 +2,41 @@
 Simplified Image Analysis Service (without OpenCV dependency)
 Works with basic PIL/Pillow operations
 """
-from pdf2image import convert_from_path
 from PIL import Image, ImageStat
 import numpy as np
 
+from services.multipage import render_first_page, map_pages, page_size, to_page_bbox
+
 class ImageAnalyzer:
-    def __init__(self):
-        self.seal_templates = []
+    def __init__(self, seal_matcher=None, logo_model=None, logo_embedder=None, institution_index=None):
+        # Template matcher over the reference logos; falls back to the
+        # logo classifier, then the variance heuristic
+        self.seal_matcher = seal_matcher
+        # Optional trained classifier (services/model_runtime.py)
+        self.logo_model = logo_model
+        # Optional nearest-prototype recognition (services/institution_index.py);
+        # used instead of the classifier once institutions are enrolled
+        self.logo_embedder = logo_embedder
+        self.institution_index = institution_index
     
-    def analyze_certificate_image(self, pdf_path):
+    def analyze_certificate_image(self, pdf_path, pages=None, checkpoint=None):
         """
         Analyze certificate for visual elements using PIL
+        pages: optional list of (page_number, image) already rendered;
+        defaults to the first page
+        checkpoint: optional per-page checkpoint (see multipage.map_pages)
         Returns: dict with seal detection, logo matching, and layout analysis
         """
         try:
             # Convert PDF to image
-            images = convert_from_path(pdf_path, dpi=300)
-            if not images:
+            if pages is None:
+                pages = render_first_page(pdf_path)
+            if not pages:
                 return {'success': False, 'error': 'Failed to convert PDF to image'}
             
-            # Analyze first page
-            image = images[0]
-            
-            # Basic image analysis using PIL
-            seal_score = self._detect_seals_simple(image)
-            layout_score = self._analyze_layout_simple(image)
-            formatting_score = self._analyze_formatting_simple(image)
-            image_quality = self._assess_image_quality_simple(image)
-            
-            return {
-                'success': True,
-                'seal_match_percentage': seal_score,
-                'layout_similarity': layout_score,
-                'formatting_score': formatting_score,
-                'image_quality': image_quality
-            }
+            # Analyze every page in parallel and combine
+            page_results = map_pages(self._analyze_page, pages, checkpoint=checkpoint)
+            return self._aggregate(page_results)
         except Exception as e:
             return {
                 'success': False,
@@ -45,6 +45,78 @@ class ImageAnalyzer:
                 'layout_similarity': 0
             }
     
+    def _analyze_page(self, image):
+        """Basic image analysis of one page using PIL"""
+        seal, logo_crop = self._match_seal(image)
+        logo = self._classify_logo(image, logo_crop)
+        # Below the acceptance threshold the matcher reports no institution;
+        # its correlation then says nothing about a seal
+        if seal and seal['institution']:
+            seal_score = round(seal['score'] * 100, 2)
+        elif logo:
+            seal_score = round(logo['confidence'] * 100, 2)
+        else:
+            seal_score = self._detect_seals_simple(image)
+        return {
+            'seal_match_percentage': seal_score,
+            'seal': seal,
+            'logo_classification': logo,
+            'layout_similarity': self._analyze_layout_simple(image),
+            'formatting_score': self._analyze_formatting_simple(image),
+            'image_quality': self._assess_image_quality_simple(image)
+        }
+    
+    def _match_seal(self, image):
+        """
+        Best reference logo on the page and its crop (None without templates,
+        or no crop when no logo was found)
+        """
+        if self.seal_matcher is None or not self.seal_matcher.ready:
+            return None, None
+        match = self.seal_matcher.match(image)
+        if match is None:
+            return None, None
+        crop = None
+        if match['bbox']:
+            x, y, w, h = match['bbox']
+            crop = image.crop((x, y, x + w, y + h))
+        return {
+            'institution': match['institution'],
+            'score': match['score'],
+            'bbox': to_page_bbox(image, match['bbox']) if match['bbox'] else None
+        }, crop
+
+    def _classify_logo(self, image, logo_crop=None):
+        """Institution from the logo crop (or the whole page) with the configured model"""
+        if self.logo_embedder is not None and self.institution_index is not None and len(self.institution_index):
+            match = self.institution_index.classify(self.logo_embedder.embed(logo_crop or image))
+            return {**match, 'method': 'embedding'}
+        if self.logo_model is not None:
+            # Heads of the fused model read the whole page
+            target = image if getattr(self.logo_model, 'page_level', False) else (logo_crop or image)
+            return {**self.logo_model.classify(target), 'method': 'classifier'}
+        return None
+    
+    def _aggregate(self, page_results):
+        """Seal score comes from the best page, the rest is averaged"""
+        results = [r for _, r in page_results]
+        best_page, best = max(page_results, key=lambda item: item[1]['seal_match_percentage'])
+        
+        def mean(key):
+            return sum(r[key] for r in results) / len(results)
+        
+        return {
+            'success': True,
+            'seal_match_percentage': best['seal_match_percentage'],
+            'seal': best['seal'],
+            'logo_classification': best['logo_classification'],
+            'layout_similarity': mean('layout_similarity'),
+            'formatting_score': mean('formatting_score'),
+            'image_quality': mean('image_quality'),
+            'seal_page': best_page,
+            'pages_analyzed': [number for number, _ in page_results]
+        }
+    
     def _detect_seals_simple(self, image):
         """Simple seal detection using image statistics"""
         try:
@@ -70,8 +142,8 @@ class ImageAnalyzer:
     def _analyze_layout_simple(self, image):
         """Simple layout analysis"""
         try:
-            # Get image dimensions
-            width, height = image.size
+            # Full page dimensions (the image may be cropped to its content)
+            width, height = page_size(image)
             
             # Check aspect ratio (typical certificate is landscape or portrait)
             aspect_ratio = width / height if height > 0 else 1
@@ -104,8 +176,8 @@ class ImageAnalyzer:
     def _assess_image_quality_simple(self, image):
         """Simple image quality assessment"""
         try:
-            # Check image size (higher resolution = better quality)
-            width, height = image.size
+            # Check page size (higher resolution = better quality)
+            width, height = page_size(image)
             total_pixels = width * height
             
             # Score based on resolution
@@ -0,0 +1,328 @@
+"""
+Inference sidecar shared by every server and analysis process
+One process owns the models (services/model_runtime.py) instead of every
+gunicorn worker and analysis process loading its own copy. Clients send
+preprocessed pixel tensors through shared memory and a short request over a
+Unix socket. Requests from all processes are gathered per model into
+batches of up to INFERENCE_MAX_BATCH, waiting at most INFERENCE_MAX_WAIT_MS
+for the batch to fill.
+
+    python manage.py serve-inference       # or started by gunicorn.conf.py
+
+INFERENCE_SOCKET: socket path; when set, load_models_from_env() returns
+                  proxies to the sidecar (default: unset, models in-process)
+INFERENCE_MAX_BATCH: largest batch per model run (default 4; activations
+                     take about 60 MB per 300x450 layout page)
+INFERENCE_MAX_WAIT_MS: how long a request waits for others to join (default 5)
+
+Wire format, both directions: 8-byte header (JSON length, payload length),
+JSON, payload. Requests carry no payload; responses carry the float32
+outputs back to back, their names and shapes in the JSON.
+"""
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from services.page_buffers import attach_shared_memory
+
+HEADER = struct.Struct('!II')
+
+
+def _receive_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Inference connection closed')
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock, message, payload=b''):
+    body = json.dumps(message).encode()
+    sock.sendall(HEADER.pack(len(body), len(payload)) + body + payload)
+
+
+def receive_message(sock):
+    body_size, payload_size = HEADER.unpack(_receive_exactly(sock, HEADER.size))
+    message = json.loads(_receive_exactly(sock, body_size))
+    return message, _receive_exactly(sock, payload_size) if payload_size else b''
+
+
+class _Batcher:
+    """Collects requests for one model and runs them as batches on one thread"""
+
+    def __init__(self, model, max_batch, max_wait):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, batch):
+        future = Future()
+        self._queue.put((batch, future))
+        return future
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            rows = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                rows += len(pending[-1][0])
+
+            try:
+                outputs = self.model.predict_outputs(np.concatenate([batch for batch, _ in pending]))
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += rows
+            start = 0
+            for batch, future in pending:
+                stop = start + len(batch)
+                future.set_result({name: value[start:stop] for name, value in outputs.items()})
+                start = stop
+
+
+class InferenceServer:
+    def __init__(self, models, socket_path, max_batch=4, max_wait=0.005):
+        """models: dict name -> ClassifierModel (model_runtime.load_env_models())"""
+        self.models = models
+        self.socket_path = socket_path
+        self._batchers = {name: _Batcher(model, max_batch, max_wait) for name, model in models.items()}
+        self._server = None
+
+    @classmethod
+    def from_env(cls):
+        from services.model_runtime import load_env_models
+        return cls(load_env_models(), os.environ['INFERENCE_SOCKET'],
+                   max_batch=int(os.getenv('INFERENCE_MAX_BATCH', 4)),
+                   max_wait=float(os.getenv('INFERENCE_MAX_WAIT_MS', 5)) / 1000)
+
+    def describe(self):
+        return {name: {'variant': model.variant, 'classes': model.classes, 'path': model.path,
+                       'input_size': [int(v) for v in model.input_size],
+                       'output_names': model.output_names}
+                for name, model in self.models.items()}
+
+    def stats(self):
+        return {name: {'batches': b.batches, 'items': b.items,
+                       'mean_batch': round(b.items / b.batches, 2) if b.batches else 0}
+                for name, b in self._batchers.items()}
+
+    def _handle(self, sock):
+        """Serve one client connection until it closes"""
+        segments = {}
+        try:
+            while True:
+                request, _ = receive_message(sock)
+                op = request.get('op')
+                if op == 'describe':
+                    send_message(sock, {'models': self.describe()})
+                elif op == 'stats':
+                    send_message(sock, {'stats': self.stats()})
+                elif op == 'run':
+                    self._run(sock, request, segments)
+                else:
+                    send_message(sock, {'error': f'Unknown op: {op}'})
+        except ConnectionError:
+            # Closed, or dropped by a client that gave up on a timed-out request
+            return
+        finally:
+            for segment in segments.values():
+                segment.close()
+
+    def _run(self, sock, request, segments):
+        name = request['shm']
+        segment = segments.get(name)
+        if segment is None:
+            # A new name means the client replaced (and unlinked) its buffer;
+            # only this mapping would still hold the old one's memory
+            for old in segments.values():
+                old.close()
+            segments.clear()
+            segment = segments[name] = attach_shared_memory(name)
+        shape = tuple(request['shape'])
+        # Copied into the batch before the reply, so the client may reuse its buffer afterwards
+        batch = np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+        batcher = self._batchers.get(request['model'])
+        if batcher is None:
+            send_message(sock, {'error': f"Unknown model: {request['model']}"})
+            return
+        try:
+            outputs = batcher.submit(batch.copy()).result()
+        except Exception as e:
+            send_message(sock, {'error': str(e)})
+            return
+        names = list(outputs)
+        payload = b''.join(np.ascontiguousarray(outputs[n], dtype=np.float32).tobytes() for n in names)
+        send_message(sock, {'outputs': [[n, list(outputs[n].shape)] for n in names]}, payload)
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server_self = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server_self._handle(self.request)
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+            # Every page thread of every worker holds a connection
+            request_queue_size = 256
+
+        self._server = Server(self.socket_path, Handler)
+        print(f"✅ Inference sidecar serving {', '.join(self.models) or 'no models'} on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class _ThreadChannel:
+    """One thread's connection and input buffer; the buffer is unlinked with it"""
+
+    def __init__(self, socket_path, timeout):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Connect blocking: with a timeout set, a full accept queue fails at once
+        self.sock.connect(socket_path)
+        self.sock.settimeout(timeout)
+        self.segment = None
+        self._finalizer = weakref.finalize(self, _ThreadChannel._release, self.sock, [None])
+
+    @staticmethod
+    def _release(sock, holder):
+        sock.close()
+        if holder[0] is not None:
+            holder[0].close()
+            holder[0].unlink()
+
+    def buffer(self, size):
+        """A shared-memory segment of at least size bytes, reused between requests"""
+        if self.segment is None or self.segment.size < size:
+            if self.segment is not None:
+                self.segment.close()
+                self.segment.unlink()
+            # Round up so growing pages do not reallocate every request
+            self.segment = shared_memory.SharedMemory(create=True, size=max(size, 1 << 20))
+            self._finalizer.detach()
+            self._finalizer = weakref.finalize(self, _ThreadChannel._release, self.sock, [self.segment])
+        return self.segment
+
+
+class InferenceClient:
+    """Client side of the sidecar; safe to share between threads"""
+
+    def __init__(self, socket_path, timeout=60.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _channel(self):
+        channel = getattr(self._local, 'channel', None)
+        if channel is None:
+            channel = self._local.channel = _ThreadChannel(self.socket_path, self.timeout)
+        return channel
+
+    def _request(self, message, batch=None):
+        # One reconnect if the sidecar restarted since the last request
+        for attempt in (0, 1):
+            try:
+                channel = self._channel()
+            except OSError:
+                if attempt:
+                    raise
+                continue
+            try:
+                if batch is not None:
+                    segment = channel.buffer(batch.nbytes)
+                    np.ndarray(batch.shape, dtype=np.uint8, buffer=segment.buf)[:] = batch
+                    message = dict(message, shm=segment.name, shape=list(batch.shape))
+                send_message(channel.sock, message)
+                response, payload = receive_message(channel.sock)
+                break
+            except ConnectionError:
+                self._local.channel = None
+                if attempt:
+                    raise
+            except OSError:
+                # A timeout: the sidecar may still be running the request, so
+                # it is not sent again; the connection may yet get its reply
+                self._local.channel = None
+                raise
+        if 'error' in response:
+            raise RuntimeError(f"Inference sidecar: {response['error']}")
+        return response, payload
+
+    def wait_ready(self, timeout=60.0):
+        """Block until the sidecar accepts connections (it may still be loading models)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.describe()
+            except (ConnectionError, OSError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def describe(self):
+        return self._request({'op': 'describe'})[0]['models']
+
+    def stats(self):
+        return self._request({'op': 'stats'})[0]['stats']
+
+    def run(self, model, batch):
+        """Outputs of a model for a uint8 batch (N, H, W, 3), by output name"""
+        response, payload = self._request({'op': 'run', 'model': model}, np.ascontiguousarray(batch, dtype=np.uint8))
+        outputs, offset = {}, 0
+        for name, shape in response['outputs']:
+            count = int(np.prod(shape))
+            outputs[name] = np.frombuffer(payload, dtype=np.float32, count=count, offset=offset).reshape(shape)
+            offset += count * 4
+        return outputs
+
+
+class RemoteBackend:
+    """model_runtime backend that forwards to the sidecar"""
+
+    # Requests from several page threads are what the sidecar batches
+    thread_safe = True
+
+    def __init__(self, client, name, description):
+        self.client = client
+        self.name = name
+        self.input_size = tuple(description['input_size'])
+        self.output_names = description['output_names']
+
+    def run(self, batch):
+        outputs = self.client.run(self.name, batch)
+        return [outputs[name] for name in self.output_names]
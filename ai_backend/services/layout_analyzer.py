@@ -1,42 +1,40 @@
 """
 Simplified Layout Analyzer (without OpenCV)
 """
-from pdf2image import convert_from_path
 from PIL import Image, ImageStat, ImageFilter
 import numpy as np
 
+from services.multipage import render_first_page, map_pages, page_size
+
 class LayoutAnalyzer:
-    def __init__(self):
+    def __init__(self, layout_model=None):
         self.reference_layouts = []
+        # Optional trained classifier (services/model_runtime.py); its
+        # probability replaces the heuristic layout similarity, but only
+        # when it was trained with forged pages as negatives
+        if layout_model is not None and not getattr(layout_model, 'has_negatives', False):
+            print("⚠️  Layout model has no negative class; using layout heuristics (see ML_FUSED)")
+            layout_model = None
+        self.layout_model = layout_model
     
-    def analyze_layout(self, pdf_path):
+    def analyze_layout(self, pdf_path, pages=None, checkpoint=None):
         """
         Analyze document layout using PIL
+        pages: optional list of (page_number, image) already rendered;
+        defaults to the first page
+        checkpoint: optional per-page checkpoint (see multipage.map_pages)
         Returns: dict with layout analysis results
         """
         try:
             # Convert PDF to image
-            images = convert_from_path(pdf_path, dpi=300)
-            if not images:
+            if pages is None:
+                pages = render_first_page(pdf_path)
+            if not pages:
                 return {'success': False, 'error': 'Failed to convert PDF'}
             
-            image = images[0]
-            
-            # Analyze layout
-            structure_score = self._analyze_structure_simple(image)
-            alignment_score = self._check_alignment_simple(image)
-            anomalies = self._detect_anomalies_simple(image)
-            
-            overall_score = (structure_score + alignment_score) / 2
-            
-            return {
-                'success': True,
-                'layout_similarity': overall_score,
-                'structure_score': structure_score,
-                'alignment_score': alignment_score,
-                'anomalies_detected': len(anomalies),
-                'anomalies': anomalies
-            }
+            # Analyze every page in parallel and combine
+            page_results = map_pages(self._analyze_page, pages, checkpoint=checkpoint)
+            return self._aggregate(page_results)
         except Exception as e:
             return {
                 'success': False,
@@ -44,6 +42,48 @@ class LayoutAnalyzer:
                 'layout_similarity': 0
             }
     
+    def _analyze_page(self, image):
+        """Analyze the layout of one page"""
+        return {
+            'structure_score': self._analyze_structure_simple(image),
+            'alignment_score': self._check_alignment_simple(image),
+            'model_score': self._classify_layout(image),
+            'anomalies': self._detect_anomalies_simple(image)
+        }
+    
+    def _classify_layout(self, image):
+        """Layout model probability as a 0-100 score, or None without a model"""
+        if self.layout_model is None:
+            return None
+        return round(self.layout_model.classify(image)['confidence'] * 100, 2)
+    
+    def _aggregate(self, page_results):
+        """Average the scores and collect anomalies from every page"""
+        count = len(page_results)
+        structure_score = sum(r['structure_score'] for _, r in page_results) / count
+        alignment_score = sum(r['alignment_score'] for _, r in page_results) / count
+        
+        anomalies = []
+        for number, result in page_results:
+            for anomaly in result['anomalies']:
+                anomalies.append(anomaly if count == 1 else f'{anomaly} (page {number})')
+        
+        overall_score = (structure_score + alignment_score) / 2
+        model_scores = [r['model_score'] for _, r in page_results if r['model_score'] is not None]
+        if model_scores:
+            overall_score = sum(model_scores) / len(model_scores)
+        
+        return {
+            'success': True,
+            'layout_similarity': overall_score,
+            'layout_model': self.layout_model.variant if model_scores else None,
+            'structure_score': structure_score,
+            'alignment_score': alignment_score,
+            'anomalies_detected': len(anomalies),
+            'anomalies': anomalies,
+            'pages_analyzed': [number for number, _ in page_results]
+        }
+    
     def _analyze_structure_simple(self, image):
         """Simple structure analysis"""
         try:
@@ -94,8 +134,8 @@ class LayoutAnalyzer:
             if variance < 500:
                 anomalies.append('Low image quality or blur detected')
             
-            # Check aspect ratio
-            width, height = image.size
+            # Check aspect ratio of the full page, not the content crop
+            width, height = page_size(image)
             aspect_ratio = width / height if height > 0 else 1
             
             if aspect_ratio < 0.5 or aspect_ratio > 2.5:
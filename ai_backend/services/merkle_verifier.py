@@ -0,0 +1,259 @@
+"""
+Merkle Proof Verifier for batch-anchored certificates
+Checks inclusion proofs locally against cached CertificateRegistry roots.
+The cache follows the registry: new events are pulled every
+REGISTRY_REFRESH_SECONDS, and a proof whose root is not cached triggers a
+pull at most every REGISTRY_MISS_REFRESH_SECONDS. Each pull only asks for
+blocks after the last one seen.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def sha256_hex(data):
+    """SHA-256 of raw bytes as a 0x-prefixed hex string (same format as the registry)"""
+    return '0x' + hashlib.sha256(data).hexdigest()
+
+
+def _to_bytes32(value):
+    """Convert a 0x-prefixed (or bare) hex string to 32 raw bytes"""
+    if isinstance(value, (bytes, bytearray)):
+        raw = bytes(value)
+    else:
+        value = value.strip().lower()
+        if value.startswith('0x'):
+            value = value[2:]
+        raw = bytes.fromhex(value)
+    if len(raw) != 32:
+        raise ValueError('Expected a 32-byte hash')
+    return raw
+
+
+def _hash_pair(a, b):
+    """Hash two nodes in sorted order so proofs do not need left/right flags"""
+    if a > b:
+        a, b = b, a
+    return hashlib.sha256(a + b).digest()
+
+
+def _leaf(document_hash):
+    """Leaves are double-hashed so an inner node can never pass as a leaf"""
+    return hashlib.sha256(document_hash).digest()
+
+
+class MerkleVerifier:
+    def __init__(self, roots_file=None, rpc_url=None, contract_address=None, refresh_interval=60.0,
+                 miss_interval=10.0):
+        self.roots_file = roots_file
+        self.rpc_url = rpc_url
+        self.contract_address = contract_address
+        self.known_roots = set()
+        # Individually issued / revoked certificate hashes (CertificateIssued events)
+        self.registered_hashes = set()
+        self.revoked_hashes = set()
+        self._lock = threading.Lock()
+        # Background pull period, and the least time between pulls on a miss
+        self.refresh_interval = refresh_interval
+        self.miss_interval = miss_interval
+        # First block not yet pulled; one pull at a time
+        self._next_block = 0
+        self._refreshed = None
+        self._refresh_lock = threading.Lock()
+
+        if roots_file:
+            self.load_roots_file(roots_file)
+
+    @classmethod
+    def from_env(cls):
+        """Build a verifier from MERKLE_ROOTS_FILE / REGISTRY_RPC_URL / REGISTRY_CONTRACT_ADDRESS"""
+        return cls(
+            roots_file=os.getenv('MERKLE_ROOTS_FILE'),
+            rpc_url=os.getenv('REGISTRY_RPC_URL'),
+            contract_address=os.getenv('REGISTRY_CONTRACT_ADDRESS'),
+            refresh_interval=float(os.getenv('REGISTRY_REFRESH_SECONDS', 60)),
+            miss_interval=float(os.getenv('REGISTRY_MISS_REFRESH_SECONDS', 10))
+        )
+
+    def load_roots_file(self, path):
+        """
+        Load known roots from a JSON file: either a list of hex roots
+        or an object with a "roots" list
+        """
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            roots = data.get('roots', []) if isinstance(data, dict) else data
+            self.add_roots(roots)
+            return len(roots)
+        except (OSError, ValueError):
+            return 0
+
+    def add_roots(self, roots):
+        """Add roots to the in-memory cache"""
+        parsed = {_to_bytes32(root) for root in roots}
+        with self._lock:
+            self.known_roots |= parsed
+
+    def registry_status(self, document_hash):
+        """
+        Look up a document hash in the cached registry events.
+        Returns: 'registered', 'revoked' or None when unknown
+        """
+        try:
+            key = _to_bytes32(document_hash)
+        except (ValueError, TypeError, AttributeError):
+            return None
+        with self._lock:
+            if key in self.revoked_hashes:
+                return 'revoked'
+            if key in self.registered_hashes:
+                return 'registered'
+        return None
+
+    def refresh_from_registry(self):
+        """
+        Pull anchored roots (MerkleRootAnchored) and issued/revoked certificate
+        hashes from CertificateRegistry's events, from the block after the
+        last pull on.
+        Needs web3 (optional); returns the number of roots now cached.
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        if not (self.rpc_url and self.contract_address):
+            return len(self.known_roots)
+
+        try:
+            from web3 import Web3
+        except ImportError:
+            return len(self.known_roots)
+
+        self._refreshed = time.monotonic()
+        w3 = Web3(Web3.HTTPProvider(self.rpc_url))
+        address = Web3.to_checksum_address(self.contract_address)
+        latest = w3.eth.block_number
+        if latest < self._next_block:
+            return len(self.known_roots)
+
+        def first_indexed_args(signature):
+            logs = w3.eth.get_logs({
+                'address': address,
+                'fromBlock': self._next_block,
+                'toBlock': latest,
+                'topics': [Web3.keccak(text=signature)]
+            })
+            return {bytes(log['topics'][1]) for log in logs}
+
+        roots = first_indexed_args('MerkleRootAnchored(bytes32,address)')
+        issued = first_indexed_args('CertificateIssued(bytes32,string,address)')
+        revoked = first_indexed_args('CertificateRevoked(bytes32,address)')
+        self.add_roots(roots)
+        with self._lock:
+            self.registered_hashes |= issued
+            self.revoked_hashes |= revoked
+        # Only after every query succeeded, so a failed pull is retried whole
+        self._next_block = latest + 1
+        return len(self.known_roots)
+
+    def refresh_if_stale(self, max_age):
+        """
+        Pull new events when the last pull is at least max_age seconds old
+        and no other thread is pulling. Returns: whether a pull ran
+        """
+        if not (self.rpc_url and self.contract_address):
+            return False
+        if self._refreshed is not None and time.monotonic() - self._refreshed < max_age:
+            return False
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._refresh()
+            return True
+        except Exception as e:
+            print(f"⚠️  Could not refresh Merkle roots from registry: {e}")
+            return False
+        finally:
+            self._refresh_lock.release()
+
+    def start_background_refresh(self):
+        """Pull new registry events every refresh_interval seconds in a daemon thread"""
+        if not (self.rpc_url and self.contract_address) or self.refresh_interval <= 0:
+            return None
+
+        def run():
+            while True:
+                time.sleep(self.refresh_interval)
+                self.refresh_if_stale(self.refresh_interval)
+
+        thread = threading.Thread(target=run, name='registry-refresh', daemon=True)
+        thread.start()
+        return thread
+
+    def verify_proof(self, document_hash, proof, root=None):
+        """
+        Check that document_hash is included under a known root.
+        One SHA-256 per proof level; an RPC call only when the root is not
+        cached and the last pull is older than miss_interval.
+        Returns: dict with verification result
+        """
+        try:
+            node = _leaf(_to_bytes32(document_hash))
+            for sibling in proof:
+                node = _hash_pair(node, _to_bytes32(sibling))
+
+            if root is not None and node != _to_bytes32(root):
+                return {'success': True, 'valid': False, 'reason': 'Proof does not match the given root'}
+
+            with self._lock:
+                anchored = node in self.known_roots
+            # A batch anchored since the last pull (rate limited)
+            if not anchored and self.refresh_if_stale(self.miss_interval):
+                with self._lock:
+                    anchored = node in self.known_roots
+
+            return {
+                'success': True,
+                'valid': anchored,
+                'root': '0x' + node.hex(),
+                'reason': None if anchored else 'Root is not anchored in the registry'
+            }
+        except (ValueError, TypeError) as e:
+            return {'success': False, 'valid': False, 'error': str(e)}
+
+    @staticmethod
+    def build_tree(document_hashes):
+        """
+        Build a batch tree for issuers. Returns the root and one proof per
+        input hash, in input order.
+        """
+        if not document_hashes:
+            raise ValueError('Cannot build a tree without leaves')
+
+        leaves = [_leaf(_to_bytes32(h)) for h in document_hashes]
+        levels = [leaves]
+        while len(levels[-1]) > 1:
+            level = levels[-1]
+            parents = []
+            for i in range(0, len(level), 2):
+                if i + 1 < len(level):
+                    parents.append(_hash_pair(level[i], level[i + 1]))
+                else:
+                    # Odd node is promoted unchanged
+                    parents.append(level[i])
+            levels.append(parents)
+
+        proofs = []
+        for index in range(len(leaves)):
+            proof = []
+            for level in levels[:-1]:
+                sibling = index ^ 1
+                if sibling < len(level):
+                    proof.append('0x' + level[sibling].hex())
+                index //= 2
+            proofs.append(proof)
+
+        return {'root': '0x' + levels[-1][0].hex(), 'proofs': proofs}
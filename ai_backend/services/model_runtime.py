@@ -0,0 +1,360 @@
+"""
+Runtime for the trained logo and layout classifiers
+Loads one variant of each model written by Fake/train_heads.py (Keras .h5)
+or Fake/export_models.py (ONNX, int8 ONNX, int8 TFLite) and runs it on page
+images. The int8 variants trade a little accuracy for several times the
+throughput on CPU; Fake/export_models.py writes the accuracy-versus-latency
+report to compare them.
+
+The logo model's backbone also serves as an embedder for the institution
+index (services/institution_index.py): Keras cuts the full model at the head
+input, the other variants load the <stem>.embedding.* graph export_models.py
+writes next to the classifier.
+
+ML_MODEL_VARIANT: none (default: heuristics only) | keras | onnx | onnx-int8 | tflite-int8
+ML_MODEL_DIR: folder with the model files (default ../Fake)
+ML_THREADS: intra-op threads per model (default: runtime's choice)
+ML_FUSED: True to serve the single-backbone logo/layout/signature model
+"""
+import json
+import os
+import threading
+import weakref
+from concurrent.futures import Future
+from contextlib import nullcontext
+
+from PIL import Image
+import numpy as np
+
+MODEL_NAMES = ('logo', 'layout')
+VARIANTS = {
+    'keras': '{stem}.h5',
+    'onnx': '{stem}{part}.onnx',
+    'onnx-int8': '{stem}{part}.int8.onnx',
+    'tflite-int8': '{stem}{part}.int8.tflite',
+}
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake')
+
+
+def model_stem(name):
+    return f'{name}_authenticity_model'
+
+
+def model_path(model_dir, name, variant, embedding=False):
+    part = '.embedding' if embedding else ''
+    return os.path.join(model_dir, VARIANTS[variant].format(stem=model_stem(name), part=part))
+
+
+class _KerasBackend:
+    def __init__(self, path, threads, embedding=False):
+        import tensorflow as tf
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        self.model = tf.keras.models.load_model(path, compile=False)
+        if embedding:
+            # Pooled backbone features: the input of the final (head) layer
+            self.model = tf.keras.Model(self.model.input, self.model.layers[-1].input)
+        self.input_size = tuple(self.model.input_shape[1:3])
+        # Dict outputs (the fused model's heads) are named by their keys
+        output = self.model.output
+        self.output_names = sorted(output) if isinstance(output, dict) else list(self.model.output_names)
+
+    def run(self, batch):
+        """Outputs in output_names order"""
+        # Calling the model directly avoids predict()'s per-call setup, which
+        # dominates at page batch sizes
+        outputs = self.model(batch.astype(np.float32) / 255.0, training=False)
+        if isinstance(outputs, dict):
+            return [outputs[name].numpy() for name in self.output_names]
+        if isinstance(outputs, (list, tuple)):
+            return [output.numpy() for output in outputs]
+        return [outputs.numpy()]
+
+
+class _ONNXBackend:
+    """Float or QDQ-quantized ONNX; both take float pixels in [0, 1]"""
+
+    def __init__(self, path, threads, embedding=False):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_size = tuple(model_input.shape[1:3])
+        self.output_names = [output.name for output in self.session.get_outputs()]
+
+    def run(self, batch):
+        return self.session.run(self.output_names, {self.input_name: batch.astype(np.float32) / 255.0})
+
+
+class _TFLiteBackend:
+    """
+    Full-integer TFLite; input and outputs are quantized with the model's own
+    parameters. Outputs are read through the serving signature, which keeps
+    the Keras output names.
+    """
+
+    def __init__(self, path, threads, embedding=False):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        self.interpreter = Interpreter(model_path=path, num_threads=threads or None)
+        self.runner = self.interpreter.get_signature_runner()
+        self.input_name, self.input = next(iter(self.runner.get_input_details().items()))
+        self.outputs = self.runner.get_output_details()
+        self.output_names = list(self.outputs)
+        self.input_size = tuple(int(size) for size in self.input['shape'][1:3])
+
+    def run(self, batch):
+        scale, zero_point = self.input['quantization']
+        data = batch.astype(np.float32) / 255.0
+        if scale:
+            info = np.iinfo(self.input['dtype'])
+            data = np.clip(np.round(data / scale + zero_point), info.min, info.max)
+        results = {name: [] for name in self.output_names}
+        # The interpreter is built for batch 1
+        for sample in data.astype(self.input['dtype']):
+            for name, value in self.runner(**{self.input_name: sample[None]}).items():
+                results[name].append(value[0])
+
+        outputs = []
+        for name in self.output_names:
+            result = np.asarray(results[name], dtype=np.float32)
+            scale, zero_point = self.outputs[name]['quantization']
+            outputs.append((result - zero_point) * scale if scale else result)
+        return outputs
+
+
+_BACKENDS = {'keras': _KerasBackend, 'onnx': _ONNXBackend, 'onnx-int8': _ONNXBackend, 'tflite-int8': _TFLiteBackend}
+
+
+def _top_class(probabilities, classes):
+    """
+    Top class and its confidence (the notebook's logo score); single-output
+    models report the probability of the positive class (its layout score)
+    """
+    if len(probabilities) == 1:
+        return {'label': classes[0] if classes else None,
+                'confidence': round(float(probabilities[0]), 4)}
+    best = int(np.argmax(probabilities))
+    return {'label': classes[best] if classes else best,
+            'confidence': round(float(probabilities[best]), 4)}
+
+
+class ClassifierModel:
+    # train_heads.py fits single-output heads (layout) on authentic pages
+    # only, so their probability does not separate authentic from forged
+    has_negatives = False
+
+    def __init__(self, path, variant, classes=None, threads=None, embedding=False, backend=None):
+        self.path = path
+        self.variant = variant
+        self.classes = classes
+        # backend: an already-built runner (the inference sidecar's proxy)
+        self._backend = backend or _BACKENDS[variant](path, threads, embedding)
+        # TFLite interpreters and Keras models are not safe to call from
+        # several page threads at once; the sidecar proxy is
+        self._lock = nullcontext() if getattr(self._backend, 'thread_safe', False) else threading.Lock()
+
+    @property
+    def input_size(self):
+        """(height, width) the model expects"""
+        return self._backend.input_size
+
+    @property
+    def output_names(self):
+        return list(self._backend.output_names)
+
+    def preprocess(self, image):
+        """RGB uint8 array at the model's input size (nearest resize, as in training)"""
+        height, width = self.input_size
+        return np.asarray(image.convert('RGB').resize((width, height), Image.NEAREST), dtype=np.uint8)
+
+    def predict_outputs(self, batch):
+        """Every output for a uint8 batch (N, H, W, 3), by output name"""
+        with self._lock:
+            outputs = self._backend.run(batch)
+        return {name: np.asarray(output, dtype=np.float32)
+                for name, output in zip(self._backend.output_names, outputs)}
+
+    def predict_batch(self, batch):
+        """Class probabilities (the first output) for a uint8 batch (N, H, W, 3)"""
+        with self._lock:
+            return np.asarray(self._backend.run(batch)[0], dtype=np.float32)
+
+    def predict(self, image):
+        return self.predict_batch(self.preprocess(image)[None])[0]
+
+    def embed(self, image):
+        """L2-normalized output vector (the pooled features of an embedder)"""
+        vector = self.predict(image)
+        return vector / (np.linalg.norm(vector) + 1e-6)
+
+    def classify(self, image):
+        return _top_class(self.predict(image), self.classes)
+
+
+class FusedModel(ClassifierModel):
+    """
+    One backbone pass over the page feeding the logo, layout and signature
+    heads (Fake/train_fused.py). Each head is exposed with the classify()
+    interface of a separate model; the heads' outputs are kept per page
+    image, so the analyzers asking for one page share a single pass.
+    """
+
+    HEADS = ('logo', 'layout', 'signature')
+
+    def __init__(self, path, variant, classes=None, threads=None, backend=None):
+        super().__init__(path, variant, classes, threads, backend=backend)
+        # id(image) -> (weak reference, Future of the outputs); PIL images are
+        # not hashable, and an entry is dropped when its page image is freed.
+        # Page threads and weakref callbacks (run wherever the collector
+        # runs, possibly inside this lock: hence reentrant) share it
+        self._outputs = {}
+        self._outputs_lock = threading.RLock()
+
+    def _forget(self, key, reference):
+        with self._outputs_lock:
+            entry = self._outputs.get(key)
+            # The id may already belong to a newer page image
+            if entry is not None and entry[0] is reference:
+                del self._outputs[key]
+
+    def predict_heads(self, image):
+        """
+        Probabilities per head for one page image. Analyzers asking for a
+        page already in flight wait for that pass instead of starting another
+        """
+        key = id(image)
+        with self._outputs_lock:
+            entry = self._outputs.get(key)
+            if entry is not None and entry[0]() is image:
+                pending, owner = entry[1], False
+            else:
+                pending, owner = Future(), True
+                reference = weakref.ref(image, lambda reference, key=key: self._forget(key, reference))
+                self._outputs[key] = (reference, pending)
+        if owner:
+            try:
+                batch = self.preprocess(image)[None]
+                pending.set_result({name: value[0] for name, value in self.predict_outputs(batch).items()})
+            except Exception as e:
+                # Let the next caller retry instead of caching the failure
+                self._forget(key, reference)
+                pending.set_exception(e)
+        return pending.result()
+
+    def head(self, name):
+        return _FusedHead(self, name)
+
+
+class _FusedHead:
+    # The heads were trained on whole pages, not on logo crops, with
+    # tampered and unsigned pages as negatives
+    page_level = True
+    has_negatives = True
+
+    def __init__(self, model, name):
+        self.model = model
+        self.name = name
+        self.variant = f'{model.variant} (fused)'
+        self.classes = (model.classes or {}).get(name)
+
+    def classify(self, image):
+        return _top_class(self.model.predict_heads(image)[self.name], self.classes)
+
+
+def load_model(name, variant, model_dir=None, threads=None):
+    """
+    One classifier variant, with its class order when train_heads.py saved
+    it ('fused' loads the multi-head model, its classes keyed by head)
+    """
+    model_dir = model_dir or DEFAULT_MODEL_DIR
+    classes = None
+    classes_path = os.path.join(model_dir, model_stem(name) + '_classes.json')
+    if os.path.exists(classes_path):
+        with open(classes_path, encoding='utf-8') as f:
+            classes = json.load(f)
+    model_class = FusedModel if name == 'fused' else ClassifierModel
+    return model_class(model_path(model_dir, name, variant), variant, classes, threads)
+
+
+def load_embedder(name, variant, model_dir=None, threads=None):
+    """The backbone of a classifier variant, returning pooled features"""
+    model_dir = model_dir or DEFAULT_MODEL_DIR
+    return ClassifierModel(model_path(model_dir, name, variant, embedding=True), variant,
+                           threads=threads, embedding=True)
+
+
+def load_env_models():
+    """
+    The configured variant of every model whose file exists, as loaded
+    Returns: dict name -> ClassifierModel (empty when ML_MODEL_VARIANT is
+    none): 'fused' with ML_FUSED=True, otherwise 'logo' and 'layout', plus
+    'logo_embedding' when the logo embedder exists
+    """
+    variant = os.getenv('ML_MODEL_VARIANT', 'none').strip().lower()
+    if variant == 'none':
+        return {}
+    if variant not in VARIANTS:
+        raise ValueError(f'Unknown ML_MODEL_VARIANT: {variant}')
+
+    model_dir = os.getenv('ML_MODEL_DIR', DEFAULT_MODEL_DIR)
+    threads = int(os.getenv('ML_THREADS', 0)) or None
+    if os.getenv('ML_FUSED', 'False') == 'True':
+        if os.path.exists(model_path(model_dir, 'fused', variant)):
+            return {'fused': load_model('fused', variant, model_dir, threads)}
+        print(f"⚠️  {variant} fused model not found in {model_dir}; using separate models")
+
+    models = {}
+    for name in MODEL_NAMES:
+        if os.path.exists(model_path(model_dir, name, variant)):
+            models[name] = load_model(name, variant, model_dir, threads)
+        else:
+            print(f"⚠️  {variant} {name} model not found in {model_dir}; using heuristics")
+    if 'logo' in models and os.path.exists(model_path(model_dir, 'logo', variant, embedding=True)):
+        models['logo_embedding'] = load_embedder('logo', variant, model_dir, threads)
+    return models
+
+
+def remote_models(socket_path):
+    """Proxies to the models the inference sidecar serves, same interface as load_env_models()"""
+    from services.inference_server import InferenceClient, RemoteBackend
+
+    client = InferenceClient(socket_path)
+    models = {}
+    for name, description in client.wait_ready().items():
+        model_class = FusedModel if name == 'fused' else ClassifierModel
+        models[name] = model_class(description['path'], description['variant'], description['classes'],
+                                   backend=RemoteBackend(client, name, description))
+    return models
+
+
+def load_models_from_env():
+    """
+    Models for the analyzers: served by the inference sidecar when
+    INFERENCE_SOCKET is set, otherwise loaded in this process
+    Returns: dict name -> model with classify(); the fused model is
+    split into its logo, layout and signature heads
+    """
+    socket_path = os.getenv('INFERENCE_SOCKET')
+    if socket_path and os.getenv('ML_MODEL_VARIANT', 'none').strip().lower() != 'none':
+        try:
+            models = remote_models(socket_path)
+        except OSError as e:
+            print(f"⚠️  Inference sidecar not reachable at {socket_path} ({e}); loading models in-process")
+            models = load_env_models()
+    else:
+        models = load_env_models()
+
+    if 'fused' in models:
+        fused = models.pop('fused')
+        models.update({name: fused.head(name) for name in FusedModel.HEADS})
+    return models
@@ -0,0 +1,233 @@
+"""
+Multi-page support for the image, signature and layout analyzers
+Picks which pages are worth a full-resolution pass from cheap thumbnails,
+renders only those pages, crops each to its content and runs per-page work
+in parallel
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import ImageFilter
+import numpy as np
+
+from services.rasterizer import get_rasterizer, render_images
+
+PAGE_MODES = ('first', 'selected', 'all')
+
+
+class PageSelector:
+    def __init__(self, mode='selected', max_pages=3, thumb_dpi=24, min_ink=0.005, min_edges=6.0):
+        self.mode = mode if mode in PAGE_MODES else 'selected'
+        self.max_pages = max_pages
+        self.thumb_dpi = thumb_dpi
+        self.min_ink = min_ink
+        self.min_edges = min_edges
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv('MULTI_PAGE_MODE', 'selected'),
+            max_pages=int(os.getenv('MULTI_PAGE_MAX_PAGES', 3))
+        )
+
+    def select(self, pdf_path):
+        """
+        Choose page numbers (1-based) for full analysis
+        first    - page 1 only
+        all      - every page
+        selected - page 1, the last page (signatures and seals often sit there)
+                   and the inkiest remaining pages, up to max_pages
+        """
+        if self.mode == 'first':
+            return [1]
+
+        thumbnails = render_images(pdf_path, dpi=self.thumb_dpi, grayscale=True)
+        if not thumbnails:
+            return []
+
+        page_count = len(thumbnails)
+        if self.mode == 'all' or page_count <= 2:
+            return list(range(1, page_count + 1))
+
+        scores = {}
+        for number, thumb in enumerate(thumbnails, start=1):
+            ink, edges = self._page_density(thumb)
+            # Near-blank pages (back sides, separators) are never worth a full pass
+            if ink >= self.min_ink and edges >= self.min_edges:
+                scores[number] = ink + edges / 255.0
+
+        selected = [p for p in (1, page_count) if p in scores or p == 1]
+        ranked = sorted((p for p in scores if p not in selected), key=scores.get, reverse=True)
+        selected.extend(ranked[:max(0, self.max_pages - len(selected))])
+        return sorted(selected)
+
+    def _page_density(self, thumb):
+        """
+        Ink density (mean darkness; thin strokes turn grey rather than black
+        at thumbnail resolution) and mean edge strength of a thumbnail
+        """
+        gray = thumb.convert('L')
+        ink = 1.0 - float(np.asarray(gray, dtype=np.float32).mean()) / 255.0
+        edges = float(np.asarray(gray.filter(ImageFilter.FIND_EDGES)).mean())
+        return ink, edges
+
+
+def render_pages(pdf_path, page_numbers, dpi=300, crop=None, rasterizer=None):
+    """
+    Render only the chosen pages, cropped to their content unless crop is
+    False (default: PAGE_CROP). Backends that render regions skip the
+    margins altogether. Returns: list of (page_number, PIL image)
+    """
+    if crop is None:
+        crop = os.getenv('PAGE_CROP', 'True') == 'True'
+    rasterizer = rasterizer or get_rasterizer()
+
+    pages = []
+    for number in page_numbers:
+        if crop and rasterizer.supports_regions:
+            pages.append((number, _render_content(rasterizer, pdf_path, number, dpi)))
+            continue
+        images = render_images(pdf_path, [number], dpi=dpi, rasterizer=rasterizer)
+        if images:
+            pages.append((number, crop_to_content(images[0]) if crop else images[0]))
+    return pages
+
+
+def _render_content(rasterizer, pdf_path, number, dpi, thumb_factor=12):
+    """
+    Find the content box on a low-dpi render, then render just that region
+    at full resolution (same geometry and image.info as crop_to_content)
+    """
+    (width_pt, height_pt), = rasterizer.page_sizes(pdf_path, [number])
+    width, height = int(np.ceil(width_pt * dpi / 72)), int(np.ceil(height_pt * dpi / 72))
+    thumb = render_images(pdf_path, [number], dpi=dpi / thumb_factor, rasterizer=rasterizer)[0]
+    box = content_box(thumb)
+    if box is None:
+        return render_images(pdf_path, [number], dpi=dpi, rasterizer=rasterizer)[0]
+
+    left, top = int(box[0] * width) // 8 * 8, int(box[1] * height) // 8 * 8
+    right, bottom = int(np.ceil(box[2] * width)), int(np.ceil(box[3] * height))
+    region = (left / width, top / height, right / width, bottom / height)
+    image = render_images(pdf_path, [number], dpi=dpi, region=region, rasterizer=rasterizer)[0]
+    image.info['page_offset'] = (left, top)
+    image.info['page_size'] = (width, height)
+    return image
+
+
+def _frame_depth(framed, gap):
+    """
+    Thickness of the run of framed lines starting at (or a small margin
+    from) the edge, allowing short gaps between frame lines; 0 if none
+    """
+    depth = 0
+    for index in np.flatnonzero(framed):
+        if index - depth > gap:
+            break
+        depth = index + 1
+    return depth
+
+
+def content_box(thumb, ink_delta=24, frame_coverage=0.6, band=0.15, min_ink=2, padding=0.02):
+    """
+    Content bounding box of a low-resolution page image as fractions
+    (left, top, right, bottom), inside any ornamental frame; None when the
+    content already fills the page
+    """
+    gray = np.asarray(thumb.convert('L'), dtype=np.int16)
+    h, w = gray.shape
+    ink = np.abs(gray - int(np.median(gray))) > ink_delta
+
+    # Frames: rows/columns running in from the page edge with ink along most
+    # of the page. Only a frame closed on all four sides counts; a coloured
+    # banner near the top or bottom is content.
+    bounds = []
+    for axis, size in ((0, w), (1, h)):
+        framed = ink.mean(axis=axis) > frame_coverage
+        edge, gap = max(1, int(size * band)), max(2, int(size * 0.06))
+        bounds.append((_frame_depth(framed[:edge], gap), _frame_depth(framed[::-1][:edge], gap)))
+    if all(bounds[0]) and all(bounds[1]):
+        (x0, x1), (y0, y1) = (bounds[0][0], w - bounds[0][1]), (bounds[1][0], h - bounds[1][1])
+    else:
+        x0, x1, y0, y1 = 0, w, 0, h
+
+    inner = ink[y0:y1, x0:x1]
+    rows = np.flatnonzero(inner.sum(axis=1) >= min_ink)
+    cols = np.flatnonzero(inner.sum(axis=0) >= min_ink)
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+
+    # Padding stays inside the frame
+    pad_x, pad_y = padding * w, padding * h
+    box = (max(x0, x0 + cols[0] - pad_x) / w, max(y0, y0 + rows[0] - pad_y) / h,
+           min(x1, x0 + cols[-1] + 1 + pad_x) / w, min(y1, y0 + rows[-1] + 1 + pad_y) / h)
+    if (box[2] - box[0]) * (box[3] - box[1]) > 0.95:
+        return None
+    return box
+
+
+def crop_to_content(image, thumb_factor=12):
+    """
+    Crop a rendered page to its content box, found on a reduced copy.
+    The origin snaps to the 8-pixel JPEG block grid so block-artifact
+    statistics keep their phase. The crop origin and full page size are kept
+    in image.info so analyzers can report page coordinates (see page_offset
+    / page_size).
+    """
+    box = content_box(image.reduce(thumb_factor))
+    if box is None:
+        return image
+
+    width, height = image.size
+    left, top = int(box[0] * width) // 8 * 8, int(box[1] * height) // 8 * 8
+    cropped = image.crop((left, top, int(np.ceil(box[2] * width)), int(np.ceil(box[3] * height))))
+    cropped.info['page_offset'] = (left, top)
+    cropped.info['page_size'] = (width, height)
+    return cropped
+
+
+def page_offset(image):
+    """Position of a (possibly cropped) page image on the full page"""
+    return image.info.get('page_offset', (0, 0))
+
+
+def page_size(image):
+    """Size of the full page a (possibly cropped) page image came from"""
+    return image.info.get('page_size', image.size)
+
+
+def to_page_bbox(image, bbox):
+    """Map an [x, y, w, h] box on a cropped page image back to page pixels"""
+    left, top = page_offset(image)
+    return [bbox[0] + left, bbox[1] + top, bbox[2], bbox[3]]
+
+
+def render_first_page(pdf_path, dpi=300):
+    return render_pages(pdf_path, [1], dpi)
+
+
+def map_pages(fn, pages, max_workers=None, checkpoint=None):
+    """
+    Apply fn(image) to every page in parallel (PIL releases the GIL in its
+    heavy operations). Returns: list of (page_number, result) in page order.
+    checkpoint: optional stage checkpoint (services/page_checkpoints.py);
+    pages it already holds are not recomputed and may come without an image
+    (None), and each new result is recorded as soon as it is computed.
+    """
+    def run(page):
+        number, image = page
+        if checkpoint is not None:
+            result = checkpoint.get(number)
+            if result is not None:
+                return result
+        result = fn(image)
+        if checkpoint is not None:
+            checkpoint.put(number, result)
+        return result
+
+    if len(pages) <= 1:
+        return [(page[0], run(page)) for page in pages]
+
+    max_workers = max_workers or min(len(pages), int(os.getenv('PAGE_WORKERS', 4)))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(run, pages))
+    return [(number, result) for (number, _), result in zip(pages, results)]
@@ -1,43 +1,86 @@
 """
 OCR Service for extracting text from PDF certificates
+Pages Tesseract has already read (shared terms pages, back pages and
+headers of one issuer's documents) come from a bounded LRU cache keyed by a
+hash of the rendered pixels and the OCR settings, so only pages not seen
+before are OCRed.
 """
+import hashlib
 import pytesseract
-from pdf2image import convert_from_path
 from PIL import Image
-import PyPDF2
 import io
 import re
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+from services.multipage import render_pages
+from services.rasterizer import get_rasterizer
+from services.text_layer import get_text_layer
+
+# Fields that make the embedded text layer good enough to skip OCR
+REQUIRED_FIELDS = ('student_name', 'degree', 'institution')
+OCR_DPI = 300
+
+
+def page_digest(image):
+    """Hash of a rendered page's mode, size and pixels (xxh3-128 with xxhash installed, else BLAKE2b)"""
+    digest = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    digest.update(f'{image.mode}:{image.width}x{image.height}:'.encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
 class OCRService:
-    def __init__(self):
+    def __init__(self, preprocessor=None, text_layer=None, required_fields=REQUIRED_FIELDS, page_cache=None):
         # Configure tesseract path if needed (Windows)
         # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        pass
+        # Optional OCRPreprocessor: pages are cleaned and binarized before Tesseract
+        self.preprocessor = preprocessor
+        if text_layer is None:
+            try:
+                text_layer = get_text_layer()
+            except ImportError:
+                text_layer = None
+        self.text_layer = text_layer
+        self.required_fields = tuple(required_fields)
+        # Optional ResultCache of page text by page_digest and OCR settings
+        self.page_cache = page_cache
+        settings = sorted(vars(preprocessor).items()) if preprocessor is not None else None
+        self._ocr_settings = f'dpi={OCR_DPI};preprocess={settings}'
     
-    def extract_text_from_pdf(self, pdf_path):
+    def extract_text_from_pdf(self, pdf_path, allow_ocr=True, checkpoint=None):
         """
-        Extract text from PDF using both PyPDF2 and OCR
+        Extract text from the PDF's text layer, page by page, and fall back
+        to OCR when it does not carry the required fields (unless allow_ocr
+        is False: the quick tier settles for whatever the text layer has)
+        checkpoint: optional per-page checkpoint; OCR skips the pages it
+        holds and records each page it reads
         Returns: dict with extracted text and metadata
         """
         try:
-            # Try PyPDF2 first (faster for text-based PDFs)
-            text_pypdf = self._extract_with_pypdf2(pdf_path)
-            
-            # Also use OCR for image-based PDFs or verification
-            text_ocr = self._extract_with_ocr(pdf_path)
+            # Text layer first (fast for text-based PDFs, stops at the fields)
+            text_layer, layer_data, pages_read = self._extract_text_layer(pdf_path)
             
-            # Combine and clean text
-            combined_text = text_pypdf if len(text_pypdf) > len(text_ocr) else text_ocr
-            
-            # Extract key information
-            extracted_data = self._parse_certificate_data(combined_text)
+            if all(layer_data.get(field) for field in self.required_fields) or not allow_ocr:
+                combined_text, extracted_data, method = text_layer, layer_data, 'text_layer'
+            else:
+                # OCR for image-based PDFs or a text layer missing the fields
+                text_ocr = self._extract_with_ocr(pdf_path, checkpoint)
+                use_layer = len(text_layer) > len(text_ocr)
+                combined_text = text_layer if use_layer else text_ocr
+                extracted_data = self._parse_certificate_data(combined_text)
+                method = 'text_layer' if use_layer else 'ocr'
             
             return {
                 'success': True,
                 'text': combined_text,
                 'extracted_data': extracted_data,
                 'word_count': len(combined_text.split()),
-                'method': 'pypdf2' if len(text_pypdf) > len(text_ocr) else 'ocr'
+                'method': method,
+                'text_layer_pages': pages_read
             }
         except Exception as e:
             return {
@@ -47,28 +90,54 @@ class OCRService:
                 'extracted_data': {}
             }
     
-    def _extract_with_pypdf2(self, pdf_path):
-        """Extract text using PyPDF2"""
+    def _extract_text_layer(self, pdf_path):
+        """
+        Read embedded text page by page, parsing as it goes, and stop once
+        every required field has been found
+        Returns: (text, extracted fields, pages read)
+        """
+        if self.text_layer is None:
+            return '', {}, 0
+        
+        texts, fields = [], {}
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ''
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                return text.strip()
-        except:
-            return ''
+            for page in self.text_layer.iter_pages(pdf_path, words=False):
+                texts.append(page['text'])
+                for key, value in self._parse_certificate_data(page['text']).items():
+                    if key == 'dates':
+                        fields.setdefault('dates', []).extend(value)
+                    else:
+                        fields.setdefault(key, value)
+                if all(fields.get(field) for field in self.required_fields):
+                    break
+        except Exception:
+            pass
+        return '\n'.join(texts).strip(), fields, len(texts)
     
-    def _extract_with_ocr(self, pdf_path):
-        """Extract text using Tesseract OCR"""
+    def _extract_with_ocr(self, pdf_path, checkpoint=None):
+        """Extract text using Tesseract OCR, rendering one page at a time"""
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path, dpi=300)
+            rasterizer = get_rasterizer()
             
             text = ''
-            for image in images:
-                # Perform OCR on each page
-                page_text = pytesseract.image_to_string(image)
+            for number in range(1, rasterizer.page_count(pdf_path) + 1):
+                done = checkpoint.get(number) if checkpoint is not None else None
+                if done is not None:
+                    text += done['text'] + '\n'
+                    continue
+                # Cropped to the content (PAGE_CROP) like the analyzers' pages
+                (_, image), = render_pages(pdf_path, [number], dpi=OCR_DPI, rasterizer=rasterizer)
+                key = f'{page_digest(image)};{self._ocr_settings}' if self.page_cache is not None else None
+                page_text = self.page_cache.get(key) if key else None
+                if page_text is None:
+                    if self.preprocessor is not None:
+                        image = self.preprocessor.process(image)
+                    # Perform OCR on each page not seen before
+                    page_text = pytesseract.image_to_string(image)
+                    if key:
+                        self.page_cache.put(key, page_text)
+                if checkpoint is not None:
+                    checkpoint.put(number, {'text': page_text})
                 text += page_text + '\n'
             
             return text.strip()
@@ -90,9 +159,10 @@ class OCRService:
                 data['student_name'] = match.group(1).strip()
                 break
         
-        # Extract degree/course
+        # Extract degree/course (bounded run: unbounded, it backtracks over
+        # the whole text at every "course")
         degree_patterns = [
-            r'(?:Degree|Course|Program)[:\s]+([A-Za-z\s]+(?:Science|Arts|Engineering|Business|Technology))',
+            r'(?:Degree|Course|Program)[:\s]+([A-Za-z\s]{1,80}(?:Science|Arts|Engineering|Business|Technology))',
             r'(?:Bachelor|Master|Diploma|Certificate)\s+(?:of|in)\s+([A-Za-z\s]+)',
         ]
         for pattern in degree_patterns:
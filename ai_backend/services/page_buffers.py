@@ -0,0 +1,172 @@
+"""
+Shared-memory page buffers
+Rendered pages reach the page processes (PAGE_PROCESSES, see
+services/analysis_pipeline.py) as small picklable descriptors (block name,
+shape, dtype, mode, image.info) instead of pickled pixels: the owner copies
+each page once into a shared memory block and a worker maps the block as a
+NumPy array. A 300 dpi A4 page is about 25 MB.
+
+Lifetime: the process that shares the pages owns the blocks and unlinks them
+when its `with SharedPages(...)` block ends, whatever happened in the
+workers. Workers only attach, so a crashed worker leaks nothing. If the
+owner dies, the multiprocessing resource tracker unlinks the blocks it
+created; sweep_orphans() removes blocks whose owner and tracker were killed
+together (block names carry the owner's pid).
+"""
+import os
+import secrets
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+from PIL import Image
+import numpy as np
+
+PREFIX = 'certpage'
+SHM_DIR = '/dev/shm'
+
+
+def attach_shared_memory(name):
+    """
+    Open another process's block without adopting it. Before Python 3.13
+    attaching registers the block with the resource tracker, which unlinks
+    it when the tracker's processes exit. That is undone only when the
+    tracker is this process's own (the inference sidecar): pool workers
+    share their parent's tracker, where the owner registered the block.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    segment = shared_memory.SharedMemory(name=name)
+    if resource_tracker._resource_tracker._pid is not None:
+        try:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        except Exception:
+            pass
+    return segment
+
+
+class SharedPage:
+    """Descriptor of one page image in a shared memory block"""
+
+    def __init__(self, number, name, shape, dtype, mode, info):
+        self.number = number
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.mode = mode
+        self.info = info
+
+    @contextmanager
+    def array(self):
+        """The page pixels mapped in place (no copy); valid inside the with block"""
+        segment = attach_shared_memory(self.name)
+        try:
+            yield np.ndarray(self.shape, dtype=self.dtype, buffer=segment.buf)
+        finally:
+            segment.close()
+
+    def image(self):
+        """The page as a PIL image of its own (one copy out of the block)"""
+        segment = attach_shared_memory(self.name)
+        try:
+            with segment.buf[:int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize] as view:
+                image = Image.frombytes(self.mode, (self.shape[1], self.shape[0]), view)
+        finally:
+            segment.close()
+        image.info.update(self.info)
+        return image
+
+
+def load_pages(shared):
+    """(page_number, PIL image) pages from SharedPage descriptors"""
+    return [(page.number, page.image() if page.name else None) for page in shared]
+
+
+class SharedPages:
+    """
+    Owner of shared copies of (page_number, PIL image) pages
+    Usage: with SharedPages(pages) as shared: pool.submit(fn, shared)
+    The blocks are unlinked on exit, so workers must be done with them.
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self._segments = []
+
+    def __enter__(self):
+        try:
+            return [self._share(number, image) for number, image in self.pages]
+        except BaseException:
+            self.close()
+            raise
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _share(self, number, image):
+        if image is None:
+            # Page not rendered (its results are checkpointed)
+            return SharedPage(number, None, (), 'uint8', None, {})
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+        width, height = image.size
+        shape = (height, width) if image.mode == 'L' else (height, width, 3)
+        segment = shared_memory.SharedMemory(name=f'{PREFIX}-{os.getpid()}-{secrets.token_hex(6)}',
+                                             create=True, size=max(1, width * height * len(image.mode)))
+        self._segments.append(segment)
+        segment.buf[:width * height * len(image.mode)] = image.tobytes()
+        return SharedPage(number, segment.name, shape, 'uint8', image.mode, dict(image.info))
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments = []
+
+
+def room_for(pages, directory=SHM_DIR):
+    """
+    Whether shared memory can hold the pages: writing into a full tmpfs
+    kills the writer with SIGBUS instead of raising (Docker's default
+    /dev/shm is 64 MB, under three 300 dpi pages)
+    """
+    if not os.path.isdir(directory):
+        return True
+    stats = os.statvfs(directory)
+    needed = sum(image.width * image.height * (1 if image.mode == 'L' else 3)
+                 for _, image in pages if image is not None)
+    return needed < stats.f_bavail * stats.f_frsize
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def sweep_orphans(directory=SHM_DIR):
+    """
+    Unlink page blocks whose owner process no longer exists
+    Returns: number of blocks removed (0 where shared memory is not a directory)
+    """
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        parts = name.split('-')
+        if len(parts) != 3 or parts[0] != PREFIX or not parts[1].isdigit() or _alive(int(parts[1])):
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1,156 @@
+"""
+Per-page checkpoints of the full analysis
+Large multi-page documents record each page's result for each stage (OCR
+text, image, signature, layout, tiles) as soon as it is computed. A retry of
+the same document, after a failed request or a worker that died mid-document,
+reads those back and only renders and analyzes the pages still missing.
+
+One append-only JSON-lines file per document hash and settings fingerprint
+(model variant, crop, tile size, OCR preprocessing), so results computed
+under other settings are never reused. Lines are flushed as they are written:
+a killed process keeps every page it finished. The file is removed once the
+document has a verdict; sweep() removes the ones retries never came back for.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Settings that change per-page results
+FINGERPRINT_SETTINGS = ('ML_MODEL_VARIANT', 'ML_FUSED', 'PAGE_CROP', 'TILE_SIZE', 'OCR_PREPROCESS',
+                        'LOGO_DATA_DIR', 'SIGNATURE_SPECIMEN_DIR', 'SIGNATURE_CROSS_ISSUER')
+
+
+def settings_fingerprint():
+    values = '|'.join(f'{name}={os.getenv(name, "")}' for name in FINGERPRINT_SETTINGS)
+    return hashlib.blake2b(values.encode(), digest_size=6).hexdigest()
+
+
+def _plain(value):
+    """NumPy scalars and arrays as JSON numbers and lists"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class PageCheckpoints:
+    """Directory of per-document checkpoint files"""
+
+    def __init__(self, directory, max_age_hours=24.0):
+        self.directory = directory
+        self.max_age_hours = max_age_hours
+        os.makedirs(directory, exist_ok=True)
+        self.sweep()
+
+    @classmethod
+    def from_env(cls):
+        directory = os.getenv('PAGE_CHECKPOINT_DIR', 'data/checkpoints')
+        if not directory:
+            return None
+        return cls(directory, max_age_hours=float(os.getenv('PAGE_CHECKPOINT_HOURS', 24)))
+
+    def for_document(self, document_hash, fingerprint=None):
+        fingerprint = fingerprint or settings_fingerprint()
+        return DocumentCheckpoint(os.path.join(self.directory, f'{document_hash}-{fingerprint}.jsonl'))
+
+    def clear(self, document_hash):
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f'{glob.escape(document_hash)}-*.jsonl')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        """Remove checkpoint files untouched for max_age_hours; returns how many"""
+        cutoff = time.time() - self.max_age_hours * 3600
+        removed = 0
+        for path in glob.glob(os.path.join(glob.escape(self.directory), '*.jsonl')):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class DocumentCheckpoint:
+    """
+    Page results of one document: (stage, page number) -> result dict.
+    Picklable (only the path travels), so page processes append to the same
+    file; each process reads it once, when first asked.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._results = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _load(self):
+        if self._results is not None:
+            return self._results
+        results = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        results[(record['stage'], record['page'])] = record['result']
+                    except (ValueError, KeyError):
+                        # A line cut short by a killed process
+                        continue
+        except FileNotFoundError:
+            pass
+        self._results = results
+        return results
+
+    def get(self, stage, page):
+        with self._lock:
+            return self._load().get((stage, page))
+
+    def put(self, stage, page, result):
+        line = json.dumps({'stage': stage, 'page': page, 'result': result}, default=_plain) + '\n'
+        with self._lock:
+            self._load()[(stage, page)] = result
+            # One write per line in append mode, so processes do not interleave
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+    def has(self, stages, page):
+        """Whether every stage has a result for the page"""
+        with self._lock:
+            results = self._load()
+            return all((stage, page) in results for stage in stages)
+
+    def pages(self):
+        """Checkpointed page numbers per stage"""
+        with self._lock:
+            done = {}
+            for stage, page in self._load():
+                done.setdefault(stage, []).append(page)
+            return {stage: sorted(pages) for stage, pages in done.items()}
+
+    def stage(self, name):
+        return StageCheckpoint(self, name)
+
+
+class StageCheckpoint:
+    """One stage's view of a document checkpoint (see multipage.map_pages)"""
+
+    def __init__(self, document, name):
+        self.document = document
+        self.name = name
+
+    def get(self, page):
+        return self.document.get(self.name, page)
+
+    def put(self, page, result):
+        self.document.put(self.name, page, result)
@@ -0,0 +1,207 @@
+"""
+PDF rasterization backends
+pdf2image runs poppler's pdftoppm as a subprocess per call and reads the
+pages back from temporary PPM files. The in-process backends (pypdfium2,
+PyMuPDF) open the document from a path or from bytes and render straight
+into NumPy arrays, including just a region of a page, which is how the
+content crop (services/multipage.py) avoids rendering margins at 300 dpi.
+
+PDF_RASTERIZER picks the backend: auto (default: pdfium, then mupdf, then
+pdf2image, whichever is installed), pdfium, mupdf or pdf2image.
+
+Every backend renders page numbers (1-based) to uint8 arrays, HxWx3 RGB or
+HxW grayscale. region is (left, top, right, bottom) as fractions of the page.
+Backends with supports_regions also report page sizes in points.
+"""
+import os
+import threading
+
+from PIL import Image
+import numpy as np
+
+BACKENDS = ('pdfium', 'mupdf', 'pdf2image')
+
+# Neither PDFium nor MuPDF is thread-safe: one call into each library at a
+# time per process (text extraction shares these, see services/text_layer.py).
+# Pool processes each load their own copy of the libraries.
+PDFIUM_LOCK = threading.Lock()
+MUPDF_LOCK = threading.Lock()
+
+
+def _region_pixels(region, width, height):
+    """Fractional region to a pixel box on a width x height render"""
+    left, top, right, bottom = region
+    return (int(left * width), int(top * height),
+            max(int(left * width) + 1, int(np.ceil(right * width))),
+            max(int(top * height) + 1, int(np.ceil(bottom * height))))
+
+
+class PdfiumRasterizer:
+    """pypdfium2: in-process, region rendering, documents opened from path or bytes"""
+    name = 'pdfium'
+    supports_regions = True
+    _lock = PDFIUM_LOCK
+
+    def __init__(self):
+        import pypdfium2
+        import pypdfium2.raw
+        self._pdfium = pypdfium2
+        self._gray_format = pypdfium2.raw.FPDFBitmap_Gray
+
+    def page_count(self, source):
+        with self._lock:
+            document = self._pdfium.PdfDocument(source)
+            try:
+                return len(document)
+            finally:
+                document.close()
+
+    def page_sizes(self, source, page_numbers):
+        """(width, height) of each page in points"""
+        with self._lock:
+            document = self._pdfium.PdfDocument(source)
+            try:
+                return [tuple(document.get_page_size(number - 1)) for number in page_numbers]
+            finally:
+                document.close()
+
+    def render(self, source, page_numbers=None, dpi=300, grayscale=False, region=None):
+        with self._lock:
+            document = self._pdfium.PdfDocument(source)
+            try:
+                numbers = page_numbers or range(1, len(document) + 1)
+                return [self._render_page(document[number - 1], dpi, grayscale, region) for number in numbers]
+            finally:
+                document.close()
+
+    def _render_page(self, page, dpi, grayscale, region):
+        crop = (0, 0, 0, 0)
+        if region is not None:
+            # PDFium crops in page units from each side, origin bottom-left
+            width, height = page.get_size()
+            left, top, right, bottom = region
+            crop = (left * width, (1 - bottom) * height, (1 - right) * width, top * height)
+        options = {'force_bitmap_format': self._gray_format} if grayscale else {'rev_byteorder': True}
+        bitmap = page.render(scale=dpi / 72, crop=crop, **options)
+        try:
+            # The array is a view on PDFium's buffer: copy before it is freed
+            array = np.array(bitmap.to_numpy(), copy=True)
+        finally:
+            bitmap.close()
+            page.close()
+        return array[..., 0] if grayscale and array.ndim == 3 else array
+
+
+class MuPDFRasterizer:
+    """PyMuPDF: in-process, region rendering through a clip rectangle"""
+    name = 'mupdf'
+    supports_regions = True
+    _lock = MUPDF_LOCK
+
+    def __init__(self):
+        try:
+            import pymupdf as fitz
+        except ImportError:  # PyMuPDF < 1.24
+            import fitz
+        self._fitz = fitz
+
+    def _open(self, source):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return self._fitz.open(stream=bytes(source), filetype='pdf')
+        return self._fitz.open(source)
+
+    def page_count(self, source):
+        with self._lock, self._open(source) as document:
+            return document.page_count
+
+    def page_sizes(self, source, page_numbers):
+        """(width, height) of each page in points"""
+        with self._lock, self._open(source) as document:
+            return [(document[number - 1].rect.width, document[number - 1].rect.height) for number in page_numbers]
+
+    def render(self, source, page_numbers=None, dpi=300, grayscale=False, region=None):
+        fitz = self._fitz
+        with self._lock, self._open(source) as document:
+            numbers = page_numbers or range(1, document.page_count + 1)
+            arrays = []
+            for number in numbers:
+                page = document[number - 1]
+                clip = None
+                if region is not None:
+                    rect = page.rect
+                    left, top, right, bottom = region
+                    clip = fitz.Rect(rect.x0 + left * rect.width, rect.y0 + top * rect.height,
+                                     rect.x0 + right * rect.width, rect.y0 + bottom * rect.height)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), clip=clip, alpha=False,
+                                         colorspace=fitz.csGRAY if grayscale else fitz.csRGB)
+                array = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n)
+                arrays.append(array[..., 0] if grayscale else array)
+            return arrays
+
+
+class Pdf2ImageRasterizer:
+    """poppler via pdf2image (subprocess); regions are cut from the full render"""
+    name = 'pdf2image'
+    supports_regions = False
+
+    def __init__(self):
+        import pdf2image
+        self._pdf2image = pdf2image
+
+    def page_count(self, source):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return self._pdf2image.pdfinfo_from_bytes(bytes(source))['Pages']
+        return self._pdf2image.pdfinfo_from_path(source)['Pages']
+
+    def render(self, source, page_numbers=None, dpi=300, grayscale=False, region=None):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            convert = lambda **kwargs: self._pdf2image.convert_from_bytes(bytes(source), **kwargs)
+        else:
+            convert = lambda **kwargs: self._pdf2image.convert_from_path(source, **kwargs)
+
+        if page_numbers is None:
+            images = convert(dpi=dpi, grayscale=grayscale)
+        else:
+            images = [image for number in page_numbers
+                      for image in convert(dpi=dpi, grayscale=grayscale, first_page=number, last_page=number)]
+
+        arrays = []
+        for image in images:
+            if region is not None:
+                image = image.crop(_region_pixels(region, *image.size))
+            arrays.append(np.asarray(image.convert('L' if grayscale else 'RGB')))
+        return arrays
+
+
+_CLASSES = {'pdfium': PdfiumRasterizer, 'mupdf': MuPDFRasterizer, 'pdf2image': Pdf2ImageRasterizer}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_rasterizer(name=None):
+    """
+    Shared rasterizer instance for a backend name (default: PDF_RASTERIZER).
+    auto falls back through BACKENDS to the first one that imports.
+    """
+    name = (name or os.getenv('PDF_RASTERIZER', 'auto')).strip().lower()
+    candidates = BACKENDS if name == 'auto' else (name,)
+    if not set(candidates) <= set(_CLASSES):
+        raise ValueError(f'Unknown PDF rasterizer: {name}')
+
+    with _instances_lock:
+        for candidate in candidates:
+            if candidate not in _instances:
+                try:
+                    _instances[candidate] = _CLASSES[candidate]()
+                except ImportError:
+                    _instances[candidate] = None
+            if _instances[candidate] is not None:
+                return _instances[candidate]
+    raise ImportError(f'PDF rasterizer not available: {name}')
+
+
+def render_images(source, page_numbers=None, dpi=300, grayscale=False, region=None, rasterizer=None):
+    """Render pages as PIL images (mode L or RGB) with the configured backend"""
+    rasterizer = rasterizer or get_rasterizer()
+    arrays = rasterizer.render(source, page_numbers, dpi=dpi, grayscale=grayscale, region=region)
+    return [Image.fromarray(array) for array in arrays]
@@ -4,8 +4,10 @@ Based on ML research from fake_detector.py
 """
 import numpy as np
 
+from services.scoring_model import DEFAULT_FRAUD_LIKELIHOOD, DEFAULT_LEVELS, bucket
+
 class ScoringEngine:
-    def __init__(self):
+    def __init__(self, model_store=None):
         # Weights based on ML research (from fake_detector.py)
         # These weights were optimized for certificate forgery detection
         self.weights = {
@@ -14,6 +16,17 @@ class ScoringEngine:
             'signature_authenticity': 0.25  # 25% - Derived from logo+layout
         }
         self.signature_threshold = 0.80  # Threshold for high integrity
+        # Learned weights and thresholds (services/scoring_model.py); without
+        # a fitted version the weights above apply
+        self.model_store = model_store
+
+    def _model(self):
+        return self.model_store.current() if self.model_store is not None else None
+
+    def levels(self):
+        """Active authenticity level thresholds: (minimum score, level), highest first"""
+        model = self._model()
+        return model.levels if model is not None else DEFAULT_LEVELS
     
     def calculate_authenticity_score(self, analysis_results):
         """
@@ -30,19 +43,29 @@ class ScoringEngine:
             # Derive signature score using ML algorithm
             signature_score = self._derive_signature_score(seal_score, layout_score)
             
-            # Calculate weighted average using ML weights
-            final_score = (
-                seal_score * self.weights['logo_match'] +
-                layout_score * self.weights['layout_similarity'] +
-                signature_score * self.weights['signature_authenticity']
-            )
+            model = self._model()
+            final_score = self._combine({
+                'seal_match': seal_score,
+                'layout_similarity': layout_score,
+                'signature_authenticity': signature_score,
+                'ocr_quality': ocr_score
+            }, model)
+            if model is None:
+                weights_used = {
+                    'logo_weight': f"{self.weights['logo_match']*100}%",
+                    'layout_weight': f"{self.weights['layout_similarity']*100}%",
+                    'signature_weight': f"{self.weights['signature_authenticity']*100}%"
+                }
+            else:
+                weights_used = {name: round(float(c), 4) for name, c in zip(model.features, model.coefficients)}
+                weights_used['intercept'] = round(model.intercept, 4)
             
             # Convert to percentage
             final_score_pct = final_score * 100
             
             # Determine fraud likelihood and authenticity level
-            fraud_likelihood = self._calculate_fraud_likelihood(final_score_pct)
-            authenticity_level = self._get_authenticity_level(final_score_pct)
+            fraud_likelihood = self._calculate_fraud_likelihood(final_score_pct, model)
+            authenticity_level = self._get_authenticity_level(final_score_pct, model)
             
             return {
                 'final_score': round(final_score_pct, 2),
@@ -54,11 +77,8 @@ class ScoringEngine:
                     'seal_match': round(seal_score * 100, 2),
                     'signature_authenticity': round(signature_score * 100, 2),
                 },
-                'weights_used': {
-                    'logo_weight': f"{self.weights['logo_match']*100}%",
-                    'layout_weight': f"{self.weights['layout_similarity']*100}%",
-                    'signature_weight': f"{self.weights['signature_authenticity']*100}%"
-                },
+                'weights_used': weights_used,
+                'scoring_version': model.version if model is not None else None,
                 'confidence': self._calculate_confidence(analysis_results)
             }
         except Exception as e:
@@ -69,6 +89,49 @@ class ScoringEngine:
                 'error': str(e)
             }
     
+    def _combine(self, components, model=None):
+        """Final score (0-1) from component scores (0-1, keyed like score_breakdown)"""
+        if model is None:
+            # Calculate weighted average using ML weights
+            return (
+                components['seal_match'] * self.weights['logo_match'] +
+                components['layout_similarity'] * self.weights['layout_similarity'] +
+                components['signature_authenticity'] * self.weights['signature_authenticity']
+            )
+        # Calibrated probability of authenticity from the fitted weights
+        return model.score(components) / 100
+    
+    def score_interval(self, analysis_results, margins):
+        """
+        Range the final score can take when each measured component may be
+        off by its margin (0-1, keyed like score_breakdown) and the signature
+        score falls anywhere in its derivation band
+        Returns: (low, high) in percent
+        """
+        measured = {
+            'seal_match': analysis_results.get('image', {}).get('seal_match_percentage', 60) / 100,
+            'layout_similarity': analysis_results.get('layout', {}).get('layout_similarity', 60) / 100,
+            'ocr_quality': self._calculate_ocr_score(analysis_results.get('ocr', {}))
+        }
+        low = {name: max(0.0, value - margins.get(name, 0.0)) for name, value in measured.items()}
+        high = {name: min(1.0, value + margins.get(name, 0.0)) for name, value in measured.items()}
+        
+        # Signature band (see _derive_signature_score) over the component ranges
+        if low['seal_match'] >= self.signature_threshold and low['layout_similarity'] >= self.signature_threshold:
+            low['signature_authenticity'], high['signature_authenticity'] = 0.90, 1.00
+        elif high['seal_match'] < self.signature_threshold or high['layout_similarity'] < self.signature_threshold:
+            low['signature_authenticity'], high['signature_authenticity'] = 0.40, 0.70
+        else:
+            low['signature_authenticity'], high['signature_authenticity'] = 0.40, 1.00
+        
+        # The score is monotonic in every component; a negative fitted weight swaps its ends
+        model = self._model()
+        if model is not None:
+            signs = dict(zip(model.features, model.coefficients >= 0))
+            low, high = ({name: (low if signs[name] else high)[name] for name in low},
+                         {name: (high if signs[name] else low)[name] for name in low})
+        return self._combine(low, model) * 100, self._combine(high, model) * 100
+    
     def _derive_signature_score(self, logo_score, layout_score):
         """
         Derive signature authenticity score from logo and layout scores
@@ -116,31 +179,15 @@ class ScoringEngine:
         
         return min(1.0, base_score)
     
-    def _calculate_fraud_likelihood(self, score):
-        """Determine fraud likelihood based on score"""
-        if score >= 80:
-            return 'Very Low'
-        elif score >= 65:
-            return 'Low'
-        elif score >= 50:
-            return 'Medium'
-        elif score >= 35:
-            return 'High'
-        else:
-            return 'Very High'
+    def _calculate_fraud_likelihood(self, score, model=None):
+        """Determine fraud likelihood based on score (fitted bands when a scoring model is active)"""
+        model = model or self._model()
+        return bucket(score, model.fraud_likelihood if model is not None else DEFAULT_FRAUD_LIKELIHOOD)
     
-    def _get_authenticity_level(self, score):
-        """Get authenticity level description"""
-        if score >= 85:
-            return 'Highly Authentic'
-        elif score >= 70:
-            return 'Likely Authentic'
-        elif score >= 55:
-            return 'Uncertain'
-        elif score >= 40:
-            return 'Questionable'
-        else:
-            return 'Likely Fraudulent'
+    def _get_authenticity_level(self, score, model=None):
+        """Get authenticity level description (fitted thresholds when a scoring model is active)"""
+        model = model or self._model()
+        return bucket(score, model.levels if model is not None else DEFAULT_LEVELS)
     
     def _calculate_confidence(self, analysis_results):
         """Calculate confidence in the analysis"""
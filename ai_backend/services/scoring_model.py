@@ -0,0 +1,290 @@
+"""
+Learned scoring: component weights and level thresholds fit from labeled outcomes
+`manage.py fit-scoring` joins a labels file (document hash -> authentic or
+fraudulent) with the component scores in the feature store and fits a
+logistic regression (Newton/IRLS in NumPy). The authenticity score becomes
+the calibrated probability, in percent, that the document is authentic.
+
+The authenticity level thresholds are picked on cross-validated scores
+(each document scored by a fit that did not see it): the lowest score at
+which the documents above are at least 99% (Highly Authentic) or 95%
+(Likely Authentic) authentic, and pass at most MAX_FALSE_ACCEPT of the
+fraudulent ones, and the highest below which they are at least 90%
+(Questionable) or 99% (Likely Fraudulent) fraudulent. Only what falls
+between stays Uncertain. Fraud likelihood bands are fraud probabilities
+(5/20/50/80%), which the calibration makes meaningful.
+
+Each fit is saved as a new version (scoring-v0001.json, ...) in
+SCORING_MODEL_DIR. ScoringEngine uses the newest, or SCORING_MODEL_VERSION,
+and re-checks the directory every SCORING_RELOAD_SECONDS, so a new fit or a
+rollback (deleting the newest file) takes effect without a restart.
+"""
+import csv
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# Components, in the 0-1 units ScoringEngine computes them. Not
+# signature_authenticity: ScoringEngine draws it at random from the seal and
+# layout scores, so it carries no evidence of its own
+FEATURES = ('seal_match', 'layout_similarity', 'ocr_quality')
+
+# Built-in thresholds: (minimum score, label), highest first
+DEFAULT_LEVELS = ((85.0, 'Highly Authentic'), (70.0, 'Likely Authentic'), (55.0, 'Uncertain'),
+                  (40.0, 'Questionable'), (0.0, 'Likely Fraudulent'))
+DEFAULT_FRAUD_LIKELIHOOD = ((80.0, 'Very Low'), (65.0, 'Low'), (50.0, 'Medium'), (35.0, 'High'),
+                            (0.0, 'Very High'))
+# For calibrated scores: fraud probability of 5/20/50/80%
+CALIBRATED_FRAUD_LIKELIHOOD = ((95.0, 'Very Low'), (80.0, 'Low'), (50.0, 'Medium'), (20.0, 'High'),
+                               (0.0, 'Very High'))
+
+# Precision targets for the learned level thresholds
+AUTHENTIC_PRECISION = {'Highly Authentic': 0.99, 'Likely Authentic': 0.95}
+FRAUD_PRECISION = {'Likely Fraudulent': 0.99, 'Questionable': 0.90}
+# Share of fraudulent documents the authentic levels may let through
+MAX_FALSE_ACCEPT = 0.02
+
+LABELS = {'1': 1, 'authentic': 1, 'genuine': 1, 'true': 1, '0': 0, 'fraudulent': 0, 'fake': 0, 'false': 0}
+
+
+def bucket(score, thresholds):
+    """Label of the first (minimum score, label) pair the score reaches"""
+    for minimum, label in thresholds:
+        if score >= minimum:
+            return label
+    return thresholds[-1][1]
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+
+def fit_logistic(features, labels, l2=1.0, iterations=50):
+    """
+    L2-regularized logistic regression by Newton's method (the intercept is
+    not penalized)
+    Returns: (coefficients, intercept)
+    """
+    X = np.hstack([np.asarray(features, dtype=np.float64), np.ones((len(features), 1))])
+    y = np.asarray(labels, dtype=np.float64)
+    penalty = np.full(X.shape[1], float(l2))
+    penalty[-1] = 0.0
+    w = np.zeros(X.shape[1])
+    for _ in range(iterations):
+        p = _sigmoid(X @ w)
+        gradient = X.T @ (p - y) + penalty * w
+        hessian = (X * (p * (1 - p))[:, None]).T @ X + np.diag(penalty) + 1e-9 * np.eye(X.shape[1])
+        step = np.linalg.solve(hessian, gradient)
+        w -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return w[:-1], float(w[-1])
+
+
+def _threshold(scores, labels, target, authentic, max_false_accept=None):
+    """
+    Authentic side: the lowest cut such that documents scoring at or above
+    it are at least target authentic and include at most max_false_accept
+    of the fraudulent documents. Fraud side: the highest cut such that
+    documents below it are at least target fraudulent. Cuts fall midway
+    between distinct scores; None when no cut reaches the target.
+    """
+    order = np.argsort(-scores if authentic else scores, kind='stable')
+    ordered = scores[order]
+    hits = labels[order] if authentic else 1 - labels[order]
+    precision = np.cumsum(hits) / np.arange(1, len(ordered) + 1)
+    reached = precision >= target
+    if authentic and max_false_accept is not None:
+        false_accepts = np.cumsum(1 - hits) / max(1, int((1 - labels).sum()))
+        reached &= false_accepts <= max_false_accept
+    # Only cut between different scores
+    boundary = np.append(ordered[1:] != ordered[:-1], True)
+    valid = np.flatnonzero(reached & boundary)
+    if not len(valid):
+        return None
+    i = valid[-1]
+    if i == len(ordered) - 1:
+        return float(ordered[i]) if authentic else float(ordered[i]) + 1e-3
+    return float((ordered[i] + ordered[i + 1]) / 2)
+
+
+def learn_levels(scores, labels, max_false_accept=MAX_FALSE_ACCEPT):
+    """
+    Authenticity level thresholds (score in percent) from the precision
+    targets and the false-accept cap; scores should come from documents the
+    fit did not see (see cross_validated_scores)
+    """
+    scores, labels = np.asarray(scores, dtype=np.float64), np.asarray(labels)
+    highly = _threshold(scores, labels, AUTHENTIC_PRECISION['Highly Authentic'], True, max_false_accept)
+    likely = _threshold(scores, labels, AUTHENTIC_PRECISION['Likely Authentic'], True, max_false_accept)
+    questionable = _threshold(scores, labels, FRAUD_PRECISION['Questionable'], False)
+    fraudulent = _threshold(scores, labels, FRAUD_PRECISION['Likely Fraudulent'], False)
+
+    # Unreachable targets leave that level empty; keep the cuts ordered
+    highly = 100.0 if highly is None else highly
+    likely = min(highly, 100.0 if likely is None else likely)
+    questionable = min(likely, 0.0 if questionable is None else questionable)
+    fraudulent = min(questionable, 0.0 if fraudulent is None else fraudulent)
+    return ((round(highly, 2), 'Highly Authentic'), (round(likely, 2), 'Likely Authentic'),
+            (round(questionable, 2), 'Uncertain'), (round(fraudulent, 2), 'Questionable'),
+            (0.0, 'Likely Fraudulent'))
+
+
+def cross_validated_scores(features, labels, l2=1.0, folds=5, seed=0):
+    """Percent score of every document from a fit on the other folds"""
+    features, labels = np.asarray(features, dtype=np.float64), np.asarray(labels)
+    scores = np.empty(len(labels))
+    for fold in np.array_split(np.random.default_rng(seed).permutation(len(labels)), folds):
+        train = np.setdiff1d(np.arange(len(labels)), fold)
+        coefficients, intercept = fit_logistic(features[train], labels[train], l2)
+        scores[fold] = 100 * _sigmoid(features[fold] @ coefficients + intercept)
+    return scores
+
+
+def evaluate(scores, labels, levels):
+    """Log loss, accuracy and level outcomes of percent scores against labels"""
+    scores, labels = np.asarray(scores, dtype=np.float64), np.asarray(labels)
+    p = np.clip(scores / 100, 1e-6, 1 - 1e-6)
+    assigned = np.array([bucket(s, levels) for s in scores])
+    accepted = np.isin(assigned, ('Highly Authentic', 'Likely Authentic'))
+    rejected = np.isin(assigned, ('Questionable', 'Likely Fraudulent'))
+    return {
+        'documents': int(len(labels)),
+        'log_loss': round(float(-np.mean(labels * np.log(p) + (1 - labels) * np.log(1 - p))), 4),
+        'brier': round(float(np.mean((p - labels) ** 2)), 4),
+        'accuracy': round(float(np.mean((scores >= 50) == (labels == 1))), 4),
+        'uncertain_rate': round(float(np.mean(assigned == 'Uncertain')), 4),
+        # Fraudulent documents reported authentic, authentic ones reported fraudulent
+        'false_accept_rate': round(float(np.mean(accepted[labels == 0])), 4) if (labels == 0).any() else None,
+        'false_reject_rate': round(float(np.mean(rejected[labels == 1])), 4) if (labels == 1).any() else None
+    }
+
+
+class ScoringModel:
+    """One fitted version: logistic weights over FEATURES plus level thresholds"""
+
+    def __init__(self, data):
+        self.data = data
+        self.version = data.get('version')
+        self.features = tuple(data['features'])
+        self.coefficients = np.asarray(data['coefficients'], dtype=np.float64)
+        self.intercept = float(data['intercept'])
+        self.levels = tuple((float(t), label) for t, label in data['levels'])
+        self.fraud_likelihood = tuple((float(t), label) for t, label in data['fraud_likelihood'])
+
+    @classmethod
+    def fit(cls, features, labels, l2=1.0, folds=5, max_false_accept=MAX_FALSE_ACCEPT):
+        """
+        features: (documents x FEATURES) in 0-1; labels: 1 authentic, 0 fraudulent.
+        Weights are fit on every document, level thresholds on folds-way
+        cross-validated scores, so they are not tuned to scores the fit
+        has memorized
+        """
+        coefficients, intercept = fit_logistic(features, labels, l2)
+        scores = cross_validated_scores(features, labels, l2, folds)
+        return cls({
+            'features': list(FEATURES),
+            'coefficients': [round(float(c), 6) for c in coefficients],
+            'intercept': round(intercept, 6),
+            'levels': [list(level) for level in learn_levels(scores, labels, max_false_accept)],
+            'fraud_likelihood': [list(band) for band in CALIBRATED_FRAUD_LIKELIHOOD]
+        })
+
+    def scores(self, features):
+        """Authenticity scores in percent for a (documents x features) array"""
+        return 100 * _sigmoid(np.asarray(features, dtype=np.float64) @ self.coefficients + self.intercept)
+
+    def score(self, components):
+        """Authenticity score in percent from a dict of component scores (0-1)"""
+        return float(self.scores(np.array([components[name] for name in self.features]))[()])
+
+
+class ScoringModelStore:
+    """Versioned scoring files in one directory, re-read when they change"""
+
+    PATTERN = re.compile(r'^scoring-v(\d+)\.json$')
+
+    def __init__(self, directory, version=None, reload_interval=30.0):
+        self.directory = directory
+        # Pinned version; None follows the newest file
+        self.version = version
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._checked = 0.0
+
+    @classmethod
+    def from_env(cls):
+        directory = os.getenv('SCORING_MODEL_DIR', 'data/scoring')
+        if not directory:
+            return None
+        version = os.getenv('SCORING_MODEL_VERSION', '')
+        return cls(directory, version=int(version) if version else None,
+                   reload_interval=float(os.getenv('SCORING_RELOAD_SECONDS', 30)))
+
+    def versions(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(m.group(1)) for m in map(self.PATTERN.match, os.listdir(self.directory)) if m)
+
+    def path(self, version):
+        return os.path.join(self.directory, f'scoring-v{version:04d}.json')
+
+    def save(self, model, metadata=None):
+        """Write the model as the next version (atomically); returns the version"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            version = (self.versions() or [0])[-1] + 1
+            data = dict(model.data, version=version, created=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                        **(metadata or {}))
+            temporary = self.path(version) + '.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(temporary, self.path(version))
+        model.data, model.version = data, version
+        return version
+
+    def current(self):
+        """The active model, or None to use the built-in weights"""
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return self._model
+        with self._lock:
+            if now - self._checked < self.reload_interval:
+                return self._model
+            self._checked = now
+            versions = self.versions()
+            wanted = self.version if self.version in versions else (versions[-1] if versions else None)
+            if self.version is not None and self.version not in versions:
+                print(f"⚠️  Scoring version {self.version} not found in {self.directory}")
+            if wanted is None:
+                self._model = None
+            elif self._model is None or self._model.version != wanted:
+                try:
+                    with open(self.path(wanted)) as f:
+                        self._model = ScoringModel(json.load(f))
+                    print(f"✅ Scoring model v{wanted} loaded")
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"⚠️  Could not load scoring model v{wanted}: {e}")
+            return self._model
+
+
+def read_labels(path):
+    """
+    Labels from a CSV with document_hash and label columns (label: 1 or
+    authentic/genuine, 0 or fraudulent/fake)
+    Returns: dict document hash (lowercase, 0x-prefixed) -> 1 or 0
+    """
+    labels = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            document_hash = (row.get('document_hash') or '').strip().lower()
+            label = LABELS.get((row.get('label') or '').strip().lower())
+            if not document_hash or label is None:
+                continue
+            labels[document_hash if document_hash.startswith('0x') else '0x' + document_hash] = label
+    return labels
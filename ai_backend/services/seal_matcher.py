@@ -0,0 +1,313 @@
+"""
+Seal / logo localization with FFT normalized cross-correlation
+Matches the page against the reference logos in Fake/images/logo_data/<institution>
+coarse-to-fine over an image pyramid:
+    coarse - the whole page, reduced to a small canvas, is correlated with every
+             reference at a ladder of scales to propose locations
+    fine   - each institution's strongest proposals are re-scored on a detail
+             crop of the page, where small logos are no longer blobs
+Template spectra for both levels are computed once at startup, so a request
+costs one page FFT, one batched inverse FFT and a few small crop FFTs.
+"""
+import os
+
+from PIL import Image, ImageFilter
+import numpy as np
+
+DEFAULT_LOGO_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'Fake', 'images', 'logo_data')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def _load_logo(path):
+    """Grayscale logo on white with its uniform margins trimmed"""
+    image = Image.open(path)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    gray = image.convert('L')
+
+    a = np.asarray(gray, dtype=np.int16)
+    corner = int(np.median([a[0, 0], a[0, -1], a[-1, 0], a[-1, -1]]))
+    rows, cols = np.nonzero(np.abs(a - corner) > 24)
+    if len(rows) == 0:
+        return None
+    return gray.crop((cols.min(), rows.min(), cols.max() + 1, rows.max() + 1))
+
+
+def _integral(a):
+    integral = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    integral[1:, 1:] = a.cumsum(axis=0).cumsum(axis=1)
+    return integral
+
+
+def _window_sums(integral, h, w):
+    """Sum of every h x w window (top-left anchored) from an integral image"""
+    return integral[h:, w:] - integral[:-h, w:] - integral[h:, :-w] + integral[:-h, :-w]
+
+
+def _resize(image, size, blur):
+    """Resize to size; blur low-passes so NCC tolerates sub-pixel and scale offsets"""
+    resized = image.resize(size, Image.BILINEAR)
+    if blur:
+        resized = resized.filter(ImageFilter.GaussianBlur(blur))
+    return np.asarray(resized, dtype=np.float32)
+
+
+def _template_spectrum(logo, width, canvas, blur=0):
+    """Conjugate spectrum of a zero-mean, unit-norm template padded to the canvas"""
+    height = max(4, round(logo.height * width / logo.width))
+    if height >= canvas // 2 or width >= canvas // 2:
+        return None
+    t = _resize(logo, (width, height), blur)
+    t = t - t.mean()
+    norm = np.linalg.norm(t)
+    if norm < 1e-3:
+        return None
+    padded = np.zeros((canvas, canvas), dtype=np.float32)
+    padded[:height, :width] = t / norm
+    return np.conj(np.fft.rfft2(padded)).astype(np.complex64), (height, width)
+
+
+def _ncc_maps(image_array, spectra, shapes, canvas, min_contrast):
+    """
+    Normalized cross-correlation of an image (fits in the canvas) with a
+    stack of template spectra. Yields (index, ncc map) for templates that fit.
+    """
+    height, width = image_array.shape
+    padded = np.zeros((canvas, canvas), dtype=np.float32)
+    padded[:height, :width] = image_array
+    spectrum = np.fft.rfft2(padded).astype(np.complex64)
+
+    # Local energy of the image under each template window, per template size
+    integral = _integral(image_array)
+    integral_squares = _integral(image_array * image_array)
+    energy = {}
+    for h, w in set(shapes):
+        if h > height or w > width:
+            continue
+        sums = _window_sums(integral, h, w)
+        squares = _window_sums(integral_squares, h, w)
+        variance = np.maximum(squares - sums * sums / (h * w), 0) / (h * w)
+        window_energy = np.sqrt(variance * (h * w))
+        # Windows flatter than min_contrast (grey-level std) cannot hold a logo
+        window_energy[variance < min_contrast ** 2] = np.inf
+        energy[(h, w)] = window_energy
+
+    correlations = np.fft.irfft2(spectra * spectrum[None], s=(canvas, canvas))
+    for index, correlation in enumerate(correlations):
+        h, w = shapes[index]
+        if (h, w) in energy:
+            yield index, correlation[:height - h + 1, :width - w + 1] / energy[(h, w)]
+
+
+def _overlap(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    width = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    height = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / (a[2] * a[3] + b[2] * b[3] - intersection)
+
+
+class SealMatcher:
+    def __init__(self, logo_dir=DEFAULT_LOGO_DIR, coarse_canvas=160, coarse_widths=None, coarse_blur=0.8,
+                 fine_canvas=128, fine_width=48, fine_scales=(0.8, 0.85, 0.9, 0.95, 1.0, 1.05, 1.1, 1.18, 1.25),
+                 fine_blur=0.6, candidates=4, batch_size=64, min_contrast=8.0, min_score=0.5, min_margin=0.05):
+        self.logo_dir = logo_dir
+        self.coarse_canvas = coarse_canvas
+        # Geometric ladder of logo widths on the coarse canvas (~6%-40% of it);
+        # smaller templates correlate well with any stroke and only add noise
+        self.coarse_widths = coarse_widths or tuple(sorted({int(10 * 1.2 ** i) for i in range(11)}))
+        self.coarse_blur = coarse_blur
+        self.fine_canvas = fine_canvas
+        self.fine_width = fine_width
+        self.fine_scales = fine_scales
+        # Thin strokes at 48 px lose most of their NCC to a sub-pixel offset
+        self.fine_blur = fine_blur
+        # Proposals re-scored per institution, so one with many references
+        # cannot crowd the others out
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.min_contrast = min_contrast
+        # Below this fine-level NCC no reference logo is considered present
+        self.min_score = min_score
+        # ... and the best institution must lead every other one by this much
+        self.min_margin = min_margin
+
+        self.classes = []
+        # Per reference image: its class index and file
+        self._reference_class = []
+        self.reference_paths = []
+        # Coarse level: one template per (reference, width)
+        self._coarse_spectra = None
+        self._coarse_reference = []
+        self._coarse_shapes = []
+        # Fine level: per reference, stacked spectra and shapes over fine_scales
+        self._fine = []
+        self._load_templates()
+
+    @property
+    def ready(self):
+        return self._coarse_spectra is not None
+
+    def _load_templates(self):
+        """Precompute the template spectra of both pyramid levels"""
+        if not self.logo_dir or not os.path.isdir(self.logo_dir):
+            return
+
+        coarse = []
+        for class_name in sorted(os.listdir(self.logo_dir)):
+            class_dir = os.path.join(self.logo_dir, class_name)
+            if not os.path.isdir(class_dir):
+                continue
+            class_index = len(self.classes)
+            self.classes.append(class_name)
+
+            for filename in sorted(os.listdir(class_dir)):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(class_dir, filename)
+                try:
+                    logo = _load_logo(path)
+                except OSError:
+                    continue
+                if logo is None:
+                    continue
+
+                fine = [_template_spectrum(logo, round(self.fine_width * s), self.fine_canvas, self.fine_blur)
+                        for s in self.fine_scales]
+                fine = [f for f in fine if f is not None]
+                if not fine:
+                    continue
+
+                reference = len(self._reference_class)
+                self._reference_class.append(class_index)
+                self.reference_paths.append(path)
+                self._fine.append((np.stack([f[0] for f in fine]), [f[1] for f in fine]))
+
+                for width in self.coarse_widths:
+                    template = _template_spectrum(logo, width, self.coarse_canvas, self.coarse_blur)
+                    if template is not None:
+                        coarse.append(template[0])
+                        self._coarse_reference.append(reference)
+                        self._coarse_shapes.append(template[1])
+
+        if coarse:
+            self._coarse_spectra = np.stack(coarse)
+
+    def match(self, image):
+        """
+        Locate the best-matching reference logo on a page
+        Returns: dict with institution, score (0-1 NCC), bbox in page pixels
+        (both None below min_score or min_margin) and per-institution scores,
+        or None without templates
+        """
+        if not self.ready:
+            return None
+
+        gray = image.convert('L')
+        scale = self.coarse_canvas / max(gray.size)
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        page = _resize(gray, size, self.coarse_blur)
+
+        # Coarse level: best location per template. A small template peaks on
+        # any stroke, so every width stays a proposal, ranked by its NCC less
+        # the 1/sqrt(area) a template of that size reaches by chance
+        proposals = {}
+        for start in range(0, len(self._coarse_spectra), self.batch_size):
+            stop = start + self.batch_size
+            maps = _ncc_maps(page, self._coarse_spectra[start:stop], self._coarse_shapes[start:stop],
+                             self.coarse_canvas, self.min_contrast)
+            for offset, ncc in maps:
+                index = start + offset
+                y, x = np.unravel_index(np.argmax(ncc), ncc.shape)
+                reference = self._coarse_reference[index]
+                h, w = self._coarse_shapes[index]
+                proposals.setdefault(self._reference_class[reference], []).append(
+                    (float(ncc[y, x]) - 1 / np.sqrt(h * w), reference, (x / scale, y / scale, w / scale, h / scale)))
+
+        if not proposals:
+            return None
+
+        # Fine level: re-score each class's strongest distinct proposals on
+        # page-resolution crops, each reference's best location first
+        ranked = []
+        for class_proposals in proposals.values():
+            ordered = sorted(class_proposals, key=lambda p: p[0], reverse=True)
+            best_per_reference = {}
+            for proposal in ordered:
+                best_per_reference.setdefault(proposal[1], proposal)
+            kept = []
+            for proposal in list(best_per_reference.values()) + ordered:
+                if all(_overlap(proposal[2], other[2]) < 0.5 for other in kept):
+                    kept.append(proposal)
+                    if len(kept) == self.candidates:
+                        break
+            ranked.extend(kept)
+        class_scores = np.zeros(len(self.classes))
+        best = None
+        for _, reference, bbox in ranked:
+            refined = self._refine(gray, reference, bbox)
+            if refined is None:
+                continue
+            score, refined_bbox = refined
+            class_index = self._reference_class[reference]
+            class_scores[class_index] = max(class_scores[class_index], score)
+            if best is None or score > best[0]:
+                best = (score, class_index, refined_bbox)
+
+        if best is None:
+            return None
+
+        score, class_index, bbox = best
+        runner_up = max((s for i, s in enumerate(class_scores) if i != class_index), default=0.0)
+        found = score >= self.min_score and score - runner_up >= self.min_margin
+        return {
+            'institution': self.classes[class_index] if found else None,
+            'score': round(min(max(score, 0.0), 1.0), 4),
+            'bbox': [int(v) for v in bbox] if found else None,
+            'class_scores': {name: round(float(s), 4) for name, s in zip(self.classes, class_scores)}
+        }
+
+    def _refine(self, gray, reference, bbox):
+        """NCC of one reference around a coarse proposal at fine resolution"""
+        x, y, w, h = bbox
+        # Crop with a margin so the fine scale ladder and small offsets fit
+        margin = 0.3 * max(w, h)
+        left, top = max(0, int(x - margin)), max(0, int(y - margin))
+        right, bottom = min(gray.width, int(x + w + margin)), min(gray.height, int(y + h + margin))
+        factor = self.fine_width / max(w, 1)
+        size = (max(1, round((right - left) * factor)), max(1, round((bottom - top) * factor)))
+        if max(size) > self.fine_canvas:
+            return None
+
+        crop = _resize(gray.crop((left, top, right, bottom)), size, self.fine_blur)
+        spectra, shapes = self._fine[reference]
+        best = None
+        for index, ncc in _ncc_maps(crop, spectra, shapes, self.fine_canvas, self.min_contrast):
+            ty, tx = np.unravel_index(np.argmax(ncc), ncc.shape)
+            score = float(ncc[ty, tx])
+            if best is None or score > best[0]:
+                th, tw = shapes[index]
+                best = (score, (left + tx / factor, top + ty / factor, tw / factor, th / factor))
+        return best
+
+    def self_check(self, widths=(250, 400), page_size=(1240, 1754)):
+        """
+        Match every reference logo pasted on a blank page at each width
+        Returns: (path, width, institution found, class scores) for each paste
+        not matched to its own institution; empty when every logo is
+        """
+        failures = []
+        for path, class_index in zip(self.reference_paths, self._reference_class):
+            logo = _load_logo(path)
+            for width in widths:
+                page = Image.new('L', page_size, 255)
+                page.paste(logo.resize((width, max(1, round(logo.height * width / logo.width))), Image.BILINEAR),
+                           (page_size[0] // 8, page_size[1] // 16))
+                match = self.match(page)
+                if match is None or match['institution'] != self.classes[class_index]:
+                    failures.append((path, width, match and match['institution'], match and match['class_scores']))
+        return failures
@@ -1,37 +1,42 @@
 """
-Simplified Signature Checker (without OpenCV)
+Signature Checker (without OpenCV)
+Locates signature-like ink regions and compares them with enrolled specimens
 """
-from pdf2image import convert_from_path
 from PIL import Image, ImageStat
 import numpy as np
 
+from services.multipage import render_first_page, map_pages, to_page_bbox
+from services.signature_matcher import find_signature_candidates
+
 class SignatureChecker:
-    def __init__(self):
-        pass
+    def __init__(self, specimen_store=None, signature_model=None):
+        self.specimen_store = specimen_store
+        # Optional signature-presence head of the fused model
+        # (services/model_runtime.py); replaces the variance heuristic
+        self.signature_model = signature_model
+        # Similarity at or below this maps to a 0 score
+        self.similarity_floor = 0.30
     
-    def check_signature_authenticity(self, pdf_path):
+    def check_signature_authenticity(self, pdf_path, pages=None, issuer=None, checkpoint=None):
         """
         Analyze signature authenticity using PIL
+        pages: optional list of (page_number, image) already rendered;
+        defaults to the first page
+        issuer: institution name used to pick specimens (all issuers if unknown)
+        checkpoint: optional per-page checkpoint (see multipage.map_pages)
         Returns: dict with signature analysis results
         """
         try:
             # Convert PDF to image
-            images = convert_from_path(pdf_path, dpi=300)
-            if not images:
+            if pages is None:
+                pages = render_first_page(pdf_path)
+            if not pages:
                 return {'success': False, 'error': 'Failed to convert PDF'}
             
-            image = images[0]
-            
-            # Simple signature detection
-            signature_detected = self._detect_signature_simple(image)
-            authenticity_score = self._analyze_signature_simple(image)
-            
-            return {
-                'success': True,
-                'signature_detected': signature_detected,
-                'authenticity_score': authenticity_score,
-                'signature_quality': self._assess_signature_quality(authenticity_score)
-            }
+            # Signatures often sit on the last page, so check every page given
+            page_results = map_pages(lambda image: self._analyze_page(image, issuer), pages,
+                                     checkpoint=checkpoint)
+            return self._aggregate(page_results)
         except Exception as e:
             return {
                 'success': False,
@@ -40,6 +45,81 @@ class SignatureChecker:
                 'authenticity_score': 0
             }
     
+    def _analyze_page(self, image, issuer=None):
+        """Signature detection and scoring for one page"""
+        try:
+            candidates = find_signature_candidates(image)
+        except Exception:
+            candidates = None
+        
+        presence = self._signature_presence(image)
+        if candidates is None:
+            # Region search failed: fall back to the model, then the global heuristic
+            return {
+                'signature_detected': presence >= 0.5 if presence is not None else self._detect_signature_simple(image),
+                'authenticity_score': self._analyze_signature_simple(image),
+                'signature_presence': presence,
+                'regions': [],
+                'specimen_match': None
+            }
+        
+        specimen_match = self._match_specimens(candidates, issuer)
+        if specimen_match is not None:
+            specimen_match['bbox'] = to_page_bbox(image, specimen_match['bbox'])
+            authenticity_score = self._similarity_to_score(specimen_match['similarity'])
+        else:
+            authenticity_score = self._analyze_signature_simple(image)
+        
+        return {
+            'signature_detected': bool(candidates),
+            'authenticity_score': authenticity_score,
+            'signature_presence': presence,
+            'regions': [{'bbox': to_page_bbox(image, c['bbox']), 'likelihood': c['likelihood']} for c in candidates],
+            'specimen_match': specimen_match
+        }
+    
+    def _signature_presence(self, image):
+        """Model probability that the page is signed, or None without a model"""
+        if self.signature_model is None:
+            return None
+        return self.signature_model.classify(image)['confidence']
+    
+    def _match_specimens(self, candidates, issuer):
+        """Best specimen match over all candidate regions, or None without specimens"""
+        if self.specimen_store is None or not candidates or not self.specimen_store.issuers():
+            return None
+        
+        best = None
+        for candidate in candidates:
+            match = self.specimen_store.match(candidate['ink'], issuer)
+            if match is not None and (best is None or match['similarity'] > best['similarity']):
+                best = dict(match, bbox=candidate['bbox'])
+        if best is not None:
+            best['similarity'] = round(best['similarity'], 4)
+        return best
+    
+    def _similarity_to_score(self, similarity):
+        """Map cosine similarity to a 0-100 authenticity score"""
+        scaled = (similarity - self.similarity_floor) / (1 - self.similarity_floor)
+        return round(float(np.clip(scaled, 0, 1)) * 100, 2)
+    
+    def _aggregate(self, page_results):
+        """Report the best page that carries a signature (or the best page overall)"""
+        signed = [item for item in page_results if item[1]['signature_detected']]
+        best_page, best = max(signed or page_results, key=lambda item: item[1]['authenticity_score'])
+        
+        return {
+            'success': True,
+            'signature_detected': bool(signed),
+            'authenticity_score': best['authenticity_score'],
+            'signature_quality': self._assess_signature_quality(best['authenticity_score']),
+            'signature_page': best_page,
+            'signature_presence': best.get('signature_presence'),
+            'regions': best.get('regions', []),
+            'specimen_match': best.get('specimen_match'),
+            'pages_analyzed': [number for number, _ in page_results]
+        }
+    
     def _detect_signature_simple(self, image):
         """Simple signature detection"""
         try:
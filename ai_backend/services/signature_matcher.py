@@ -0,0 +1,264 @@
+"""
+Signature region detection and specimen matching
+Finds ink-stroke regions that look like handwritten signatures with connected
+components on a binarized page, turns each one into a compact descriptor and
+compares it with specimens enrolled per issuer.
+"""
+import os
+import re
+import threading
+
+from PIL import Image
+import numpy as np
+
+# Working resolution for region search (300 dpi pages are reduced 4x)
+DOWNSAMPLE = 4
+# Normalized signature crop (height, width) used for descriptors
+CROP_SHAPE = (32, 96)
+
+
+def _downsample(gray, factor):
+    """Block-mean reduction through a reshape view"""
+    h, w = (gray.shape[0] // factor) * factor, (gray.shape[1] // factor) * factor
+    return gray[:h, :w].reshape(h // factor, factor, w // factor, factor).mean(axis=(1, 3))
+
+
+def otsu_threshold(gray):
+    """Otsu's threshold from a 256-bin histogram"""
+    hist = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    cum_mean = np.cumsum(hist * np.arange(256))
+    mean_bg = cum_mean / np.maximum(weight_bg, 1)
+    mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return int(np.argmax(between))
+
+
+def binarize(gray):
+    """Ink mask (True = ink) from a grayscale array"""
+    return gray <= otsu_threshold(gray)
+
+
+def _dilate(mask, dy, dx):
+    """Grow the mask by dy rows / dx columns with shifted ORs"""
+    out = mask.copy()
+    for shift in range(1, dx + 1):
+        out[:, shift:] |= mask[:, :-shift]
+        out[:, :-shift] |= mask[:, shift:]
+    grown = out.copy()
+    for shift in range(1, dy + 1):
+        grown[shift:, :] |= out[:-shift, :]
+        grown[:-shift, :] |= out[shift:, :]
+    return grown
+
+
+def connected_components(mask):
+    """
+    8-connected components from horizontal runs with union-find.
+    Returns: list of dicts with bbox (x0, y0, x1, y1) and pixel count
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    changes = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(changes == 1)
+    _, end_cols = np.nonzero(changes == -1)
+    # Runs come out in row-major order, so starts and ends pair up
+    runs = np.stack([start_rows, start_cols, end_cols], axis=1)
+    if len(runs) == 0:
+        return []
+
+    parent = list(range(len(runs)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    row_starts = np.searchsorted(runs[:, 0], np.arange(mask.shape[0] + 1))
+    for row in range(1, mask.shape[0]):
+        prev_lo, prev_hi = row_starts[row - 1], row_starts[row]
+        cur_lo, cur_hi = row_starts[row], row_starts[row + 1]
+        i, j = prev_lo, cur_lo
+        while i < prev_hi and j < cur_hi:
+            # Runs [s, e) overlap 8-connected when s1 <= e2 and s2 <= e1
+            if runs[i, 1] <= runs[j, 2] and runs[j, 1] <= runs[i, 2]:
+                a, b = find(i), find(j)
+                if a != b:
+                    parent[b] = a
+            if runs[i, 2] < runs[j, 2]:
+                i += 1
+            else:
+                j += 1
+
+    components = {}
+    for index, (row, start, end) in enumerate(runs):
+        root = find(index)
+        comp = components.get(root)
+        if comp is None:
+            components[root] = [start, row, end, row + 1, end - start]
+        else:
+            comp[0] = min(comp[0], start)
+            comp[2] = max(comp[2], end)
+            comp[3] = row + 1
+            comp[4] += end - start
+
+    return [{'bbox': tuple(int(v) for v in c[:4]), 'pixels': int(c[4])} for c in components.values()]
+
+
+def signature_descriptor(ink):
+    """
+    Compact descriptor of a signature ink mask: grid densities, projection
+    profiles and a stroke-direction histogram, L2-normalized (96 values)
+    """
+    crop = Image.fromarray((ink * 255).astype(np.uint8)).resize(CROP_SHAPE[::-1], Image.BILINEAR)
+    a = np.asarray(crop, dtype=np.float32) / 255.0
+
+    grid = a.reshape(4, 8, 12, 8).mean(axis=(1, 3)).ravel()
+    rows = a.mean(axis=1).reshape(16, 2).mean(axis=1)
+    cols = a.mean(axis=0).reshape(24, 4).mean(axis=1)
+
+    gy, gx = np.gradient(a)
+    magnitude = np.hypot(gx, gy)
+    angle = np.mod(np.arctan2(gy, gx), np.pi)
+    directions = np.bincount((angle / np.pi * 8).astype(int).clip(0, 7).ravel(),
+                             weights=magnitude.ravel(), minlength=8)
+    directions = directions / (directions.sum() + 1e-6)
+
+    vector = np.concatenate([grid, rows, cols, directions]).astype(np.float32)
+    vector -= vector.mean()
+    return vector / (np.linalg.norm(vector) + 1e-6)
+
+
+def find_signature_candidates(image, max_candidates=3):
+    """
+    Locate ink regions shaped like handwritten signatures
+    Returns: list of dicts with bbox (page pixels), likelihood and the
+    region's ink mask, best first
+    """
+    gray = _downsample(np.asarray(image.convert('L'), dtype=np.float32), DOWNSAMPLE)
+    ink = binarize(gray)
+    page_h, page_w = ink.shape
+
+    # Join the strokes of one signature (and the letters of printed words)
+    regions = connected_components(_dilate(ink, 2, 4))
+
+    candidates = []
+    for region in regions:
+        x0, y0, x1, y1 = region['bbox']
+        w, h = x1 - x0, y1 - y0
+        if w < page_w * 0.06 or h < page_h * 0.01 or h > page_h * 0.15:
+            continue
+        aspect = w / h
+        if not 1.5 <= aspect <= 12:
+            continue
+
+        region_ink = ink[y0:y1, x0:x1]
+        fill = region_ink.mean()
+        # Printed text lines are dense and flat; signatures are sparse loops
+        if not 0.03 <= fill <= 0.35:
+            continue
+
+        # Height variation across columns separates cursive from print
+        column_heights = region_ink.sum(axis=0)
+        irregularity = column_heights.std() / (column_heights.mean() + 1e-6)
+        lower_half = 1.0 if y0 > page_h / 2 else 0.6
+        likelihood = min(1.0, irregularity / 1.5) * lower_half
+
+        candidates.append({
+            'bbox': [x0 * DOWNSAMPLE, y0 * DOWNSAMPLE, w * DOWNSAMPLE, h * DOWNSAMPLE],
+            'likelihood': round(float(likelihood), 3),
+            'ink': region_ink
+        })
+
+    candidates.sort(key=lambda c: c['likelihood'], reverse=True)
+    return candidates[:max_candidates]
+
+
+def issuer_key(name):
+    """Normalize an issuer name into a store key"""
+    return re.sub(r'[^a-z0-9]+', '_', (name or '').lower()).strip('_')
+
+
+class SpecimenStore:
+    """
+    Per-issuer signature specimens, one .npz file per issuer.
+    Descriptors are computed at enrollment, so a lookup is one small
+    matrix-vector product against the issuer's matrix.
+    """
+
+    def __init__(self, directory, cross_issuer=False):
+        self.directory = directory
+        # Search every issuer's specimens when the document's is not enrolled
+        self.cross_issuer = cross_issuer
+        self._lock = threading.Lock()
+        # issuer key -> (descriptor matrix, signer labels)
+        self._index = {}
+        self.load()
+
+    def load(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npz'):
+                data = np.load(os.path.join(self.directory, filename))
+                with self._lock:
+                    self._index[filename[:-4]] = (data['descriptors'], list(data['labels']))
+
+    def issuers(self):
+        with self._lock:
+            return sorted(self._index)
+
+    def enroll(self, issuer, signer, images):
+        """Add specimen images (cropped signatures) for an issuer's signer"""
+        key = issuer_key(issuer)
+        descriptors = []
+        for image in images:
+            gray = np.asarray(image.convert('L'), dtype=np.float32)
+            ink = binarize(gray)
+            rows, cols = np.nonzero(ink)
+            if len(rows) == 0:
+                continue
+            descriptors.append(signature_descriptor(ink[rows.min():rows.max() + 1, cols.min():cols.max() + 1]))
+        if not descriptors:
+            raise ValueError('No ink found in the specimen images')
+
+        with self._lock:
+            matrix, labels = self._index.get(key, (np.zeros((0, len(descriptors[0])), np.float32), []))
+            matrix = np.vstack([matrix, np.stack(descriptors)])
+            labels = labels + [signer] * len(descriptors)
+            self._index[key] = (matrix, labels)
+
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(os.path.join(self.directory, f'{key}.npz'), descriptors=matrix, labels=np.array(labels))
+        return len(descriptors)
+
+    def match(self, ink, issuer=None):
+        """
+        Nearest specimen by cosine similarity within the issuer's specimens.
+        An issuer that is not enrolled has no match, unless the store was
+        opened with cross_issuer (then all issuers are searched)
+        Returns: dict with issuer, signer and similarity, or None
+        """
+        key = issuer_key(issuer)
+        with self._lock:
+            if key in self._index:
+                groups = {key: self._index[key]}
+            elif self.cross_issuer:
+                groups = dict(self._index)
+            else:
+                return None
+        query = signature_descriptor(ink)
+
+        best = None
+        for group_key, (matrix, labels) in groups.items():
+            if len(matrix) == 0:
+                continue
+            similarities = matrix @ query
+            index = int(np.argmax(similarities))
+            if best is None or similarities[index] > best['similarity']:
+                best = {'issuer': group_key, 'signer': str(labels[index]),
+                        'similarity': float(similarities[index])}
+        return best
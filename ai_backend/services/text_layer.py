@@ -0,0 +1,151 @@
+"""
+Embedded text-layer extraction
+Reads the text a PDF already carries (no OCR), one page at a time, with a
+bounding box per word, so callers can stop as soon as they have what they
+need instead of extracting a 300-page document in full.
+
+TEXT_LAYER_BACKEND picks the backend: auto (default: pdfium, then mupdf,
+then pypdf, whichever is installed), pdfium, mupdf or pypdf. The pypdf
+backend (pypdf, or PyPDF2 on older installs) gives text without word boxes.
+Pass words=False when only the text is needed (word boxes cost about as
+much as the text itself).
+
+Pages come out as dicts:
+    {'page': 1, 'text': '...', 'words': [{'text': 'Bachelor', 'bbox': [x, y, w, h]}, ...]}
+with boxes in page pixels at 300 dpi, like the analyzers' regions.
+"""
+import io
+import os
+import re
+import threading
+
+from services.rasterizer import MUPDF_LOCK, PDFIUM_LOCK
+
+BACKENDS = ('pdfium', 'mupdf', 'pypdf')
+PIXELS_PER_POINT = 300 / 72
+
+
+def _pixel_box(left, top, right, bottom):
+    """Box in points (top-left origin) to [x, y, w, h] in 300 dpi pixels"""
+    return [round(left * PIXELS_PER_POINT), round(top * PIXELS_PER_POINT),
+            round((right - left) * PIXELS_PER_POINT), round((bottom - top) * PIXELS_PER_POINT)]
+
+
+class PdfiumTextLayer:
+    """pypdfium2 text pages: word boxes from per-character boxes"""
+    name = 'pdfium'
+
+    def __init__(self):
+        import pypdfium2
+        self._pdfium = pypdfium2
+
+    def iter_pages(self, source, page_numbers=None, words=True):
+        # The library lock is held per page, not while the caller works
+        with PDFIUM_LOCK:
+            document = self._pdfium.PdfDocument(source)
+            numbers = page_numbers or range(1, len(document) + 1)
+        try:
+            for number in numbers:
+                with PDFIUM_LOCK:
+                    page = self._read_page(document, number, words)
+                yield page
+        finally:
+            with PDFIUM_LOCK:
+                document.close()
+
+    def _read_page(self, document, number, with_words):
+        page = document[number - 1]
+        textpage = page.get_textpage()
+        try:
+            height = page.get_height()
+            text = textpage.get_text_range()
+            words = []
+            for match in re.finditer(r'\S+', text) if with_words else ():
+                boxes = [textpage.get_charbox(i) for i in range(match.start(), match.end())]
+                boxes = [b for b in boxes if b[2] > b[0]]
+                if not boxes:
+                    continue
+                # PDFium boxes are (left, bottom, right, top), origin bottom-left
+                words.append({'text': match.group(), 'bbox': _pixel_box(
+                    min(b[0] for b in boxes), height - max(b[3] for b in boxes),
+                    max(b[2] for b in boxes), height - min(b[1] for b in boxes))})
+        finally:
+            textpage.close()
+            page.close()
+        return {'page': number, 'text': text.replace('\r\n', '\n'), 'words': words}
+
+
+class MuPDFTextLayer:
+    """PyMuPDF: words with boxes straight from the text extractor"""
+    name = 'mupdf'
+
+    def __init__(self):
+        try:
+            import pymupdf as fitz
+        except ImportError:  # PyMuPDF < 1.24
+            import fitz
+        self._fitz = fitz
+
+    def iter_pages(self, source, page_numbers=None, words=True):
+        with MUPDF_LOCK:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                document = self._fitz.open(stream=bytes(source), filetype='pdf')
+            else:
+                document = self._fitz.open(source)
+            numbers = page_numbers or range(1, document.page_count + 1)
+        try:
+            for number in numbers:
+                with MUPDF_LOCK:
+                    page = document[number - 1]
+                    text = page.get_text()
+                    boxes = [{'text': w[4], 'bbox': _pixel_box(*w[:4])} for w in page.get_text('words')] if words else []
+                yield {'page': number, 'text': text, 'words': boxes}
+        finally:
+            with MUPDF_LOCK:
+                document.close()
+
+
+class PyPDFTextLayer:
+    """pypdf (or PyPDF2): pure Python, text only"""
+    name = 'pypdf'
+
+    def __init__(self):
+        try:
+            import pypdf
+        except ImportError:
+            import PyPDF2 as pypdf
+        self._pypdf = pypdf
+
+    def iter_pages(self, source, page_numbers=None, words=True):
+        stream = io.BytesIO(bytes(source)) if isinstance(source, (bytes, bytearray, memoryview)) else source
+        reader = self._pypdf.PdfReader(stream)
+        numbers = page_numbers or range(1, len(reader.pages) + 1)
+        for number in numbers:
+            yield {'page': number, 'text': reader.pages[number - 1].extract_text() or '', 'words': []}
+
+
+_CLASSES = {'pdfium': PdfiumTextLayer, 'mupdf': MuPDFTextLayer, 'pypdf': PyPDFTextLayer}
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_text_layer(name=None):
+    """
+    Shared text-layer reader for a backend name (default: TEXT_LAYER_BACKEND).
+    auto falls back through BACKENDS to the first one that imports.
+    """
+    name = (name or os.getenv('TEXT_LAYER_BACKEND', 'auto')).strip().lower()
+    candidates = BACKENDS if name == 'auto' else (name,)
+    if not set(candidates) <= set(_CLASSES):
+        raise ValueError(f'Unknown text-layer backend: {name}')
+
+    with _instances_lock:
+        for candidate in candidates:
+            if candidate not in _instances:
+                try:
+                    _instances[candidate] = _CLASSES[candidate]()
+                except ImportError:
+                    _instances[candidate] = None
+            if _instances[candidate] is not None:
+                return _instances[candidate]
+    raise ImportError(f'Text-layer backend not available: {name}')
@@ -0,0 +1,194 @@
+"""
+Tile-based localized forgery analysis
+Splits the page into tiles and flags the ones whose noise level, JPEG-grid
+strength or error-level residual differ from the rest of the page, which is
+what a pasted-in name or a swapped seal looks like.
+Every statistic is a per-tile sum over a reshaped view of a full-page map,
+so the whole page costs O(pixels) regardless of the tile count.
+"""
+import io
+
+from PIL import Image
+import numpy as np
+
+from services.multipage import map_pages, page_offset
+
+
+def _box_mean(a, radius):
+    """Mean over a (2r+1)x(2r+1) window as separable sums of shifted views"""
+    size = 2 * radius + 1
+    padded = np.pad(a, radius, mode='edge')
+    rows = padded[:-2 * radius or None].copy()
+    for offset in range(1, size):
+        rows += padded[offset:offset + a.shape[0]]
+    window = rows[:, :a.shape[1]].copy()
+    for offset in range(1, size):
+        window += rows[:, offset:offset + a.shape[1]]
+    return window / (size * size)
+
+
+def _tile_means(a, tile):
+    """Per-tile means via reshape views: sum tile rows, then tile columns"""
+    rows, cols = a.shape[0] // tile, a.shape[1] // tile
+    band_sums = a[:rows * tile, :cols * tile].reshape(rows, tile, cols * tile).sum(axis=1)
+    return band_sums.reshape(rows, cols, tile).sum(axis=2) / (tile * tile)
+
+
+def _luma(pixels):
+    """uint8 gray of an (H, W) or (H, W, 3) uint8 array, rounded as PIL's convert('L')"""
+    if pixels.ndim == 2:
+        return pixels
+    rgb = pixels.astype(np.uint32)
+    return ((rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + 0x8000) >> 16).astype(np.uint8)
+
+
+def _robust_z(values, mask):
+    """Distance from the page median in MAD units, over tiles with content"""
+    z = np.zeros_like(values)
+    if mask.sum() < 4:
+        return z
+    sample = values[mask]
+    median = np.median(sample)
+    mad = np.median(np.abs(sample - median)) * 1.4826
+    scale = max(mad, 1e-3 * max(abs(median), 1.0))
+    z[mask] = np.abs(values[mask] - median) / scale
+    return z
+
+
+class TileAnalyzer:
+    def __init__(self, tile_size=64, top_k=5, ela_quality=90, z_threshold=6.0,
+                 min_edge_density=8.0, flat_gradient=24.0):
+        self.tile_size = tile_size
+        self.flat_gradient = flat_gradient
+        self.top_k = top_k
+        self.ela_quality = ela_quality
+        self.z_threshold = z_threshold
+        self.min_edge_density = min_edge_density
+
+    def analyze_pages(self, pages, checkpoint=None):
+        """
+        Run the localized analysis on every page and report the most
+        suspicious one
+        pages: list of (page_number, image)
+        checkpoint: optional per-page checkpoint (see multipage.map_pages)
+        """
+        try:
+            if not pages:
+                return {'success': False, 'error': 'No pages to analyze'}
+
+            return self._most_suspicious(map_pages(self.analyze, pages, checkpoint=checkpoint))
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def analyze_shared_pages(self, shared, checkpoint=None):
+        """
+        analyze_pages over SharedPage descriptors (services/page_buffers.py):
+        each page is read from its mapped shared memory block in place,
+        without a PIL copy
+        """
+        def analyze(page):
+            with page.array() as pixels:
+                return self.analyze_pixels(pixels, page.info.get('page_offset', (0, 0)))
+
+        try:
+            if not shared:
+                return {'success': False, 'error': 'No pages to analyze'}
+
+            pages = [(page.number, page if page.name else None) for page in shared]
+            return self._most_suspicious(map_pages(analyze, pages, checkpoint=checkpoint))
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def _most_suspicious(self, page_results):
+        number, result = max(page_results, key=lambda item: item[1].get('max_score', 0))
+        return dict(result, page=number)
+
+    def analyze(self, image):
+        """
+        Localized analysis of one page
+        Returns: dict with a compact heatmap (0-100 per tile, the grid starting
+        at origin on the page) and the top suspicious regions in page pixel
+        coordinates
+        """
+        return self.analyze_pixels(np.asarray(image.convert('L')), page_offset(image))
+
+    def analyze_pixels(self, pixels, origin=(0, 0)):
+        """
+        analyze() on a uint8 (H, W) or (H, W, 3) page array whose top-left
+        corner is at origin on the page; nothing refers to the array after
+        it returns
+        """
+        tile = self.tile_size
+        luma = _luma(pixels)
+        gray = luma.astype(np.float32)
+        if gray.shape[0] < tile * 2 or gray.shape[1] < tile * 2:
+            return {'success': False, 'error': 'Page too small for tiling'}
+
+        # Edge density: mean absolute gradient
+        dx = np.abs(np.diff(gray, axis=1, append=gray[:, -1:]))
+        dy = np.abs(np.diff(gray, axis=0, append=gray[-1:, :]))
+        gradient = dx + dy
+        edges = _tile_means(gradient, tile)
+
+        # Noise level: residual (pixel minus 3x3 mean) measured on flat pixels
+        # only, so text strokes do not count as noise
+        residual = gray - _box_mean(gray, 1)
+        flat = (_box_mean(gradient, 1) < self.flat_gradient).astype(np.float32)
+        flat_share = _tile_means(flat, tile)
+        noise = np.sqrt(_tile_means(residual * residual * flat, tile) / np.maximum(flat_share, 1e-6))
+
+        # JPEG grid: gradient energy on 8-pixel block boundaries vs inside blocks
+        on_grid = (np.arange(gray.shape[1]) % 8 == 7).astype(np.float32)
+        grid_energy = _tile_means(dx * on_grid, tile) * 8
+        inner_energy = _tile_means(dx * (1 - on_grid), tile) * 8 / 7
+        jpeg_grid = grid_energy / (inner_energy + 1.0)
+
+        # Error level: residual after one more JPEG round-trip, relative to
+        # the amount of detail in the tile
+        ela = _tile_means(self._error_level(luma, gray), tile) / (edges + 1.0)
+
+        # Blank tiles carry no evidence for the content features
+        has_flat = flat_share >= 0.25
+        has_content = edges >= self.min_edge_density
+        features = {
+            'noise': _robust_z(noise, has_flat),
+            'jpeg_grid': _robust_z(jpeg_grid, has_content),
+            'error_level': _robust_z(ela, has_content)
+        }
+        combined = np.maximum.reduce(list(features.values()))
+        heatmap = np.clip(combined / (2 * self.z_threshold) * 100, 0, 100).round().astype(int)
+
+        return {
+            'success': True,
+            'tile_size': tile,
+            'grid': [int(heatmap.shape[0]), int(heatmap.shape[1])],
+            'heatmap': heatmap.tolist(),
+            'max_score': int(heatmap.max()),
+            'origin': list(origin),
+            'suspicious_regions': self._top_regions(combined, features, origin)
+        }
+
+    def _error_level(self, luma, gray):
+        buffer = io.BytesIO()
+        Image.fromarray(luma).save(buffer, format='JPEG', quality=self.ela_quality)
+        buffer.seek(0)
+        resaved = np.asarray(Image.open(buffer), dtype=np.float32)
+        return np.abs(gray - resaved)
+
+    def _top_regions(self, combined, features, origin=(0, 0)):
+        """Tiles above the z threshold, strongest first, in page coordinates"""
+        tile = self.tile_size
+        order = np.argsort(combined, axis=None)[::-1][:self.top_k]
+        regions = []
+        for flat_index in order:
+            row, col = np.unravel_index(flat_index, combined.shape)
+            score = float(combined[row, col])
+            if score < self.z_threshold:
+                break
+            reasons = [name for name, z in features.items() if z[row, col] >= self.z_threshold]
+            regions.append({
+                'bbox': [int(origin[0] + col * tile), int(origin[1] + row * tile), tile, tile],
+                'score': round(score, 2),
+                'reasons': reasons
+            })
+        return regions
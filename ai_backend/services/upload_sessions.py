@@ -0,0 +1,266 @@
+"""
+Resumable chunked uploads
+Documents over MAX_CONTENT_LENGTH (scanned transcript bundles) are sent in
+chunks: the client opens a session with the total size, then sends
+consecutive byte ranges, each at most MAX_CONTENT_LENGTH. After a dropped
+connection it asks for the session's offset and continues from there.
+
+    POST  /api/uploads                  {"filename", "size", "sha256"?} -> upload_id
+    PATCH /api/uploads/<id>             Upload-Offset: <n>, body = the next bytes
+    GET   /api/uploads/<id>             offset received so far
+    POST  /api/uploads/<id>/analyze     analyze the complete file
+
+State lives on disk in UPLOAD_SESSION_DIR (<id>.json metadata, <id>.part
+data, whose size is the offset), so any server worker can take the next
+chunk and a restart loses nothing that was written. Sessions untouched for
+UPLOAD_SESSION_HOURS are swept, and sessions that received no bytes within
+UPLOAD_EMPTY_SESSION_MINUTES. Each client may hold UPLOAD_SESSIONS_PER_CLIENT
+open sessions (429 beyond). All sessions together may hold at most
+UPLOAD_MAX_RESERVED received bytes: a chunk that would pass it gets 507, so
+uploads cannot fill the disk and declared sizes alone reserve nothing.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """A session request that cannot be served (status: HTTP status code)"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        # Current offset, for the client to resume from on a conflict
+        self.offset = offset
+
+
+class UploadSessions:
+    def __init__(self, directory, max_size=1024 ** 3, max_age_hours=24.0, max_empty_minutes=10.0,
+                 max_per_client=4, max_reserved=8 * 1024 ** 3):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age_hours = max_age_hours
+        # Opened but never written to: swept much sooner
+        self.max_empty_minutes = max_empty_minutes
+        self.max_per_client = max_per_client
+        # Bytes received by all open sessions, the disk they use
+        self.max_reserved = max_reserved
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv('UPLOAD_SESSION_DIR', 'uploads/sessions'),
+            max_size=int(os.getenv('UPLOAD_MAX_SIZE', 1024 ** 3)),
+            max_age_hours=float(os.getenv('UPLOAD_SESSION_HOURS', 24)),
+            max_empty_minutes=float(os.getenv('UPLOAD_EMPTY_SESSION_MINUTES', 10)),
+            max_per_client=int(os.getenv('UPLOAD_SESSIONS_PER_CLIENT', 4)),
+            max_reserved=int(os.getenv('UPLOAD_MAX_RESERVED', 8 * 1024 ** 3))
+        )
+
+    def _path(self, upload_id, suffix):
+        if not UPLOAD_ID.match(upload_id or ''):
+            raise UploadError('Unknown upload', 404)
+        return os.path.join(self.directory, f'{upload_id}.{suffix}')
+
+    def _write_meta(self, upload_id, meta):
+        temporary = self._path(upload_id, 'json.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temporary, self._path(upload_id, 'json'))
+
+    def create(self, filename, size, sha256=None, client=None):
+        """
+        Open a session for a file of size bytes; client identifies the
+        caller for the per-client cap. Returns: the session's status
+        """
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('Size must be a positive number of bytes')
+        if size > self.max_size:
+            raise UploadError('File too large', 413)
+        if sha256 is not None and not re.fullmatch(r'(0x)?[0-9a-fA-F]{64}', str(sha256)):
+            raise UploadError('sha256 must be a hex SHA-256 digest')
+
+        self.sweep()
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            # One create at a time across server workers, so the caps hold
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            sessions = self._open_sessions()
+            if client is not None and sum(meta.get('client') == client for meta in sessions) >= self.max_per_client:
+                raise UploadError(f'At most {self.max_per_client} open uploads per client', 429)
+            if self._received() >= self.max_reserved:
+                raise UploadError('Upload storage is full, try again later', 507)
+
+            upload_id = secrets.token_hex(16)
+            open(self._path(upload_id, 'part'), 'wb').close()
+            self._write_meta(upload_id, {
+                'filename': filename,
+                'size': size,
+                'sha256': ('0x' + str(sha256).lower().removeprefix('0x')) if sha256 else None,
+                'document_hash': None,
+                'client': client,
+                'created': time.time()
+            })
+        return self.status(upload_id)
+
+    def _open_sessions(self):
+        """Metadata of every session in the directory"""
+        sessions = []
+        for name in os.listdir(self.directory):
+            upload_id, _, suffix = name.partition('.')
+            if suffix == 'json' and UPLOAD_ID.match(upload_id):
+                try:
+                    sessions.append(self.meta(upload_id))
+                except UploadError:
+                    continue
+        return sessions
+
+    def _received(self):
+        """Bytes received by all sessions, the size of their .part files"""
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith('.part'):
+                try:
+                    total += os.path.getsize(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+        return total
+
+    def meta(self, upload_id):
+        try:
+            with open(self._path(upload_id, 'json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Unknown upload', 404)
+
+    def status(self, upload_id):
+        meta = self.meta(upload_id)
+        offset = os.path.getsize(self._path(upload_id, 'part'))
+        return {
+            'upload_id': upload_id,
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': offset,
+            'complete': offset == meta['size'],
+            'document_hash': meta['document_hash']
+        }
+
+    def append(self, upload_id, offset, chunks):
+        """
+        Write an iterable of byte chunks at offset, which must be the bytes
+        received so far; only one writer per session at a time. Refused
+        with 507 once all sessions together would pass max_reserved.
+        Returns: the new offset
+        """
+        meta = self.meta(upload_id)
+        with open(self._path(upload_id, 'part'), 'r+b') as part:
+            try:
+                fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('This upload is being written or analyzed', 409)
+            current = os.fstat(part.fileno()).st_size
+            if offset != current:
+                raise UploadError(f'Expected offset {current}', 409, offset=current)
+
+            # Concurrent writers to other sessions can pass the cap by at most
+            # one request body each
+            available = self.max_reserved - self._received()
+            start = current
+            part.seek(current)
+            for chunk in chunks:
+                if current + len(chunk) > meta['size']:
+                    # Keep what fits the declared size; the rest is refused
+                    part.truncate(current)
+                    raise UploadError('Chunk runs past the declared size', 413, offset=current)
+                if current + len(chunk) - start > available:
+                    part.truncate(start)
+                    raise UploadError('Upload storage is full, try again later', 507, offset=start)
+                part.write(chunk)
+                current += len(chunk)
+            part.flush()
+        return current
+
+    def complete(self, upload_id):
+        """
+        Path and SHA-256 of a fully received file (checked against the
+        client's sha256 when it gave one)
+        Returns: (filepath, document_hash)
+        """
+        status = self.status(upload_id)
+        if not status['complete']:
+            raise UploadError(f"Upload incomplete: {status['offset']} of {status['size']} bytes",
+                              409, offset=status['offset'])
+        path = self._path(upload_id, 'part')
+        meta = self.meta(upload_id)
+        if meta['document_hash'] is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            document_hash = '0x' + digest.hexdigest()
+            if meta['sha256'] and meta['sha256'] != document_hash:
+                # Start over: some chunk was corrupted on the way
+                self.discard(upload_id)
+                raise UploadError('Uploaded bytes do not match sha256', 422)
+            meta['document_hash'] = document_hash
+            self._write_meta(upload_id, meta)
+        return path, meta['document_hash']
+
+    @contextmanager
+    def analyzing(self, upload_id):
+        """
+        Hold a session for its analysis: a second analyze of the same
+        upload, in any server worker, gets 409 instead of running the whole
+        analysis again, and one that waited past the first gets 404 once it
+        is discarded. Chunk writes take the same lock.
+        """
+        try:
+            part = open(self._path(upload_id, 'part'), 'rb')
+        except FileNotFoundError:
+            raise UploadError('Unknown upload', 404)
+        with part:
+            try:
+                fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('This upload is being written or analyzed', 409)
+            if os.fstat(part.fileno()).st_nlink == 0:
+                # Discarded between the open and the lock
+                raise UploadError('Unknown upload', 404)
+            yield
+
+    def discard(self, upload_id):
+        for suffix in ('part', 'json'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        """
+        Remove sessions untouched for max_age_hours, or still empty after
+        max_empty_minutes; returns how many
+        """
+        cutoff = time.time() - self.max_age_hours * 3600
+        empty_cutoff = time.time() - self.max_empty_minutes * 60
+        removed = 0
+        for name in os.listdir(self.directory):
+            upload_id, _, suffix = name.partition('.')
+            if suffix != 'json' or not UPLOAD_ID.match(upload_id):
+                continue
+            try:
+                touched = max(os.path.getmtime(os.path.join(self.directory, name)),
+                              os.path.getmtime(self._path(upload_id, 'part')))
+                empty = os.path.getsize(self._path(upload_id, 'part')) == 0
+            except FileNotFoundError:
+                touched, empty = 0, True
+            if touched < cutoff or (empty and touched < empty_cutoff):
+                self.discard(upload_id)
+                removed += 1
+        return removed
@@ -0,0 +1,54 @@
+"""
+Streaming upload hashing
+Computes the SHA-256 of uploaded files while the request body is parsed
+"""
+import hashlib
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+
+class HashingFile:
+    """
+    File-like wrapper that updates a SHA-256 digest on every write.
+    Werkzeug writes each multipart chunk as it arrives, so the digest is
+    complete as soon as the body ends, without re-reading the file.
+    """
+    # Uploads above this size spill from memory to a temporary file
+    SPOOL_SIZE = 1024 * 500
+
+    def __init__(self):
+        self._file = SpooledTemporaryFile(max_size=self.SPOOL_SIZE, mode='rb+')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        """0x-prefixed digest, matching the on-chain registry format"""
+        return '0x' + self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        # Delegate read/seek/close etc. to the spooled file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class HashingRequest(Request):
+    """Request class whose file uploads are hashed while they stream in"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile()
+
+
+def upload_digest(file_storage):
+    """Return the streamed digest of an uploaded file, or None if unavailable"""
+    stream = getattr(file_storage, 'stream', None)
+    if isinstance(stream, HashingFile):
+        return stream.hexdigest()
+    return None
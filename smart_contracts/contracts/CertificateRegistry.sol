@@ -12,10 +12,12 @@ contract CertificateRegistry {
 
     mapping(bytes32 => Certificate) public certificates;
     mapping(address => bool) public authorizedIssuers;
+    mapping(bytes32 => bool) public merkleRoots;
     address public owner;
 
     event CertificateIssued(bytes32 indexed hash, string studentId, address indexed issuer);
     event CertificateRevoked(bytes32 indexed hash, address indexed issuer);
+    event MerkleRootAnchored(bytes32 indexed root, address indexed issuer);
 
     modifier onlyOwner() {
         require(msg.sender == owner, "Not owner");
@@ -54,6 +56,14 @@ contract CertificateRegistry {
         emit CertificateIssued(_hash, _studentId, msg.sender);
     }
 
+    // Anchor a batch of certificates at once. Leaves are sha256(sha256(pdf)),
+    // inner nodes are sha256 of the sorted pair; proofs are checked off-chain.
+    function anchorMerkleRoot(bytes32 _root) external onlyIssuer {
+        require(!merkleRoots[_root], "Root already anchored");
+        merkleRoots[_root] = true;
+        emit MerkleRootAnchored(_root, msg.sender);
+    }
+
     function verifyCertificate(bytes32 _hash) external view returns (bool, string memory, string memory, uint256, address) {
         Certificate memory cert = certificates[_hash];
         return (cert.isValid, cert.studentId, cert.data, cert.timestamp, cert.issuer);